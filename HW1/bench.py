@@ -0,0 +1,263 @@
+"""Бенчмарк эмулятора на синтетических образах.
+
+Генерирует образы (широкий плоский каталог, глубокое дерево, большие файлы) в
+несжатом и gzip-вариантах и для каждого измеряет холодный и тёплый старт
+(без файла-индекса и с ним), пиковую память и перцентили задержки команд.
+Каждое измерение выполняется в отдельном процессе, чтобы пиковый RSS не
+смешивался между образами. Результат пишется в JSON для сравнения коммитов.
+
+    python3 bench.py --output bench.json
+    python3 bench.py --quick --output bench.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+from main import Emulator, VirtualFS
+
+LINE = b"2024-10-06 16:51:12 INFO request handled in 12 ms by worker 7\n"
+
+
+class RepeatReader(io.RawIOBase):
+    """Файловый объект заданного размера из повторяющейся строки, без буфера в памяти."""
+
+    def __init__(self, size, pattern=LINE):
+        self.remaining = size
+        self.block = pattern * max(1, (1 << 20) // len(pattern))
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.remaining, len(self.block))
+        buffer[:length] = self.block[:length]
+        self.remaining -= length
+        return length
+
+
+def add_file(tar, name, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = 1728233512
+    tar.addfile(info, io.BufferedReader(RepeatReader(size)))
+
+
+def add_dir(tar, name):
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.DIRTYPE
+    info.mode = 0o755
+    info.mtime = 1728233512
+    tar.addfile(info)
+
+
+def build_wide(tar, params):
+    add_dir(tar, "wide")
+    for i in range(params["wide_entries"]):
+        add_file(tar, f"wide/file{i:06d}.txt", len(LINE) * (1 + i % 8))
+
+
+def build_deep(tar, params):
+    path = "deep"
+    add_dir(tar, path)
+    for level in range(params["deep_levels"]):
+        path += f"/level{level}"
+        add_dir(tar, path)
+        add_file(tar, f"{path}/note.txt", len(LINE) * 4)
+
+
+def build_big(tar, params):
+    add_dir(tar, "big")
+    for i in range(params["big_files"]):
+        add_file(tar, f"big/file{i}.log", params["big_size"])
+
+
+# Образы: имя -> (построитель, команды для замера задержки)
+IMAGES = {
+    "wide": (build_wide, ["cd wide", "cd ~", "ls wide", "ls -l wide", "head wide/file000500.txt",
+                          "wc wide/file{last_wide:06d}.txt", "find wide -name file0000*"]),
+    "deep": (build_deep, ["cd {deepest}", "cd ~", "ls {deepest}", "ls -R deep/level0/level1",
+                          "head {deepest}/note.txt", "wc {deepest}/note.txt"]),
+    "big": (build_big, ["head big/file0.log", "head -n 1000 big/file{last_big}.log",
+                        "wc -l big/file{last_big}.log", "wc big/file0.log"]),
+}
+
+
+def image_path(workdir, name, compression, params):
+    suffix = ".tar.gz" if compression == "gz" else ".tar"
+    key = "-".join(str(params[k]) for k in sorted(params))
+    return os.path.join(workdir, f"{name}-{key}{suffix}")
+
+
+def generate(workdir, name, compression, params):
+    path = image_path(workdir, name, compression, params)
+    if not os.path.exists(path):
+        tmp_path = path + ".part"
+        options = {"compresslevel": 1} if compression == "gz" else {}
+        with tarfile.open(tmp_path, "w:gz" if compression == "gz" else "w", **options) as tar:
+            IMAGES[name][0](tar, params)
+        os.replace(tmp_path, path)
+    return path
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+
+    def pick(q):
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {
+        "count": len(samples),
+        "p50_ms": pick(0.5) * 1000,
+        "p90_ms": pick(0.9) * 1000,
+        "p99_ms": pick(0.99) * 1000,
+        "max_ms": samples[-1] * 1000,
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss: килобайты в Linux, байты в macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+
+def measure(path, name, mode, params, iterations):
+    """Одно измерение в текущем процессе: старт, задержки команд, выполнение скрипта."""
+    index_path = path + ".idx"
+    if mode == "cold" and os.path.exists(index_path):
+        os.remove(index_path)
+    elif mode == "warm" and not os.path.exists(index_path):
+        vfs = VirtualFS(path)
+        vfs.load()
+        vfs.close()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        script_path = os.path.join(tmp_dir, "script.txt")
+        emulator = Emulator(path, os.path.join(tmp_dir, "log.csv"), script_path, log_mode="buffered")
+        start = time.perf_counter()
+        emulator.load_tar()
+        startup = time.perf_counter() - start
+
+        deepest = "/" + "/".join(["deep"] + [f"level{i}" for i in range(params["deep_levels"])])
+        # В отчёте команды подписываются шаблоном, а не развёрнутым 200-уровневым путём
+        commands = {template: template.format(deepest=deepest, last_big=params["big_files"] - 1,
+                                              last_wide=params["wide_entries"] - 1)
+                    for template in IMAGES[name][1]}
+        latencies = {}
+        for template, command in commands.items():
+            # Команды по многогигабайтным файлам повторяем реже
+            runs = 3 if name == "big" else iterations
+            samples = []
+            for _ in range(runs):
+                t = time.perf_counter()
+                emulator.run(command)
+                samples.append(time.perf_counter() - t)
+            latencies[template] = percentiles(samples)
+            emulator.run("cd ~")
+
+        # Скрипт из тех же команд; полный wc больших файлов в него не входит
+        script = [command for command in commands.values() if not (name == "big" and command.startswith("wc"))]
+        with open(script_path, "w") as f:
+            for i in range(params["script_commands"]):
+                f.write(script[i % len(script)] + "\n")
+        with open(os.devnull, "w") as devnull:
+            t = time.perf_counter()
+            emulator.execute_script(out=devnull)
+            script_time = time.perf_counter() - t
+        emulator.logger.close()
+        emulator.vfs.close()
+
+    return {
+        "startup_s": startup,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency": latencies,
+        "script": {"commands": params["script_commands"], "seconds": script_time},
+    }
+
+
+def run_worker(args):
+    params = json.loads(args.params)
+    result = measure(args.worker, args.image, args.mode, params, args.iterations)
+    json.dump(result, sys.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench.json", help="куда записать результаты в JSON")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "emulator-bench"),
+                        help="каталог для сгенерированных образов (переиспользуются между запусками)")
+    parser.add_argument("--images", default=",".join(IMAGES), help="какие образы замерять")
+    parser.add_argument("--compression", default="none,gz", help="варианты сжатия: none, gz")
+    parser.add_argument("--wide-entries", type=int, default=100000)
+    parser.add_argument("--deep-levels", type=int, default=200)
+    parser.add_argument("--big-files", type=int, default=2)
+    parser.add_argument("--big-size", type=int, default=2 << 30, help="размер каждого большого файла в байтах")
+    parser.add_argument("--script-commands", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=50, help="повторов каждой команды")
+    parser.add_argument("--quick", action="store_true", help="маленькие образы для быстрой проверки")
+    # Служебные параметры дочернего процесса
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--params", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    if args.quick:
+        args.wide_entries, args.big_size, args.script_commands, args.iterations = 5000, 16 << 20, 1000, 10
+    params = {
+        "wide_entries": args.wide_entries,
+        "deep_levels": args.deep_levels,
+        "big_files": args.big_files,
+        "big_size": args.big_size,
+        "script_commands": args.script_commands,
+    }
+    os.makedirs(args.workdir, exist_ok=True)
+
+    results = []
+    for name in args.images.split(","):
+        for compression in args.compression.split(","):
+            started = time.perf_counter()
+            path = generate(args.workdir, name, compression, params)
+            print(f"{name}/{compression}: image ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+            for mode in ("cold", "warm"):
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", path, "--image", name,
+                     "--mode", mode, "--params", json.dumps(params), "--iterations", str(args.iterations)],
+                    capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+                result = json.loads(output.stdout)
+                result.update({"image": name, "compression": compression, "mode": mode,
+                               "image_bytes": os.path.getsize(path)})
+                results.append(result)
+                print(f"  {mode}: startup {result['startup_s']:.3f}s, peak RSS {result['peak_rss_mb']:.1f} MB",
+                      file=sys.stderr)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
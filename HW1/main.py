@@ -1,131 +1,1028 @@
+import argparse
+import asyncio
+import atexit
+import bisect
+import fnmatch
+import functools
+import io
+import itertools
+import json
+import mmap
 import os
+import re
+import socket
+import stat
+import struct
 import tarfile
 import sys
 import csv
+import threading
+import time
+import zlib
 from datetime import datetime
 
+
+class VNode:
+    """Узел виртуальной ФС: файл или каталог внутри tar-архива."""
+    __slots__ = ("name", "parent", "children", "type", "size", "mode", "mtime", "offset", "sorted_children", "total")
+
+    def __init__(self, name, parent=None, type=tarfile.DIRTYPE, size=0, mode=0o755, mtime=0, offset=0):
+        self.name = name
+        self.parent = parent
+        self.type = type
+        self.size = size
+        self.mode = mode
+        self.mtime = mtime
+        self.offset = offset  # Смещение данных члена архива от начала tar-потока
+        self.children = {} if type == tarfile.DIRTYPE else None
+        self.sorted_children = None  # Отсортированный список потомков, строится при первом обращении
+        self.total = None  # Суммарный размер поддерева, см. VirtualFS.compute_totals
+
+    def is_dir(self):
+        return self.children is not None
+
+    def listing(self):
+        if self.sorted_children is None:
+            self.sorted_children = sorted(self.children.values(), key=lambda node: node.name)
+        return self.sorted_children
+
+    def filemode(self):
+        # Строка прав в стиле ls -l
+        if self.is_dir():
+            kind = stat.S_IFDIR
+        elif self.type == tarfile.SYMTYPE:
+            kind = stat.S_IFLNK
+        else:
+            kind = stat.S_IFREG
+        return format_mode(kind | (self.mode & 0o7777))
+
+    def path(self):
+        # Полный путь узла внутри виртуальной ФС
+        parts = []
+        node = self
+        while node.parent is not None:
+            parts.append(node.name)
+            node = node.parent
+        return "/" + "/".join(reversed(parts))
+
+
+# В больших образах режимы и времена изменения сильно повторяются, поэтому строки кешируются
+@functools.lru_cache(maxsize=1024)
+def format_mode(mode):
+    return stat.filemode(mode)
+
+
+@functools.lru_cache(maxsize=65536)
+def format_mtime(mtime):
+    return datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M")
+
+
+# Формат файла-индекса: заголовок, таблица записей фиксированной длины, блок имён
+INDEX_MAGIC = b"VFSIDX01"
+INDEX_HEADER = struct.Struct("<8sQqII")  # magic, размер архива, mtime_ns, crc заголовка, число записей
+INDEX_RECORD = struct.Struct("<icIQqQII")  # родитель, тип, mode, размер, mtime, смещение, начало и длина имени
+
+CHUNK_SIZE = 1 << 20  # Размер порции при потоковом чтении файлов
+# Таблица для подсчёта слов: пробельные байты -> b" ", остальные -> b"x"
+WORD_TABLE = bytes(0x20 if c in b" \t\n\r\x0b\x0c" else 0x78 for c in range(256))
+
+GZIP_MAGIC = b"\x1f\x8b"
+CHECKPOINT_SPACING = 16 << 20  # Шаг контрольных точек распаковки gzip (по распакованным данным)
+GZIP_INPUT_CHUNK = 64 << 10
+GZIP_OUTPUT_CHUNK = 1 << 20
+
+
+class IndexCacheError(Exception):
+    """Файл-индекс отсутствует, устарел или повреждён."""
+
+
+class SeekableGzip(io.RawIOBase):
+    """Распакованное представление gzip-файла с быстрым произвольным доступом.
+
+    При последовательном чтении через каждые spacing распакованных байт сохраняется
+    копия состояния zlib. Переход к любому смещению восстанавливает ближайшую
+    предшествующую контрольную точку, а не распаковывает поток с начала.
+    """
+
+    def __init__(self, path, spacing=None):
+        self.name = path
+        self.file = open(path, "rb")
+        self.spacing = spacing or CHECKPOINT_SPACING
+        # Контрольная точка: (распакованное смещение, сжатое смещение, копия распаковщика)
+        self.checkpoints = [(0, 0, None)]
+        self.checkpoint_offsets = [0]
+        self.position = 0
+        self.decompressed = 0  # Сколько байт распаковано всего, для диагностики
+        self.restore(self.checkpoints[0])
+
+    def restore(self, checkpoint):
+        out_pos, in_pos, decompressor = checkpoint
+        self.decompressor = decompressor.copy() if decompressor is not None else zlib.decompressobj(31)
+        self.member_start = decompressor is None
+        self.in_pos = in_pos
+        self.out_pos = out_pos
+        self.tail = b""
+        self.buffer = b""  # Последний распакованный блок: байты [out_pos - len(buffer), out_pos)
+        self.eof = False
+
+    def step(self):
+        # Один шаг распаковки; непоглощённый остаток входа (tail) в точке не хранится — он перечитывается из файла
+        data = self.tail
+        if not data:
+            self.file.seek(self.in_pos)
+            data = self.file.read(GZIP_INPUT_CHUNK)
+            if not data:
+                self.eof = True
+                return b""
+            self.in_pos += len(data)
+        if self.member_start:
+            # Между членами многочленного gzip может быть выравнивание нулями
+            data = data.lstrip(b"\0")
+            if not data:
+                self.tail = b""
+                return b""
+            self.member_start = False
+        out = self.decompressor.decompress(data, min(GZIP_OUTPUT_CHUNK, self.spacing))
+        self.tail = self.decompressor.unconsumed_tail
+        if self.decompressor.eof:
+            self.tail = self.decompressor.unused_data
+            self.decompressor = zlib.decompressobj(31)
+            self.member_start = True
+        self.out_pos += len(out)
+        self.decompressed += len(out)
+        if not self.member_start and self.out_pos >= self.checkpoint_offsets[-1] + self.spacing:
+            self.checkpoints.append((self.out_pos, self.in_pos - len(self.tail), self.decompressor.copy()))
+            self.checkpoint_offsets.append(self.out_pos)
+        return out
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            raise io.UnsupportedOperation("seek from end of a gzip stream")
+        self.position = offset
+        return offset
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = sys.maxsize
+        index = bisect.bisect_right(self.checkpoint_offsets, self.position) - 1
+        if self.position < self.out_pos - len(self.buffer) or self.checkpoint_offsets[index] > self.out_pos:
+            self.restore(self.checkpoints[index])
+        pieces = []
+        while size > 0:
+            offset = self.position - (self.out_pos - len(self.buffer))
+            if offset < len(self.buffer):
+                piece = self.buffer[offset:offset + size]
+                pieces.append(piece)
+                self.position += len(piece)
+                size -= len(piece)
+            elif self.eof:
+                break
+            else:
+                self.buffer = self.step()
+        return b"".join(pieces)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self.file.close()
+        super().close()
+
+
+class VirtualFS:
+    """Read-only виртуальная ФС, построенная по заголовкам tar-архива."""
+
+    def __init__(self, tar_path, index_path=None):
+        self.tar_path = tar_path
+        self.index_path = index_path or tar_path + ".idx"
+        self.root = VNode("")
+        self.tar = None
+        self.mmap = None
+        self.read_lock = threading.Lock()  # Сжатый поток общий для всех сеансов сервера
+
+    def open_archive(self):
+        with open(self.tar_path, "rb") as f:
+            magic = f.read(2)
+        if magic == GZIP_MAGIC:
+            # gzip читаем через свой слой с контрольными точками: заголовки tar при сканировании
+            # проходятся тем же потоком, и точки для последующего произвольного доступа строятся попутно
+            self.tar = tarfile.open(fileobj=SeekableGzip(self.tar_path), mode="r:")
+        else:
+            self.tar = tarfile.open(self.tar_path, "r")
+        # Несжатый архив отображаем в память: данные членов читаются срезами без seek/read
+        if isinstance(self.tar.fileobj, io.BufferedReader) and os.fstat(self.tar.fileobj.fileno()).st_size:
+            self.mmap = mmap.mmap(self.tar.fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def load(self, use_index=True):
+        # Индекс с диска читается одним вызовом; при его отсутствии или порче — перестраивается
+        self.open_archive()
+        if use_index:
+            try:
+                self.load_index()
+                return
+            except (OSError, IndexCacheError):
+                self.root = VNode("")
+        self.scan()
+        if use_index:
+            try:
+                self.save_index()
+            except OSError:
+                pass  # Каталог архива может быть недоступен для записи
+
+    def scan(self):
+        # Читаем только заголовки членов архива, данные остаются в tar-файле
+        member = self.tar.next()
+        while member is not None:
+            self.add(member.name, member.type, member.size, member.mode, int(member.mtime), member.offset_data)
+            # TarInfo больше не нужен: всё необходимое уже лежит в узле
+            self.tar.members.clear()
+            member = self.tar.next()
+
+    def archive_key(self):
+        # Ключ индекса: размер и время изменения архива плюс контрольная сумма первого заголовка
+        stat = os.stat(self.tar_path)
+        with open(self.tar_path, "rb") as f:
+            checksum = zlib.crc32(f.read(tarfile.BLOCKSIZE))
+        return stat.st_size, stat.st_mtime_ns, checksum
+
+    def iter_nodes(self):
+        # Обход дерева в прямом порядке: родитель всегда раньше потомков
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            yield node
+            if node.is_dir():
+                stack.extend(reversed(list(node.children.values())))
+
+    def save_index(self):
+        records = []
+        names = bytearray()
+        numbers = {}
+        for node in self.iter_nodes():
+            if node is self.root:
+                numbers[id(node)] = -1
+                continue
+            numbers[id(node)] = len(records)
+            name = node.name.encode("utf-8", "surrogateescape")
+            records.append(INDEX_RECORD.pack(numbers[id(node.parent)], node.type, node.mode, node.size,
+                                             node.mtime, node.offset, len(names), len(name)))
+            names += name
+        size, mtime_ns, checksum = self.archive_key()
+        body = INDEX_HEADER.pack(INDEX_MAGIC, size, mtime_ns, checksum, len(records)) + b"".join(records) + names
+        # Пишем во временный файл и атомарно подменяем, чтобы параллельные запуски не видели половину индекса
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(body)
+            f.write(struct.pack("<I", zlib.crc32(body)))
+        os.replace(tmp_path, self.index_path)
+
+    def load_index(self):
+        with open(self.index_path, "rb") as f:
+            data = f.read()
+        if len(data) < INDEX_HEADER.size + 4 or struct.unpack_from("<I", data, len(data) - 4)[0] != zlib.crc32(data[:-4]):
+            raise IndexCacheError("повреждённый индекс")
+        magic, size, mtime_ns, checksum, count = INDEX_HEADER.unpack_from(data)
+        if magic != INDEX_MAGIC or (size, mtime_ns, checksum) != self.archive_key():
+            raise IndexCacheError("устаревший индекс")
+        names_start = INDEX_HEADER.size + count * INDEX_RECORD.size
+        records = memoryview(data)[INDEX_HEADER.size:names_start]
+        nodes = []
+        for parent, type, mode, size, mtime, offset, start, length in INDEX_RECORD.iter_unpack(records):
+            name = data[names_start + start:names_start + start + length].decode("utf-8", "surrogateescape")
+            parent_node = nodes[parent] if parent >= 0 else self.root
+            node = VNode(name, parent_node, type, size, mode, mtime, offset)
+            parent_node.children[name] = node
+            nodes.append(node)
+
+    def index_fields(self):
+        return [(n.path(), n.type, n.mode, n.size, n.mtime, n.offset) for n in self.iter_nodes()]
+
+    def verify_index(self):
+        """Сверяет индекс на диске с заголовками архива."""
+        cached = VirtualFS(self.tar_path, self.index_path)
+        try:
+            cached.load_index()
+        finally:
+            cached.close()
+        if self.tar is None:
+            self.open_archive()
+            self.scan()
+        if cached.index_fields() != self.index_fields():
+            raise IndexCacheError("индекс не совпадает с архивом")
+
+    def close(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+        if self.tar is not None:
+            self.tar.close()
+            if isinstance(self.tar.fileobj, SeekableGzip):
+                self.tar.fileobj.close()
+            self.tar = None
+
+    def add(self, name, type, size, mode, mtime, offset):
+        parts = [part for part in name.split("/") if part and part != "."]
+        if not parts:
+            return
+        parent = self.root
+        for part in parts[:-1]:
+            child = parent.children.get(part)
+            if child is None:
+                # Каталог не описан отдельным заголовком — создаём его неявно
+                child = VNode(part, parent)
+                parent.children[part] = child
+            parent = child
+        node = parent.children.get(parts[-1])
+        if node is not None and node.is_dir() and type == tarfile.DIRTYPE:
+            node.mode, node.mtime = mode, mtime
+            return
+        if type not in (tarfile.DIRTYPE, tarfile.SYMTYPE, tarfile.LNKTYPE):
+            type = tarfile.REGTYPE
+        node = VNode(parts[-1], parent, type, size, mode, mtime, offset)
+        parent.children[parts[-1]] = node
+
+    def lookup(self, path, cwd=None):
+        """Находит узел по абсолютному или относительному пути за O(глубины пути)."""
+        node = self.root if path.startswith("/") or cwd is None else cwd
+        for part in path.split("/"):
+            if not part or part == ".":
+                continue
+            if part == "..":
+                node = node.parent or node
+                continue
+            if not node.is_dir():
+                return None
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def compute_totals(self):
+        # Суммарные размеры всех каталогов за один обратный проход по дереву
+        if self.root.total is not None:
+            return
+        for node in reversed(list(self.iter_nodes())):
+            if node.is_dir():
+                node.total = sum(child.total for child in node.children.values())
+            else:
+                node.total = node.size
+
+    def walk(self, node, prefix):
+        """Обходит поддерево в отсортированном порядке, отдавая пары (путь, узел)."""
+        stack = [(prefix, node)]
+        while stack:
+            path, node = stack.pop()
+            yield path, node
+            if node.is_dir():
+                base = path.rstrip("/") + "/"
+                stack.extend((base + child.name, child) for child in reversed(node.listing()))
+
+    def iter_chunks(self, node, chunk_size=None):
+        """Отдаёт содержимое файла порциями не больше chunk_size байт."""
+        chunk_size = chunk_size or CHUNK_SIZE
+        end = node.offset + node.size
+        for start in range(node.offset, end, chunk_size):
+            stop = min(start + chunk_size, end)
+            if self.mmap is not None:
+                yield self.mmap[start:stop]
+            else:
+                with self.read_lock:
+                    self.tar.fileobj.seek(start)
+                    chunk = self.tar.fileobj.read(stop - start)
+                yield chunk
+
+    def head(self, node, lines):
+        """Возвращает первые lines строк файла, не читая остаток."""
+        if self.mmap is not None:
+            # Ищем переводы строк прямо в отображении, копируется только результат
+            end = node.offset + node.size
+            pos = node.offset
+            for _ in range(lines):
+                pos = self.mmap.find(b"\n", pos, end)
+                if pos < 0:
+                    pos = end
+                    break
+                pos += 1
+            return self.mmap[node.offset:pos]
+        result = bytearray()
+        for chunk in self.iter_chunks(node):
+            pos = 0
+            while lines:
+                pos = chunk.find(b"\n", pos)
+                if pos < 0:
+                    break
+                pos += 1
+                lines -= 1
+            if not lines:
+                result += chunk[:pos]
+                break
+            result += chunk
+        return bytes(result)
+
+    def wc(self, node, count_lines=True, count_words=True):
+        """Считает строки и слова за один проход без построения списка строк."""
+        lines = words = 0
+        if node.size and (count_lines or count_words):
+            in_space = True
+            last = b""
+            for chunk in self.iter_chunks(node):
+                if count_lines:
+                    lines += chunk.count(b"\n")
+                if count_words:
+                    marks = chunk.translate(WORD_TABLE)
+                    # Слово начинается там, где за пробелом идёт непробельный байт
+                    words += marks.count(b" x") + (in_space and marks[:1] == b"x")
+                    in_space = marks[-1:] == b" "
+                last = chunk[-1:]
+            if count_lines and last != b"\n":
+                lines += 1  # Последняя строка без перевода строки тоже считается
+        return lines, words, node.size
+
+
+LOG_MODES = ("sync", "buffered", "off")
+
+
+class SessionLogger:
+    """CSV-лог сеанса: файл открыт весь сеанс, строки пишутся пачками из фонового потока."""
+
+    def __init__(self, path, mode="buffered", flush_rows=1024, flush_interval=1.0, fsync=False):
+        if mode not in LOG_MODES:
+            raise ValueError(f"Unknown log mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rows = []
+        self.lock = threading.Lock()  # Защищает буфер строк
+        self.write_lock = threading.Lock()  # Упорядочивает запись в файл
+        self.wakeup = threading.Event()
+        self.file = None
+        self.writer = None
+        self.thread = None
+        self.closed = False
+
+    def log(self, action):
+        if self.mode == "off":
+            return
+        # Время фиксируется числом, в ISO-строку оно превращается только при записи
+        row = (time.time(), action)
+        if self.mode == "sync":
+            with self.write_lock:
+                self.write([row])
+            return
+        with self.lock:
+            self.rows.append(row)
+            full = len(self.rows) >= self.flush_rows
+        if self.thread is None:
+            self.start()
+        if full:
+            self.wakeup.set()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="session-logger", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def run(self):
+        while not self.closed:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows, self.rows = self.rows, []
+        if rows:
+            with self.write_lock:
+                self.write(rows)
+
+    def write(self, rows):
+        if self.file is None:
+            self.file = open(self.path, 'a', newline='')
+            self.writer = csv.writer(self.file)
+        self.writer.writerows((datetime.fromtimestamp(ts).isoformat(), action) for ts, action in rows)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wakeup.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.flush()
+        with self.write_lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        atexit.unregister(self.close)
+
+
+class Command:
+    """Одна стадия конвейера: имя команды, аргументы и обработчик из таблицы (None — неизвестная команда)."""
+    __slots__ = ("name", "args", "handler")
+
+    def __init__(self, name, args, handler):
+        self.name = name
+        self.args = args
+        self.handler = handler
+
+
 class Emulator:
-    def __init__(self, tar_path, log_path, init_script_path):
+    def __init__(self, tar_path, log_path, init_script_path, log_mode="buffered", log_fsync=False, vfs=None):
         self.tar_path = tar_path
         self.log_path = log_path
         self.init_script_path = init_script_path
-        self.virtual_fs = {}  # Виртуальная файловая система
-        self.root_dir = "/tmp/virtual_fs"  # Корневая директория виртуальной ФС
+        self.logger = SessionLogger(log_path, log_mode, fsync=log_fsync)
+        # Виртуальная файловая система; сервер передаёт одну загруженную ФС во все сеансы
+        self.vfs = vfs if vfs is not None else VirtualFS(tar_path)
+        self.current_dir = self.vfs.root
+        # Таблица команд: обработчик получает аргументы и строки со стандартного входа (или None)
+        self.commands = {
+            "ls": self.ls,
+            "cd": self.cd,
+            "exit": self.exit,
+            "head": self.head,
+            "wc": self.wc,
+            "find": self.find,
+        }
 
     def load_tar(self):
-        # Загрузка tar-архива и создание виртуальной ФС
-        with tarfile.open(self.tar_path, "r") as tar:
-            tar.extractall(self.root_dir)
-        self.current_dir = self.root_dir
+        # Загрузка индекса tar-архива без распаковки во временный каталог
+        if self.vfs.tar is None:
+            self.vfs.load()
+        self.current_dir = self.vfs.root
 
     def log_action(self, action):
         # Запись действия в лог-файл
-        with open(self.log_path, 'a', newline='') as log_file:
-            log_writer = csv.writer(log_file)
-            log_writer.writerow([datetime.now().isoformat(), action])
+        self.logger.log(action)
+
+    def compile(self, command):
+        """Разбирает строку один раз в список стадий конвейера."""
+        pipeline = []
+        for stage in command.split("|"):
+            parts = stage.split()
+            if parts:
+                handler = self.commands.get(parts[0])
+                pipeline.append(Command(parts[0], parts[1:], handler))
+        return pipeline
+
+    def run_pipeline(self, pipeline):
+        # Стадии передают друг другу итераторы строк, а не печатают вывод
+        output = None
+        for stage in pipeline:
+            if stage.handler is None:
+                output = self.not_found(stage.name)
+            else:
+                output = stage.handler(stage.args, output)
+        return output if output is not None else ()
 
-    def execute_script(self):
-        # Выполнение команд из стартового скрипта
-        if os.path.exists(self.init_script_path):
+    def run(self, command):
+        """Выполняет команду и возвращает её вывод списком строк."""
+        self.log_action(command)
+        return list(self.run_pipeline(self.compile(command)))
+
+    def execute_script(self, out=None):
+        # Выполнение команд из стартового скрипта: файл читается потоково, строка разбирается один раз
+        if self.init_script_path and os.path.exists(self.init_script_path):
+            write = out.write if out is not None else None
             with open(self.init_script_path, 'r') as script_file:
-                commands = script_file.readlines()
-                for command in commands:
-                    self.execute_command(command.strip())
+                for command in script_file:
+                    command = command.strip()
+                    self.log_action(command)
+                    for line in self.run_pipeline(self.compile(command)):
+                        if write is None:
+                            print(line)
+                        else:
+                            write(line + "\n")
 
     def execute_command(self, command):
         # Выполнение одиночной команды
         self.log_action(command)
-        parts = command.split()
-        if not parts:
+        for line in self.run_pipeline(self.compile(command)):
+            print(line)
+
+    def not_found(self, cmd):
+        return [f"Command not found: {cmd}"]
+
+    def exit(self, args, stdin=None):
+        self.logger.close()
+        sys.exit(0)
+
+    def ls(self, args, stdin=None):
+        # ls [-l] [-R] [<каталог>]
+        flags = set()
+        paths = []
+        for arg in args:
+            if arg.startswith("-") and len(arg) > 1:
+                flags.update(arg[1:])
+            else:
+                paths.append(arg)
+        if flags - set("lR"):
+            return [f"ls: invalid option: -{''.join(sorted(flags - set('lR')))}"]
+        path = paths[0] if paths else "."
+        node = self.vfs.lookup(path, self.current_dir)
+        if node is None:
+            return [f"No such file or directory: {path}"]
+        if "l" in flags:
+            self.vfs.compute_totals()
+        if "R" in flags:
+            return self.ls_recursive(node, path, "l" in flags)
+        entries = node.listing() if node.is_dir() else [node]
+        return [self.ls_entry(entry, "l" in flags) for entry in entries]
+
+    def ls_recursive(self, node, path, long):
+        if not node.is_dir():
+            yield self.ls_entry(node, long)
             return
+        stack = [(path, node)]
+        while stack:
+            dir_path, directory = stack.pop()
+            if dir_path != path:
+                yield ""
+            yield f"{dir_path}:"
+            listing = directory.listing()
+            for entry in listing:
+                yield self.ls_entry(entry, long)
+            base = dir_path.rstrip("/") + "/"
+            stack.extend((base + entry.name, entry) for entry in reversed(listing) if entry.children is not None)
 
-        cmd = parts[0]
-        args = parts[1:]
+    @staticmethod
+    def ls_entry(node, long):
+        if not long:
+            return node.name
+        return f"{node.filemode()} {node.total:>10} {format_mtime(node.mtime)} {node.name}"
 
-        if cmd == "ls":
-            self.ls(args)
-        elif cmd == "cd":
-            self.cd(args)
-        elif cmd == "exit":
-            sys.exit(0)
-        elif cmd == "head":
-            self.head(args)
-        elif cmd == "wc":
-            self.wc(args)
-        else:
-            print(f"Command not found: {cmd}")
+    def find(self, args, stdin=None):
+        # find [<каталог>] [-name <шаблон>] [-type f|d] [-size [+-]N[ckMG]]
+        start = "."
+        if args and not args[0].startswith("-"):
+            start, args = args[0], args[1:]
+        tests = []
+        try:
+            while args:
+                option, value, args = args[0], args[1], args[2:]
+                if option == "-name":
+                    match = re.compile(fnmatch.translate(value.strip("\"'"))).match
+                    tests.append(lambda node, match=match: match(node.name))
+                elif option == "-type" and value in ("f", "d"):
+                    tests.append((lambda node: node.is_dir()) if value == "d" else (lambda node: not node.is_dir()))
+                elif option == "-size":
+                    tests.append(self.size_test(value))
+                else:
+                    return [f"find: unknown predicate: {option} {value}"]
+        except (IndexError, ValueError):
+            return ["find: usage: find [dir] [-name pattern] [-type f|d] [-size [+-]N[ckMG]]"]
+        node = self.vfs.lookup(start, self.current_dir)
+        if node is None:
+            return [f"No such file or directory: {start}"]
+        return self.find_matches(node, start, tests)
+
+    def find_matches(self, node, start, tests):
+        for path, entry in self.vfs.walk(node, start):
+            if all(test(entry) for test in tests):
+                yield path
+
+    @staticmethod
+    def size_test(value):
+        # Размер в единицах с округлением вверх, как в find: c — байты, k/M/G — степени 1024, без суффикса — блоки по 512
+        units = {"c": 1, "k": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+        sign = value[0] if value[0] in "+-" else ""
+        number = value[len(sign):]
+        unit = units.get(number[-1:], 512)
+        if number[-1:] in units:
+            number = number[:-1]
+        limit = int(number)
 
-    def ls(self, args):
-        print("\n".join(os.listdir(self.current_dir)))
+        def test(node):
+            size = -(-node.size // unit)
+            if sign == "+":
+                return size > limit
+            if sign == "-":
+                return size < limit
+            return size == limit
+        return test
 
-    def cd(self, args):
+    def cd(self, args, stdin=None):
         if not args or args[0] == "~":
             # Переход в начальную папку tar-архива
-            self.current_dir = os.path.join(self.root_dir)
+            self.current_dir = self.vfs.root
         else:
             path = args[0]
 
             if path == ".":
                 # Переход на один уровень вверх
-                self.current_dir = os.path.dirname(self.current_dir)
-                if self.current_dir == "/":
-                    self.current_dir = self.root_dir
+                self.current_dir = self.current_dir.parent or self.vfs.root
             elif path == "..":
                 # Переход на два уровня вверх
-                self.current_dir = os.path.dirname(os.path.dirname(self.current_dir))
-                if self.current_dir in ["/", "/tmp"]:
-                    self.current_dir = self.root_dir
+                parent = self.current_dir.parent or self.vfs.root
+                self.current_dir = parent.parent or self.vfs.root
             else:
                 # Переход в указанную директорию
-                new_dir = os.path.join(self.current_dir, path)
-                if os.path.isdir(new_dir):
+                new_dir = self.vfs.lookup(path, self.current_dir)
+                if new_dir is not None and new_dir.is_dir():
                     self.current_dir = new_dir
                 else:
-                    print(f"No such directory: {path}")
+                    return [f"No such directory: {path}"]
+        return []
 
-    def head(self, args):
-        if args:
-            file_path = os.path.join(self.current_dir, args[0])
-            try:
-                with open(file_path, 'r') as file:
-                    lines = file.readlines()
-                    print("".join(lines[:10]))
-            except FileNotFoundError:
-                print(f"No such file: {args[0]}")
+    def find_file(self, name):
+        node = self.vfs.lookup(name, self.current_dir)
+        if node is None or node.is_dir():
+            raise FileNotFoundError(name)
+        return node
+
+    def head(self, args, stdin=None):
+        # head [-n N] [<файл>]; без файла читаются строки со стандартного входа
+        lines = 10
+        if len(args) >= 2 and args[0] == "-n":
+            if not args[1].isdigit():
+                return [f"head: invalid number of lines: {args[1]}"]
+            lines = int(args[1])
+            args = args[2:]
+        if not args:
+            return itertools.islice(stdin, lines) if stdin is not None else []
+        try:
+            node = self.find_file(args[0])
+        except FileNotFoundError:
+            return [f"No such file: {args[0]}"]
+        text = self.vfs.head(node, lines).decode("utf-8", "replace")
+        if text.endswith("\n"):
+            text = text[:-1]
+        return text.split("\n") if text else []
 
-    def wc(self, args):
+    def wc(self, args, stdin=None):
+        # wc [-l] [-w] [-c] [<файл>]; без ключей выводятся все три счётчика
+        flags = set()
+        while args and args[0].startswith("-") and len(args[0]) > 1:
+            flags.update(args[0][1:])
+            args = args[1:]
+        if flags - set("lwc"):
+            return [f"wc: invalid option: -{''.join(sorted(flags - set('lwc')))}"]
+        flags = flags or set("lwc")
         if args:
-            file_path = os.path.join(self.current_dir, args[0])
             try:
-                with open(file_path, 'r') as file:
-                    lines = file.readlines()
-                    words = sum(len(line.split()) for line in lines)
-                    chars = sum(len(line) for line in lines)
-                    print(f"{len(lines)} {words} {chars} {args[0]}")
+                node = self.find_file(args[0])
             except FileNotFoundError:
-                print(f"No such file: {args[0]}")
+                return [f"No such file: {args[0]}"]
+            counts = self.vfs.wc(node, "l" in flags, "w" in flags)
+            name = f" {args[0]}"
+        elif stdin is not None:
+            counts = self.count_lines(stdin, "w" in flags)
+            name = ""
+        else:
+            return []
+        values = [str(value) for flag, value in zip("lwc", counts) if flag in flags]
+        return [" ".join(values) + name]
+
+    @staticmethod
+    def count_lines(lines, count_words=True):
+        # Подсчёт по потоку строк конвейера; каждая строка считается завершённой переводом строки
+        total_lines = words = size = 0
+        for line in lines:
+            total_lines += 1
+            size += len(line.encode("utf-8", "surrogateescape")) + 1
+            if count_words:
+                words += len(line.split())
+        return total_lines, words, size
 
     def prompt(self):
         """Return current directory in prompt style ending with '$ '"""
-        virtual_path = self.current_dir.replace(self.root_dir, "")
+        return f"{self.current_dir.path()}$ "
+
+
+def parse_address(address):
+    # "unix:/path/to.sock" или "host:port"
+    if address.startswith("unix:"):
+        return address[len("unix:"):], None
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def session_log_path(log_path, number):
+    # Отдельный лог на каждый сеанс: {session} в пути заменяется номером сеанса
+    if "{session}" in log_path:
+        return log_path.replace("{session}", str(number))
+    root, ext = os.path.splitext(log_path)
+    return f"{root}.{number}{ext}"
+
+
+class EmulatorServer:
+    """Сервер сеансов: образ индексируется один раз, у каждого подключения свой Emulator."""
+
+    def __init__(self, tar_path, log_path, init_script_path=None, log_mode="sync", log_fsync=False):
+        self.vfs = VirtualFS(tar_path)
+        self.log_path = log_path
+        self.init_script_path = init_script_path
+        self.log_mode = log_mode
+        self.log_fsync = log_fsync
+        self.session_count = 0
+        self.active = set()
+
+    async def start(self, address):
+        self.vfs.load()
+        path, port = parse_address(address)
+        if port is None:
+            return await asyncio.start_unix_server(self.handle, path=path)
+        return await asyncio.start_server(self.handle, path, port)
+
+    def new_session(self):
+        self.session_count += 1
+        log_path = session_log_path(self.log_path, self.session_count) if self.log_path else os.devnull
+        session = Emulator(self.vfs.tar_path, log_path, self.init_script_path,
+                           self.log_mode, self.log_fsync, vfs=self.vfs)
+        session.load_tar()
+        return session
+
+    async def handle(self, reader, writer):
+        # Протокол: строки JSON, запрос {"command": ...}, ответ {"output": [...], "prompt": ...}
+        loop = asyncio.get_running_loop()
+        session = self.new_session()
+        self.active.add(session)
+        try:
+            output = io.StringIO()
+            try:
+                await loop.run_in_executor(None, session.execute_script, output)
+            except SystemExit:
+                # exit в стартовом скрипте завершает только этот сеанс, а не весь сервер
+                await self.send(writer, {"output": output.getvalue().splitlines(), "prompt": session.prompt(),
+                                         "exit": True})
+                return
+            await self.send(writer, {"output": output.getvalue().splitlines(), "prompt": session.prompt()})
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = json.loads(line)["command"]
+                try:
+                    # Команды выполняются в пуле потоков, чтобы длинный wc не блокировал остальные сеансы
+                    output = await loop.run_in_executor(None, session.run, command)
+                except SystemExit:
+                    await self.send(writer, {"output": [], "prompt": session.prompt(), "exit": True})
+                    break
+                await self.send(writer, {"output": output, "prompt": session.prompt()})
+        except (ConnectionError, ValueError, KeyError):
+            pass
+        finally:
+            self.active.discard(session)
+            session.logger.close()
+            writer.close()
+
+    @staticmethod
+    async def send(writer, message):
+        writer.write(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+        await writer.drain()
+
+    def serve_forever(self, address):
+        async def main():
+            server = await self.start(address)
+            print(f"Serving {self.vfs.tar_path} on {address}")
+            async with server:
+                await server.serve_forever()
+        try:
+            asyncio.run(main())
+        finally:
+            self.vfs.close()
+
+
+class RemoteSession:
+    """Клиент сервера с тем же интерфейсом, что и Emulator: run() и prompt()."""
+
+    def __init__(self, address):
+        path, port = parse_address(address)
+        if port is None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(path)
+        else:
+            self.sock = socket.create_connection((path, port))
+        self.stream = self.sock.makefile("rwb")
+        self.greeting = self.receive()
+        self.current_prompt = self.greeting["prompt"]
+
+    def receive(self):
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("server closed the connection")
+        return json.loads(line)
+
+    def run(self, command):
+        self.stream.write(json.dumps({"command": command}, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.stream.flush()
+        response = self.receive()
+        self.current_prompt = response["prompt"]
+        if response.get("exit"):
+            self.close()
+            sys.exit(0)
+        return response["output"]
+
+    def prompt(self):
+        return self.current_prompt
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+def repl(session):
+    # Интерактивный цикл одинаков для локального Emulator и RemoteSession
+    while True:
+        try:
+            command = input(f"emulator:{session.prompt()} ")
+        except EOFError:
+            break
+        for line in session.run(command):
+            print(line)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="emulator.py", description="Эмулятор оболочки над tar-образом ФС")
+    parser.add_argument("tar_path", nargs="?")
+    parser.add_argument("log_path", nargs="?")
+    parser.add_argument("init_script_path", nargs="?")
+    parser.add_argument("--index", choices=["build", "verify"],
+                        help="построить или проверить файл-индекс архива и выйти")
+    parser.add_argument("--log-mode", choices=LOG_MODES, default="buffered",
+                        help="sync — запись каждой команды сразу, buffered — пачками из фонового потока, off — без лога")
+    parser.add_argument("--batch", action="store_true",
+                        help="выполнить стартовый скрипт без интерактивного режима и выйти")
+    parser.add_argument("--log-fsync", action="store_true", help="вызывать fsync после каждого сброса лога")
+    parser.add_argument("--serve", metavar="ADDRESS",
+                        help="запустить сервер сеансов на unix:/path.sock или host:port")
+    parser.add_argument("--connect", metavar="ADDRESS", help="подключиться к серверу сеансов")
+    args = parser.parse_args(argv)
+    if args.connect:
+        return args
+    if args.tar_path is None:
+        parser.error("требуется <tar_path>")
+    if args.serve:
+        if args.log_path is None:
+            parser.error("требуется <log_path> (шаблон пути, {session} заменяется номером сеанса)")
+    elif args.index is None and args.init_script_path is None:
+        parser.error("требуются <log_path> и <init_script_path>")
+    return args
+
+
+def run_index_command(args):
+    vfs = VirtualFS(args.tar_path)
+    try:
+        if args.index == "build":
+            vfs.load(use_index=False)
+            vfs.save_index()
+            print(f"Index written: {vfs.index_path}")
+        else:
+            vfs.verify_index()
+            print(f"Index OK: {vfs.index_path}")
+    except (OSError, IndexCacheError) as e:
+        print(f"Index error: {e}")
+        return 1
+    finally:
+        vfs.close()
+    return 0
 
-        if virtual_path == "":
-            virtual_path = "/"
-        return f"{virtual_path}$ "
 
 if __name__ == "__main__":
-    if len(sys.argv) != 4:
-        print("Usage: python3 emulator.py <tar_path> <log_path> <init_script_path>")
-        sys.exit(1)
+    args = parse_args(sys.argv[1:])
+    if args.index:
+        sys.exit(run_index_command(args))
+    if args.connect:
+        session = RemoteSession(args.connect)
+        print("\n".join(session.greeting["output"]), end="\n" if session.greeting["output"] else "")
+        if session.greeting.get("exit"):
+            session.close()
+            sys.exit(0)
+        repl(session)
+        sys.exit(0)
+    if args.serve:
+        EmulatorServer(args.tar_path, args.log_path, args.init_script_path,
+                       args.log_mode, args.log_fsync).serve_forever(args.serve)
+        sys.exit(0)
 
-    tar_path = sys.argv[1]
-    log_path = sys.argv[2]
-    init_script_path = sys.argv[3]
+    tar_path = args.tar_path
+    log_path = args.log_path
+    init_script_path = args.init_script_path
 
-    emulator = Emulator(tar_path, log_path, init_script_path)
+    emulator = Emulator(tar_path, log_path, init_script_path, args.log_mode, args.log_fsync)
     emulator.load_tar()
+    if args.batch:
+        emulator.execute_script(out=sys.stdout)
+        emulator.logger.close()
+        sys.exit(0)
     emulator.execute_script()
-
-    while True:
-        command = input(f"emulator:{emulator.prompt()} ")
-        emulator.execute_command(command)
+    repl(emulator)
+    emulator.logger.close()
@@ -1,6 +1,19 @@
+import os
+import io
+import csv
+import asyncio
+import tarfile
+import threading
+import tracemalloc
+import time
+import shutil
+import tempfile
 import unittest
+from contextlib import redirect_stdout
 from unittest.mock import patch, MagicMock
-from main import Emulator
+from main import GZIP_OUTPUT_CHUNK, Emulator, VirtualFS, IndexCacheError, SessionLogger, EmulatorServer, RemoteSession
+
+TAR_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "virfisy.tar")
 
 class TestEmulatorCommands(unittest.TestCase):
     def setUp(self):
@@ -64,5 +77,295 @@ class TestEmulatorCommands(unittest.TestCase):
             self.assertEqual(result, mock_output)
             mock_command.assert_called_with('head file.txt')
 
+
+class TestVirtualFS(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.tar_path = shutil.copy(TAR_PATH, self.tmp_dir)
+        self.emulator = Emulator(self.tar_path, os.devnull, "init.txt")
+        self.emulator.load_tar()
+
+    def tearDown(self):
+        self.emulator.vfs.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def run_command(self, command):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.emulator.execute_command(command)
+        return output.getvalue()
+
+    def test_load_does_not_extract(self):
+        self.assertFalse(os.path.exists("/tmp/virtual_fs/VirFileSys/Inf"))
+        self.assertEqual(self.emulator.prompt(), "/$ ")
+
+    def test_cd_and_ls(self):
+        self.run_command("cd VirFileSys/Inf")
+        self.assertEqual(self.emulator.prompt(), "/VirFileSys/Inf$ ")
+        self.assertEqual(sorted(self.run_command("ls").split()), ["hand", "logisim"])
+
+    def test_cd_absolute_and_missing(self):
+        self.run_command("cd /VirFileSys/Math")
+        self.assertEqual(self.emulator.prompt(), "/VirFileSys/Math$ ")
+        self.assertEqual(self.run_command("cd missing"), "No such directory: missing\n")
+        self.assertEqual(self.emulator.prompt(), "/VirFileSys/Math$ ")
+
+    def test_head_and_wc_read_from_archive(self):
+        self.run_command("cd VirFileSys/Inf/hand")
+        self.assertEqual(self.run_command("head example1.txt").splitlines()[0], "hello")
+        self.assertEqual(self.run_command("wc example1.txt"), "14 14 111 example1.txt\n")
+        self.assertEqual(self.run_command("wc missing.txt"), "No such file: missing.txt\n")
+
+    def test_head_lines_option(self):
+        self.run_command("cd VirFileSys/Inf/hand")
+        self.assertEqual(self.run_command("head -n 2 example1.txt"), "hello\r\noreo\r\n")
+        self.assertEqual(self.run_command("head -n x example1.txt"), "head: invalid number of lines: x\n")
+
+    def test_wc_selected_counts(self):
+        self.run_command("cd VirFileSys/Inf/hand")
+        self.assertEqual(self.run_command("wc -l example1.txt"), "14 example1.txt\n")
+        self.assertEqual(self.run_command("wc -wc example1.txt"), "14 111 example1.txt\n")
+        self.assertEqual(self.run_command("wc -z example1.txt"), "wc: invalid option: -z\n")
+
+    def test_run_returns_output(self):
+        self.assertEqual(self.emulator.run("ls"), ["VirFileSys"])
+        self.assertEqual(self.emulator.run("cd VirFileSys/Rus"), [])
+        self.assertEqual(self.emulator.run("ls"), ["pyth.py"])
+        self.assertEqual(self.emulator.run("cat pyth.py"), ["Command not found: cat"])
+
+    def test_pipelines(self):
+        self.emulator.run("cd VirFileSys")
+        self.assertEqual(self.emulator.run("ls | wc -l"), ["3"])
+        self.assertEqual(self.emulator.run("head -n 3 Inf/hand/example1.txt | wc -lw"), ["3 3"])
+        self.assertEqual(self.emulator.run("ls | head -n 1"), ["Inf"])
+
+    def test_ls_long_and_recursive(self):
+        long_listing = self.emulator.run("ls -l VirFileSys/Math")
+        self.assertEqual([line.split()[0] for line in long_listing], ["-rw-rw-rw-", "-rw-rw-rw-"])
+        self.assertEqual([line.split()[1] for line in long_listing], ["11", "0"])
+        self.assertEqual(self.emulator.run("ls -l")[0].split()[1], "334")
+        self.assertEqual(self.emulator.run("ls -R VirFileSys/Inf"),
+                         ["VirFileSys/Inf:", "hand", "logisim", "",
+                          "VirFileSys/Inf/hand:", "example1.txt", "",
+                          "VirFileSys/Inf/logisim:", "example2.txt"])
+
+    def test_find(self):
+        self.assertEqual(self.emulator.run("find . -name example*.txt -size +20c"),
+                         ["./VirFileSys/Inf/hand/example1.txt", "./VirFileSys/Inf/logisim/example2.txt"])
+        self.assertEqual(self.emulator.run("find /VirFileSys/Inf -type d"),
+                         ["/VirFileSys/Inf", "/VirFileSys/Inf/hand", "/VirFileSys/Inf/logisim"])
+        self.assertEqual(self.emulator.run("find missing -name x"), ["No such file or directory: missing"])
+
+    def test_batch_script(self):
+        script_path = os.path.join(self.tmp_dir, "script.txt")
+        with open(script_path, "w") as f:
+            f.write("cd VirFileSys/Math\nls | wc -l\n\nwc -c example3.txt\n")
+        self.emulator.init_script_path = script_path
+        output = io.StringIO()
+        self.emulator.execute_script(out=output)
+        self.assertEqual(output.getvalue(), "2\n11 example3.txt\n")
+
+    def test_streaming_matches_across_chunk_boundaries(self):
+        node = self.emulator.vfs.lookup("VirFileSys/Inf/logisim/example2.txt")
+        expected = self.emulator.vfs.wc(node)
+        with patch("main.CHUNK_SIZE", 3):
+            self.assertEqual(self.emulator.vfs.wc(node), expected)
+            mapped_head = self.emulator.vfs.head(node, 3)
+            archive_map, self.emulator.vfs.mmap = self.emulator.vfs.mmap, None
+            self.assertEqual(self.emulator.vfs.head(node, 3), mapped_head)
+            self.emulator.vfs.mmap = archive_map
+
+    def test_gzip_random_access_uses_checkpoints(self):
+        contents = {f"logs/part{i}.log": ("line %d\n" % i).encode() * (20000 + i * 5000) for i in range(8)}
+        gz_path = os.path.join(self.tmp_dir, "image.tar.gz")
+        with tarfile.open(gz_path, "w:gz") as tar:
+            for name, data in contents.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        with patch("main.CHECKPOINT_SPACING", 64 << 10):
+            vfs = VirtualFS(gz_path)
+            vfs.load(use_index=False)
+        stream = vfs.tar.fileobj
+        self.assertGreater(len(stream.checkpoints), 10)
+        for name in reversed(list(contents)):
+            node = vfs.lookup(name)
+            self.assertEqual(b"".join(vfs.iter_chunks(node)), contents[name])
+        # Чтение с конца архива распаковывает от ближайшей точки, а не от начала потока
+        before = stream.decompressed
+        last = vfs.lookup("logs/part7.log")
+        self.assertEqual(vfs.head(last, 1), b"line 7\n")
+        self.assertLessEqual(stream.decompressed - before, (64 << 10) + GZIP_OUTPUT_CHUNK)
+        vfs.close()
+
+    def test_index_cache_roundtrip(self):
+        self.assertTrue(os.path.exists(self.tar_path + ".idx"))
+        vfs = VirtualFS(self.tar_path)
+        with patch.object(vfs, "scan") as mock_scan:
+            vfs.load()
+            mock_scan.assert_not_called()
+        node = vfs.lookup("/VirFileSys/Inf/logisim/example2.txt")
+        self.assertEqual((node.size, node.offset), (191, 6144))
+        vfs.verify_index()
+        vfs.close()
+
+    def test_corrupt_index_is_rebuilt(self):
+        with open(self.tar_path + ".idx", "r+b") as f:
+            f.seek(40)
+            f.write(b"garbage")
+        vfs = VirtualFS(self.tar_path)
+        self.assertRaises(IndexCacheError, vfs.load_index)
+        vfs.load()
+        self.assertIsNotNone(vfs.lookup("VirFileSys/Rus/pyth.py"))
+        vfs.close()
+        VirtualFS(self.tar_path).load_index()
+
+    def test_stale_index_is_detected(self):
+        os.utime(self.tar_path, ns=(0, 0))
+        self.assertRaises(IndexCacheError, VirtualFS(self.tar_path).load_index)
+
+
+class TestSessionLogger(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.log_path = os.path.join(self.tmp_dir, "session.csv")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_log(self):
+        with open(self.log_path, newline='') as f:
+            return [row[1] for row in csv.reader(f)]
+
+    def test_buffered_rows_flushed_on_close(self):
+        logger = SessionLogger(self.log_path, "buffered", flush_interval=60)
+        for i in range(5):
+            logger.log(f"ls {i}")
+        logger.close()
+        self.assertEqual(self.read_log(), [f"ls {i}" for i in range(5)])
+
+    def test_buffered_flush_on_size_threshold(self):
+        logger = SessionLogger(self.log_path, "buffered", flush_rows=2, flush_interval=60)
+        logger.log("ls")
+        logger.log("cd /")
+        for _ in range(100):
+            if os.path.exists(self.log_path) and self.read_log():
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.read_log(), ["ls", "cd /"])
+        logger.close()
+
+    def test_sync_and_off_modes(self):
+        logger = SessionLogger(self.log_path, "sync")
+        logger.log("wc file.txt")
+        self.assertEqual(self.read_log(), ["wc file.txt"])
+        logger.close()
+        logger = SessionLogger(self.log_path, "off")
+        logger.log("head file.txt")
+        logger.close()
+        self.assertEqual(self.read_log(), ["wc file.txt"])
+
+
+class TestEmulatorServer(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.image_dir = tempfile.mkdtemp()
+        # Образ побольше, чтобы копия индекса в каждом сеансе была заметна на фоне накладных расходов
+        cls.tar_path = os.path.join(cls.image_dir, "image.tar")
+        with tarfile.open(cls.tar_path, "w") as tar:
+            for i in range(20000):
+                info = tarfile.TarInfo(f"data/dir{i % 50}/file{i}.txt")
+                tar.addfile(info, io.BytesIO())
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.image_dir)
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.server = EmulatorServer(self.tar_path, os.path.join(self.tmp_dir, "log-{session}.csv"))
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.aio_server = self.loop.run_until_complete(self.server.start("127.0.0.1:0"))
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait()
+        self.address = "127.0.0.1:%d" % self.aio_server.sockets[0].getsockname()[1]
+
+    def tearDown(self):
+        async def shutdown():
+            self.aio_server.close()
+            for _ in range(200):
+                if not self.server.active:
+                    break
+                await asyncio.sleep(0.01)
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.server.vfs.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def test_sessions_are_independent(self):
+        first = RemoteSession(self.address)
+        second = RemoteSession(self.address)
+        self.assertEqual(first.run("cd data/dir7"), [])
+        self.assertEqual(first.prompt(), "/data/dir7$ ")
+        self.assertEqual(second.prompt(), "/$ ")
+        self.assertEqual(second.run("ls"), ["data"])
+        self.assertEqual(len(first.run("ls")), 400)
+        with self.assertRaises(SystemExit):
+            first.run("exit")
+        second.close()
+        with open(os.path.join(self.tmp_dir, "log-1.csv")) as f:
+            self.assertEqual([row[1] for row in csv.reader(f)], ["cd data/dir7", "ls", "exit"])
+
+    def test_exit_in_init_script_closes_only_that_session(self):
+        other = RemoteSession(self.address)
+        script_path = os.path.join(self.tmp_dir, "init.txt")
+        with open(script_path, "w") as f:
+            f.write("cd data\nexit\nls\n")
+        self.server.init_script_path = script_path
+        session = RemoteSession(self.address)
+        self.assertTrue(session.greeting["exit"])
+        self.assertEqual(session.prompt(), "/data$ ")
+        session.close()
+        # Сервер и уже открытые сеансы продолжают работать
+        self.assertEqual(other.run("ls"), ["data"])
+        self.server.init_script_path = None
+        third = RemoteSession(self.address)
+        self.assertEqual(third.run("cd data"), [])
+        other.close()
+        third.close()
+
+    def test_memory_flat_with_session_count(self):
+        index_size = 0
+        tracemalloc.start()
+        try:
+            vfs = VirtualFS(self.tar_path)
+            vfs.load(use_index=False)
+            index_size = tracemalloc.get_traced_memory()[0]
+            vfs.close()
+            sessions = [RemoteSession(self.address) for _ in range(5)]
+            sessions[0].run("ls")
+            before = tracemalloc.get_traced_memory()[0]
+            sessions += [RemoteSession(self.address) for _ in range(50)]
+            for session in sessions[-50:]:
+                session.run("cd data")
+            per_session = (tracemalloc.get_traced_memory()[0] - before) / 50
+        finally:
+            tracemalloc.stop()
+        for session in sessions:
+            session.close()
+        # Сеанс не копирует индекс образа: прирост на сеанс намного меньше размера индекса
+        self.assertLess(per_session, index_size / 10)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,268 @@
+"""Бенчмарк разрешения зависимостей на синтетических окружениях.
+
+Генерирует каталог site-packages из тысяч *.dist-info с заданными ветвлением,
+глубиной, циклами и долей требований с маркерами и по этапам замеряет время
+и пиковую память: сканирование, поиск зависимостей, транзитивный обход,
+компактный граф, каждый формат вывода и кэш графа. Запуски процессов
+(pip, dot и т. п.) считаются отдельной метрикой по каждому этапу.
+Каждое измерение выполняется в отдельном процессе. Результат пишется в JSON.
+
+    python3 bench.py --output bench.json
+    python3 bench.py --quick --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from main import (CompactGraph, GraphCache, MetadataResolver, WRITERS, crawl_dependencies, default_environment,
+                  find_graphviz, render_dot, resolve_graph, write_graph, RenderError)
+
+# События аудита, означающие запуск нового процесса
+SPAWN_EVENTS = {"subprocess.Popen", "os.system", "os.posix_spawn", "os.spawn", "os.exec", "os.fork", "os.forkpty"}
+spawns = 0
+
+
+def count_spawns(event, args):
+    global spawns
+    if event in SPAWN_EVENTS:
+        spawns += 1
+
+
+def package_name(i):
+    return f"pkg{i:06d}"
+
+
+def generate(workdir, params):
+    """Окружение по слоям: пакет слоя L зависит от fan_out пакетов слоя L + 1."""
+    key = "-".join(str(params[k]) for k in sorted(params))
+    site_packages = os.path.join(workdir, f"site-packages-{key}")
+    if os.path.exists(site_packages):
+        return site_packages
+    rng = random.Random(params["seed"])
+    count, depth = params["packages"], params["depth"]
+    layer_size = max(1, count // depth)
+    requires = {i: [] for i in range(count)}
+    for i in range(count):
+        layer = i // layer_size
+        next_layer = range((layer + 1) * layer_size, min(count, (layer + 2) * layer_size))
+        if not next_layer:
+            continue
+        for target in rng.sample(next_layer, min(params["fan_out"], len(next_layer))):
+            requires[i].append(package_name(target))
+    # Циклы: обратные рёбра из глубоких слоёв в верхние
+    for _ in range(params["cycles"]):
+        source = rng.randrange(layer_size, count)
+        requires[source].append(package_name(rng.randrange(0, source // layer_size * layer_size)))
+
+    tmp_path = site_packages + ".part"
+    os.makedirs(tmp_path)
+    markers = ['; python_version >= "3.8"', '; sys_platform == "win32"', '; extra == "test"',
+               '; platform_system != "Windows" and (python_version < "4" or os_name == "nt")']
+    for i in range(count):
+        name = package_name(i)
+        dist_info = os.path.join(tmp_path, f"{name}-1.0.dist-info")
+        os.makedirs(dist_info)
+        with open(os.path.join(dist_info, "METADATA"), "w") as f:
+            f.write(f"Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n")
+            for requirement in requires[i]:
+                marker = rng.choice(markers) if rng.random() < params["marker_ratio"] else ""
+                f.write(f"Requires-Dist: {requirement}>=0.1{marker}\n")
+            f.write("\nОписание пакета.\n" * 20)
+    os.replace(tmp_path, site_packages)
+    return site_packages
+
+
+def run_stages(site_packages, params, workdir):
+    """Этапы в порядке выполнения: имя -> функция; каждая опирается на результаты предыдущих."""
+    state = {}
+    environment = default_environment()
+    roots = [package_name(i) for i in range(min(params["roots"], params["packages"]))]
+
+    def scan():
+        state["resolver"] = MetadataResolver([site_packages], environment)
+        return len(state["resolver"].scan())
+
+    def lookup():
+        resolver = state["resolver"]
+        return sum(len(resolver.get_dependencies(name)) for name in resolver.distributions)
+
+    def check_nodes(stage, count):
+        # Все обходы одного окружения обязаны давать один и тот же граф
+        if count != len(state["graph"]):
+            raise RuntimeError(f"{stage}: {count} nodes, resolve found {len(state['graph'])}")
+        return count
+
+    def resolve():
+        state["graph"] = crawl_dependencies(roots, lookup=state["resolver"].get_dependencies)
+        return len(state["graph"])
+
+    def resolve_cold():
+        # Транзитивный обход на свежем резолвере: сканирование, чтение METADATA и обход вместе
+        graph = crawl_dependencies(roots, lookup=MetadataResolver([site_packages], environment).get_dependencies)
+        return check_nodes("resolve_cold", len(graph))
+
+    def compact():
+        state["compact"] = CompactGraph.from_dependency_graph(state["graph"])
+        return len(state["compact"].targets)
+
+    def order():
+        return len(state["compact"].topological_order())
+
+    def cache_cold():
+        path = os.path.join(workdir, f"graph-{os.getpid()}.sqlite")
+        if os.path.exists(path):
+            os.remove(path)
+        state["cache_path"] = path
+        cache = GraphCache(path)
+        graph = resolve_graph(roots, resolver=MetadataResolver([site_packages], environment, cache=cache))
+        cache.close()
+        return check_nodes("cache_cold", len(graph))
+
+    def cache_warm():
+        cache = GraphCache(state["cache_path"])
+        graph = resolve_graph(roots, resolver=MetadataResolver([site_packages], environment, cache=cache))
+        cache.close()
+        os.remove(state["cache_path"])
+        return check_nodes("cache_warm", len(graph))
+
+    stages = {"scan": scan, "lookup": lookup, "resolve": resolve, "resolve_cold": resolve_cold,
+              "compact": compact, "order": order, "cache_cold": cache_cold, "cache_warm": cache_warm}
+    for extension in sorted(set(WRITERS) - {".gv"}):
+        def writer(extension=extension):
+            path = os.path.join(workdir, f"graph-{os.getpid()}{extension}")
+            write_graph(state["graph"], path)
+            size = os.path.getsize(path)
+            os.remove(path)
+            return size
+        stages["write" + extension.replace(".", "_")] = writer
+    if params["render"]:
+        def render():
+            dot_path = os.path.join(workdir, f"graph-{os.getpid()}.dot")
+            write_graph(state["graph"], dot_path)
+            try:
+                render_dot(dot_path, dot_path[:-4] + ".svg", timeout=params["render_timeout"])
+            except RenderError as e:
+                return str(e)
+            return os.path.getsize(dot_path[:-4] + ".svg")
+        stages["render"] = render
+    return stages
+
+
+def measure(site_packages, params, workdir, memory):
+    """Все этапы в текущем процессе: время (memory=False) или пиковая память через tracemalloc."""
+    sys.addaudithook(count_spawns)
+    results = {}
+    if memory:
+        tracemalloc.start()
+    for name, stage in run_stages(site_packages, params, workdir).items():
+        before = spawns
+        if memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        value = stage()
+        elapsed = time.perf_counter() - start
+        if memory:
+            results[name] = {"peak_mb": (tracemalloc.get_traced_memory()[1] - start_memory) / (1 << 20), "result": value}
+        else:
+            results[name] = {"seconds": elapsed, "spawns": spawns - before, "result": value}
+    return results
+
+
+def run_worker(args):
+    result = measure(args.worker, json.loads(args.params), args.workdir, args.memory)
+    json.dump(result, sys.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench.json", help="куда записать результаты в JSON")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "dependencies-bench"),
+                        help="каталог для сгенерированных окружений (переиспользуются между запусками)")
+    parser.add_argument("--packages", type=int, default=5000)
+    parser.add_argument("--fan-out", type=int, default=4, help="зависимостей у каждого пакета")
+    parser.add_argument("--depth", type=int, default=10, help="число слоёв графа")
+    parser.add_argument("--cycles", type=int, default=20, help="обратных рёбер, образующих циклы")
+    parser.add_argument("--marker-ratio", type=float, default=0.3, help="доля требований с маркерами")
+    parser.add_argument("--roots", type=int, default=50, help="корней транзитивного обхода")
+    parser.add_argument("--render", action="store_true", help="замерить и отрисовку через dot")
+    parser.add_argument("--render-timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="маленькое окружение для быстрой проверки")
+    # Служебные параметры дочернего процесса
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--params", help=argparse.SUPPRESS)
+    parser.add_argument("--memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    if args.quick:
+        args.packages, args.depth, args.roots = 500, 6, 10
+    params = {
+        "packages": args.packages,
+        "fan_out": args.fan_out,
+        "depth": args.depth,
+        "cycles": args.cycles,
+        "marker_ratio": args.marker_ratio,
+        "roots": args.roots,
+        "seed": args.seed,
+    }
+    os.makedirs(args.workdir, exist_ok=True)
+    started = time.perf_counter()
+    site_packages = generate(args.workdir, params)
+    print(f"environment ready in {time.perf_counter() - started:.1f}s: {site_packages}", file=sys.stderr)
+    params.update(render=args.render, render_timeout=args.render_timeout)
+    if args.render:
+        try:
+            find_graphviz()
+        except RenderError as e:
+            print(f"render stage skipped: {e}", file=sys.stderr)
+            params["render"] = False
+
+    stages = {}
+    for memory in (False, True):
+        command = [sys.executable, os.path.abspath(__file__), "--worker", site_packages,
+                   "--params", json.dumps(params), "--workdir", args.workdir]
+        output = subprocess.run(command + (["--memory"] if memory else []), capture_output=True, text=True,
+                                check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        for name, values in json.loads(output.stdout).items():
+            # Замер времени и замер памяти — два независимых прогона, их результаты должны совпасть
+            previous = stages.setdefault(name, {}).get("result", values["result"])
+            if previous != values["result"]:
+                raise RuntimeError(f"{name}: result {values['result']!r} differs from previous run {previous!r}")
+            stages[name].update(values)
+    for name, values in stages.items():
+        print(f"  {name:14} {values['seconds'] * 1000:9.1f} ms  peak {values['peak_mb']:7.1f} MB  "
+              f"spawns {values['spawns']}", file=sys.stderr)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": params,
+        "stages": stages,
+        "spawns": sum(values["spawns"] for values in stages.values()),
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
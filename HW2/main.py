@@ -1,48 +1,1547 @@
-import subprocess
 import sys
 import os
-from graphviz import Digraph
+import argparse
+import re
+import io
+import json
+import hashlib
+import platform
+import shutil
+import sqlite3
+import subprocess
+import threading
+import zipfile
+import http.client
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from urllib.parse import urljoin, urlsplit, unquote
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    import numpy
+except ImportError:  # NumPy необязателен: без него CSR строится на array
+    numpy = None
+
+
+def normalize_name(name):
+    """Нормализованное имя пакета по PEP 503: регистр и разделители не важны."""
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+
+def default_environment():
+    """Переменные окружения для маркеров PEP 508 текущего интерпретатора."""
+    implementation = sys.implementation.version
+    implementation_version = f"{implementation.major}.{implementation.minor}.{implementation.micro}"
+    if implementation.releaselevel != "final":
+        implementation_version += implementation.releaselevel[0] + str(implementation.serial)
+    return {
+        "implementation_name": sys.implementation.name,
+        "implementation_version": implementation_version,
+        "os_name": os.name,
+        "platform_machine": platform.machine(),
+        "platform_release": platform.release(),
+        "platform_system": platform.system(),
+        "platform_version": platform.version(),
+        "python_full_version": platform.python_version(),
+        "platform_python_implementation": platform.python_implementation(),
+        "python_version": ".".join(platform.python_version_tuple()[:2]),
+        "sys_platform": sys.platform,
+    }
+
+
+VERSION_PATTERN = re.compile(
+    r"^\s*v?(?:(\d+)!)?(\d+(?:\.\d+)*)"
+    r"(?:[-_.]?(a|b|c|rc|alpha|beta|pre|preview)[-_.]?(\d*))?"
+    r"(?:(?:-(\d+))|(?:[-_.]?(?:post|rev|r)[-_.]?(\d*)))?"
+    r"(?:[-_.]?dev[-_.]?(\d*))?(?:\+[a-z0-9]+(?:[-_.][a-z0-9]+)*)?\s*$",
+    re.IGNORECASE,
+)
+PRE_RELEASE = {"a": 0, "alpha": 0, "b": 1, "beta": 1, "c": 2, "rc": 2, "pre": 2, "preview": 2}
+
+
+def parse_version(version):
+    """Ключ сравнения версии PEP 440 или None, если строка не является версией."""
+    match = VERSION_PATTERN.match(version)
+    if not match:
+        return None
+    epoch, release, pre, pre_number, post_implicit, post, dev = match.groups()
+    release = tuple(int(part) for part in release.split("."))
+    while len(release) > 1 and release[-1] == 0:
+        release = release[:-1]
+    post = post_implicit if post_implicit is not None else post
+    # dev без pre и post идёт раньше любых pre-релизов той же версии
+    if pre is not None:
+        pre_key = (PRE_RELEASE[pre.lower()], int(pre_number or 0))
+    elif dev is not None and post is None:
+        pre_key = (-1, 0)
+    else:
+        pre_key = (3, 0)
+    post_key = -1 if post is None else int(post or 0)
+    dev_key = float("inf") if dev is None else int(dev or 0)
+    return int(epoch or 0), release, pre_key, post_key, dev_key
+
+
+def compare_versions(left, op, right):
+    """Сравнение версий операторами PEP 440; None — если это не версии."""
+    if op in ("==", "!=") and right.endswith(".*"):
+        prefix = [part for part in right[:-2].split(".")]
+        left_parts = left.split(".")
+        result = left_parts[:len(prefix)] == prefix
+        return result if op == "==" else not result
+    left_key, right_key = parse_version(left), parse_version(right)
+    if left_key is None or right_key is None:
+        return None
+    if op == "~=":
+        release = right.split("+")[0].split(".")
+        prefix = ".".join(release[:-1]) + ".*"
+        return left_key >= right_key and compare_versions(left, "==", prefix)
+    return {
+        "==": left_key == right_key, "!=": left_key != right_key,
+        "<": left_key < right_key, "<=": left_key <= right_key,
+        ">": left_key > right_key, ">=": left_key >= right_key,
+    }.get(op)
+
+
+MARKER_TOKEN = re.compile(r"""\s*(?:(?P<string>'[^']*'|"[^"]*")|(?P<op>===|==|!=|<=|>=|~=|<|>|\(|\))"""
+                          r"""|(?P<word>not\s+in\b|[A-Za-z_][A-Za-z0-9_.]*))""")
+
+
+class Marker:
+    """Маркер окружения PEP 508, разобранный один раз и вычисляемый для любого окружения."""
+
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = MARKER_TOKEN.match(text, pos)
+            if not match:
+                raise ValueError(f"Некорректный маркер: {self.text}")
+            kind = match.lastgroup
+            value = match.group(kind)
+            if kind == "word" and value.startswith("not"):
+                value = "not in"
+            self.tokens.append((kind, value))
+            pos = match.end()
+            while pos < len(text) and text[pos].isspace():
+                pos += 1
+        self.tree, end = self.parse_or(0)
+        if end != len(self.tokens):
+            raise ValueError(f"Некорректный маркер: {self.text}")
+
+    def parse_or(self, pos):
+        node, pos = self.parse_and(pos)
+        while pos < len(self.tokens) and self.tokens[pos] == ("word", "or"):
+            right, pos = self.parse_and(pos + 1)
+            node = ("or", node, right)
+        return node, pos
+
+    def parse_and(self, pos):
+        node, pos = self.parse_atom(pos)
+        while pos < len(self.tokens) and self.tokens[pos] == ("word", "and"):
+            right, pos = self.parse_atom(pos + 1)
+            node = ("and", node, right)
+        return node, pos
+
+    def parse_atom(self, pos):
+        if pos < len(self.tokens) and self.tokens[pos] == ("op", "("):
+            node, pos = self.parse_or(pos + 1)
+            if pos >= len(self.tokens) or self.tokens[pos] != ("op", ")"):
+                raise ValueError(f"Некорректный маркер: {self.text}")
+            return node, pos + 1
+        if pos + 3 > len(self.tokens):
+            raise ValueError(f"Некорректный маркер: {self.text}")
+        left, op, right = self.tokens[pos:pos + 3]
+        if op[0] not in ("op", "word") or op[1] not in ("===", "==", "!=", "<=", ">=", "~=", "<", ">", "in", "not in"):
+            raise ValueError(f"Некорректный маркер: {self.text}")
+        return ("compare", left, op[1], right), pos + 3
+
+    def evaluate(self, environment):
+        return self.evaluate_node(self.tree, environment)
+
+    def evaluate_node(self, node, environment):
+        if node[0] == "or":
+            return self.evaluate_node(node[1], environment) or self.evaluate_node(node[2], environment)
+        if node[0] == "and":
+            return self.evaluate_node(node[1], environment) and self.evaluate_node(node[2], environment)
+        _, left, op, right = node
+        is_extra = "extra" in (left[1], right[1])
+        left_value = self.resolve(left, environment)
+        right_value = self.resolve(right, environment)
+        if is_extra:
+            left_value, right_value = normalize_name(left_value), normalize_name(right_value)
+        if op == "in":
+            return left_value in right_value
+        if op == "not in":
+            return left_value not in right_value
+        if op == "===":
+            return left_value == right_value
+        result = compare_versions(left_value, op, right_value)
+        if result is None:
+            # Не версии — сравниваем как строки (осмысленно только для == и !=)
+            result = {"==": left_value == right_value, "!=": left_value != right_value}.get(op, False)
+        return result
+
+    @staticmethod
+    def resolve(token, environment):
+        kind, value = token
+        if kind == "string":
+            return value[1:-1]
+        if value not in environment:
+            raise ValueError(f"Неизвестная переменная маркера: {value}")
+        return environment[value]
+
+
+REQUIREMENT_PATTERN = re.compile(r"^\s*([A-Za-z0-9](?:[A-Za-z0-9._-]*[A-Za-z0-9])?)\s*(?:\[([^\]]*)\])?\s*(.*)$")
+
+
+class Requirement:
+    """Строка Requires-Dist: имя, extras, ограничение версии и маркер."""
+    __slots__ = ("name", "extras", "specifier", "marker")
+
+    def __init__(self, text):
+        requirement, _, marker = text.partition(";")
+        match = REQUIREMENT_PATTERN.match(requirement)
+        if not match:
+            raise ValueError(f"Некорректное требование: {text}")
+        self.name = match.group(1)
+        self.extras = tuple(normalize_name(extra.strip()) for extra in (match.group(2) or "").split(",") if extra.strip())
+        self.specifier = match.group(3).strip().strip("()")
+        self.marker = Marker(marker) if marker.strip() else None
+
+    def applies(self, environment, extras=()):
+        """Нужно ли требование в окружении при запрошенных extras (как pip: extra="" без extras)."""
+        if self.marker is None:
+            return True
+        for extra in extras or ("",):
+            if self.marker.evaluate(dict(environment, extra=extra)):
+                return True
+        return False
+
+
+def parse_metadata(lines):
+    """Заголовки METADATA (RFC 822): имя, версия и строки Requires-Dist."""
+    name = version = None
+    requires = []
+    folded = None  # Куда дописывать строки-продолжения текущего заголовка
+    for line in lines:
+        if line[:1] in (" ", "\t"):
+            # Продолжение свёрнутого заголовка, например многострочного License:
+            # строка из одних пробелов ещё не конец заголовков
+            if folded is not None and line.strip():
+                requires[-1] += " " + line.strip()
+            continue
+        line = line.rstrip("\r\n")
+        if not line:
+            break  # Заголовки закончились, дальше описание пакета
+        folded = None
+        if line.startswith("Name:"):
+            name = line[5:].strip()
+        elif line.startswith("Version:"):
+            version = line[8:].strip()
+        elif line.startswith("Requires-Dist:"):
+            requires.append(line[14:].strip())
+            folded = requires
+    return name, version, requires
+
+
+class Distribution:
+    """Установленный дистрибутив: каталог *.dist-info или *.egg-info и его метаданные."""
+
+    def __init__(self, name, version, path, requires=None):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.texts = requires
+        self._requires = None
+
+    @property
+    def requires(self):
+        # Метаданные читаются и разбираются при первом обращении, а не при сканировании sys.path
+        if self._requires is None:
+            if self.texts is None:
+                self.texts = self.read_requires()
+            self._requires = [Requirement(text) for text in self.texts]
+        return self._requires
+
+    def stamp(self):
+        """Отпечаток файла метаданных: меняется при переустановке или правке дистрибутива."""
+        path = os.path.join(self.path, "METADATA" if self.path.endswith(".dist-info") else "requires.txt")
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = os.stat(self.path)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+    def read_requires(self):
+        if self.path.endswith(".dist-info"):
+            with open(os.path.join(self.path, "METADATA"), encoding="utf-8", errors="replace") as f:
+                name, version, requires = parse_metadata(f)
+            self.name = name or self.name
+            self.version = version or self.version
+            return requires
+        return self.read_egg_requires()
+
+    def read_egg_requires(self):
+        # requires.txt: секции [extra], [:маркер] или [extra:маркер] превращаются в маркеры PEP 508
+        path = os.path.join(self.path, "requires.txt")
+        if not os.path.exists(path):
+            return []
+        requires = []
+        marker = ""
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("["):
+                    extra, _, condition = line[1:-1].partition(":")
+                    parts = []
+                    if condition:
+                        parts.append(f"({condition})")
+                    if extra:
+                        parts.append(f'extra == "{extra}"')
+                    marker = " and ".join(parts)
+                    continue
+                requires.append(f"{line}; {marker}" if marker else line)
+        return requires
+
+
+class GraphCache:
+    """SQLite-кэш между запусками: требования дистрибутивов и разрешённые подграфы.
+
+    Дистрибутив перечитывается, только если изменился отпечаток его метаданных.
+    Подграфы действительны, пока не изменился отпечаток всего окружения.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS distributions (
+            path TEXT PRIMARY KEY, stamp TEXT, name TEXT, version TEXT, requires TEXT);
+        CREATE TABLE IF NOT EXISTS subgraphs (
+            root TEXT, max_depth INTEGER, fingerprint TEXT, graph TEXT, PRIMARY KEY (root, max_depth));
+    """
+    # Версия содержимого (PRAGMA user_version). Увеличивается при изменении разбора метаданных:
+    # отпечатки файлов при этом прежние, и без сброса в кэше остались бы старые результаты.
+    # 2 — parse_metadata больше не обрывается на свёрнутых заголовках
+    VERSION = 2
+
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            if self.connection.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+                self.connection.executescript("DROP TABLE IF EXISTS distributions; DROP TABLE IF EXISTS subgraphs;")
+                self.connection.execute(f"PRAGMA user_version = {self.VERSION}")
+            self.connection.executescript(self.SCHEMA)
+
+    def load_distributions(self):
+        """path -> (отпечаток, имя, версия, строки Requires-Dist)."""
+        with self.lock:
+            rows = self.connection.execute("SELECT path, stamp, name, version, requires FROM distributions").fetchall()
+        return {path: (stamp, name, version, json.loads(requires)) for path, stamp, name, version, requires in rows}
+
+    def update_distributions(self, changed, removed):
+        with self.lock, self.connection:
+            self.connection.executemany("DELETE FROM distributions WHERE path = ?", [(path,) for path in removed])
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO distributions VALUES (?, ?, ?, ?, ?)",
+                [(d.path, stamp, d.name, d.version, json.dumps(d.texts)) for d, stamp in changed])
+
+    def load_graph(self, roots, max_depth, fingerprint):
+        roots = [roots] if isinstance(roots, str) else roots
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT graph FROM subgraphs WHERE root = ? AND max_depth = ? AND fingerprint = ?",
+                ("\n".join(normalize_name(root) for root in roots), -1 if max_depth is None else max_depth,
+                 fingerprint)).fetchone()
+        return DependencyGraph.from_dict(json.loads(row[0])) if row else None
+
+    def store_graph(self, graph, max_depth, fingerprint):
+        with self.lock, self.connection:
+            # Подграфы прежнего состояния окружения больше не понадобятся
+            self.connection.execute("DELETE FROM subgraphs WHERE fingerprint != ?", (fingerprint,))
+            self.connection.execute("INSERT OR REPLACE INTO subgraphs VALUES (?, ?, ?, ?)", (
+                "\n".join(graph.roots), -1 if max_depth is None else max_depth, fingerprint, json.dumps(graph.to_dict())))
+
+    def close(self):
+        self.connection.close()
+
+
+class MetadataResolver:
+    """Индекс установленных дистрибутивов: sys.path сканируется один раз, без запуска pip."""
+
+    def __init__(self, paths=None, environment=None, cache=None):
+        self.paths = list(sys.path) if paths is None else list(paths)
+        self.environment = environment or default_environment()
+        self.cache = cache
+        self.distributions = None
+        self.fingerprint = None
+        self.lock = threading.Lock()
+
+    def scan(self):
+        # Индекс собирается в локальный словарь и публикуется целиком: потоки обхода
+        # не должны видеть наполовину заполненный self.distributions
+        distributions = {}
+        for path in self.paths:
+            try:
+                entries = os.scandir(path or ".")
+            except OSError:
+                continue
+            with entries:
+                for entry in entries:
+                    if not entry.name.endswith((".dist-info", ".egg-info")) or not entry.is_dir():
+                        continue
+                    # Имя и версия берутся из имени каталога: {name}-{version}.dist-info
+                    stem = entry.name.rsplit(".", 1)[0]
+                    name, _, version = stem.partition("-")
+                    # Как и importlib.metadata, первый найденный в sys.path дистрибутив побеждает
+                    distributions.setdefault(normalize_name(name), Distribution(name, version.split("-")[0], entry.path))
+        if self.cache is not None:
+            self.sync_cache(distributions)
+        self.distributions = distributions
+        return distributions
+
+    def sync_cache(self, distributions):
+        """Берёт неизменившиеся дистрибутивы из кэша, перечитывает остальные и считает отпечаток окружения."""
+        cached = self.cache.load_distributions()
+        changed = []
+        digest = hashlib.sha256(json.dumps(self.environment, sort_keys=True).encode())
+        for key in sorted(distributions):
+            distribution = distributions[key]
+            stamp = distribution.stamp()
+            digest.update(f"{key}\0{distribution.path}\0{stamp}\n".encode())
+            entry = cached.pop(distribution.path, None)
+            if entry is not None and entry[0] == stamp:
+                _, distribution.name, distribution.version, distribution.texts = entry
+            else:
+                distribution.texts = distribution.read_requires()
+                changed.append((distribution, stamp))
+        # Оставшиеся записи кэша — удалённые или перекрытые дистрибутивы
+        if changed or cached:
+            self.cache.update_distributions(changed, list(cached))
+        self.fingerprint = digest.hexdigest()
+
+    def get(self, package_name):
+        distributions = self.distributions
+        if distributions is None:
+            with self.lock:
+                # Первый обратившийся поток сканирует, остальные ждут готовый индекс
+                if self.distributions is None:
+                    self.scan()
+                distributions = self.distributions
+        return distributions.get(normalize_name(package_name))
+
+    def requirements(self, package_name, extras=()):
+        """Требования пакета, применимые к текущему окружению."""
+        distribution = self.get(package_name)
+        if distribution is None:
+            return []
+        extras = tuple(normalize_name(extra) for extra in extras)
+        return [requirement for requirement in distribution.requires if requirement.applies(self.environment, extras)]
+
+    def get_dependencies(self, package_name):
+        """Имена зависимостей в том же виде, что строка Requires: у pip show."""
+        names = []
+        seen = set()
+        for requirement in self.requirements(package_name):
+            key = normalize_name(requirement.name)
+            if key not in seen:
+                seen.add(key)
+                names.append(requirement.name)
+        return sorted(names, key=str.lower)
+
+
+SIMPLE_ACCEPT = "application/vnd.pypi.simple.v1+json, application/vnd.pypi.simple.v1+html;q=0.2, text/html;q=0.1"
+WHEEL_PATTERN = re.compile(r"^(?P<name>[^-]+)-(?P<version>[^-]+)(?:-\d[^-]*)?-[^-]+-[^-]+-[^-]+\.whl$")
+WHEEL_TAIL = 64 * 1024  # Хвост колеса: центральный каталог zip почти всегда помещается сюда
+REDIRECTS = (301, 302, 303, 307, 308)
+
+
+class IndexFetchError(Exception):
+    """Индекс пакетов ответил ошибкой или вернул некорректные данные."""
+
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml")
+
+
+def load_config(path):
+    """Читает плоский config.yaml вида `ключ: значение`."""
+    config = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.split(" #")[0].strip()
+            if not line or line.startswith("#") or ":" not in line:
+                continue
+            key, _, value = line.partition(":")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"":
+                value = value[1:-1]
+            config[key.strip()] = value
+    return config
+
+
+def simple_index_url(repository_url):
+    """URL simple-индекса по repository_url: страница проекта pypi.org ведёт на https://pypi.org/simple/."""
+    parts = urlsplit(repository_url)
+    if parts.netloc in ("pypi.org", "www.pypi.org") and not parts.path.startswith("/simple"):
+        return f"{parts.scheme}://{parts.netloc}/simple/"
+    return repository_url
+
+
+class ConnectionPool:
+    """Keep-alive соединения по хостам; каждое соединение в один момент занято одним потоком."""
+
+    def __init__(self, size=8, timeout=30):
+        self.size = size
+        self.timeout = timeout
+        self.idle = {}  # (схема, хост) -> свободные соединения
+        self.lock = threading.Lock()
+        self.opened = 0
+        self.requests = 0
+
+    def acquire(self, scheme, netloc):
+        with self.lock:
+            self.requests += 1
+            idle = self.idle.get((scheme, netloc))
+            if idle:
+                return idle.pop(), True
+            self.opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout), False
+        return http.client.HTTPConnection(netloc, timeout=self.timeout), False
+
+    def release(self, scheme, netloc, connection):
+        with self.lock:
+            idle = self.idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.size:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, url, headers=None):
+        """GET-запрос; возвращает (статус, заголовки в нижнем регистре, тело)."""
+        parts = urlsplit(url)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        while True:
+            connection, reused = self.acquire(parts.scheme, parts.netloc)
+            try:
+                connection.request("GET", path, headers=headers or {})
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    continue  # Сервер закрыл простаивающее соединение — повторяем на новом
+                raise
+            except BaseException:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.release(parts.scheme, parts.netloc, connection)
+            return response.status, {key.lower(): value for key, value in response.getheaders()}, body
+
+    def close(self):
+        with self.lock:
+            for connections in self.idle.values():
+                for connection in connections:
+                    connection.close()
+            self.idle.clear()
+
+
+class HTTPCache:
+    """Дисковый кэш ответов: тело и валидаторы ETag/Last-Modified для повторной проверки."""
+
+    def __init__(self, directory, pool):
+        self.directory = directory
+        self.pool = pool
+
+    def paths(self, key):
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        base = os.path.join(self.directory, digest[:2], digest)
+        return base + ".json", base + ".body"
+
+    def fetch(self, url, headers=None, immutable=False):
+        """GET через кэш. immutable: URL с хэшем содержимого, запись не перепроверяется."""
+        headers = dict(headers or {})
+        for _ in range(5):
+            meta_path, body_path = self.paths(url + "\0" + headers.get("Range", ""))
+            meta = None
+            try:
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                if immutable:
+                    with open(body_path, "rb") as f:
+                        return meta["status"], meta["headers"], f.read()
+            except (OSError, ValueError):
+                meta = None
+            request_headers = dict(headers)
+            if meta and meta["headers"].get("etag"):
+                request_headers["If-None-Match"] = meta["headers"]["etag"]
+            if meta and meta["headers"].get("last-modified"):
+                request_headers["If-Modified-Since"] = meta["headers"]["last-modified"]
+            status, response_headers, body = self.pool.request(url, request_headers)
+            if status in REDIRECTS and "location" in response_headers:
+                url = urljoin(url, response_headers["location"])
+                continue
+            if status == 304 and meta:
+                try:
+                    with open(body_path, "rb") as f:
+                        return meta["status"], meta["headers"], f.read()
+                except OSError:
+                    # Тело пропало из кэша — запрашиваем заново без валидаторов
+                    status, response_headers, body = self.pool.request(url, headers)
+            if status in (200, 206):
+                self.store(meta_path, body_path, status, response_headers, body)
+            return status, response_headers, body
+        raise IndexFetchError(f"Слишком много перенаправлений: {url}")
+
+    def store(self, meta_path, body_path, status, headers, body):
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        keep = ("content-type", "content-range", "etag", "last-modified")
+        meta = {"status": status, "headers": {key: headers[key] for key in keep if key in headers}}
+        # Запись через временный файл: параллельные потоки и процессы не видят половину тела
+        suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(body_path + suffix, "wb") as f:
+            f.write(body)
+        os.replace(body_path + suffix, body_path)
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + suffix, meta_path)
+
+
+class LinkParser(HTMLParser):
+    """Ссылки на файлы со страницы проекта simple-индекса (PEP 503)."""
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "a" and attrs.get("href"):
+            self.links.append(attrs)
+
+
+def parse_project_page(body, content_type, base_url):
+    """Файлы проекта из ответа в JSON (PEP 691) или HTML (PEP 503) с признаком .metadata (PEP 658)."""
+    files = []
+    if "json" in (content_type or ""):
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise IndexFetchError(f"Некорректный JSON индекса: {base_url}") from e
+        for entry in data.get("files", []):
+            metadata = entry.get("core-metadata", entry.get("dist-info-metadata", False))
+            files.append({
+                "filename": entry["filename"],
+                "url": urljoin(base_url, entry["url"]),
+                "metadata": bool(metadata),
+                "yanked": bool(entry.get("yanked")),
+            })
+        return files
+    parser = LinkParser()
+    parser.feed(body.decode("utf-8", errors="replace"))
+    for attrs in parser.links:
+        url = urljoin(base_url, attrs["href"])
+        metadata = attrs.get("data-core-metadata", attrs.get("data-dist-info-metadata"))
+        files.append({
+            "filename": unquote(urlsplit(url).path.rsplit("/", 1)[-1]),
+            "url": url,
+            "metadata": metadata is not None and metadata != "false",
+            "yanked": "data-yanked" in attrs,
+        })
+    return files
+
+
+def select_wheel(files):
+    """Колесо последней версии; pre-релизы и отозванные файлы — только если других нет."""
+    candidates = []
+    for file in files:
+        match = WHEEL_PATTERN.match(file["filename"])
+        key = match and parse_version(match.group("version"))
+        if key is None:
+            continue
+        is_final = key[2] == (3, 0) and key[4] == float("inf")
+        candidates.append(((not file["yanked"], is_final, key), file))
+    if not candidates:
+        return None
+    return max(candidates, key=lambda candidate: candidate[0])[1]
+
+
+class RemoteFile(io.RawIOBase):
+    """Колесо на сервере как seekable-файл: zipfile читает только нужные диапазоны байт."""
+
+    def __init__(self, cache, url, immutable=False):
+        self.cache = cache
+        self.url = url
+        self.immutable = immutable
+        self.blocks = []  # (смещение, данные)
+        self.position = 0
+        status, headers, body = self.cache.fetch(url, {"Range": f"bytes=-{WHEEL_TAIL}"}, immutable)
+        if status == 206:
+            match = re.match(r"bytes (\d+)-\d+/(\d+)", headers.get("content-range", ""))
+            if not match:
+                raise IndexFetchError(f"Некорректный Content-Range: {url}")
+            self.size = int(match.group(2))
+            self.blocks.append((int(match.group(1)), body))
+        elif status == 200:
+            # Сервер не поддерживает Range (например, python -m http.server) — файл пришёл целиком
+            self.size = len(body)
+            self.blocks.append((0, body))
+        else:
+            raise IndexFetchError(f"HTTP {status}: {url}")
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.position = max(0, offset)
+        return self.position
+
+    def readinto(self, buffer):
+        length = min(len(buffer), self.size - self.position)
+        if length <= 0:
+            return 0
+        for start, data in self.blocks:
+            if start <= self.position and self.position + length <= start + len(data):
+                offset = self.position - start
+                buffer[:length] = data[offset:offset + length]
+                self.position += length
+                return length
+        # Нужного диапазона нет — запрашиваем его с запасом, чтобы следующие чтения zipfile попали в блок
+        end = min(self.size, self.position + max(length, WHEEL_TAIL)) - 1
+        status, _, body = self.cache.fetch(self.url, {"Range": f"bytes={self.position}-{end}"}, self.immutable)
+        if status == 200:
+            self.blocks = [(0, body)]
+        elif status == 206:
+            self.blocks.append((self.position, body))
+        else:
+            raise IndexFetchError(f"HTTP {status}: {self.url}")
+        return self.readinto(buffer)
+
+
+def read_wheel_metadata(wheel_file):
+    """METADATA из каталога *.dist-info в корне колеса."""
+    with zipfile.ZipFile(wheel_file) as wheel:
+        for name in wheel.namelist():
+            if name.count("/") == 1 and name.endswith(".dist-info/METADATA"):
+                return wheel.read(name)
+    raise IndexFetchError("В колесе нет *.dist-info/METADATA")
+
+
+class IndexResolver(MetadataResolver):
+    """Зависимости из индекса пакетов: simple-индекс по HTTP(S) или локальный каталог колёс.
+
+    С индекса читаются только файлы .metadata (PEP 658), а если их нет — хвост
+    колеса и сам METADATA через Range-запросы. Ответы кэшируются на диске.
+    """
+
+    def __init__(self, index_url, cache_dir=None, environment=None, workers=8, timeout=30):
+        super().__init__(paths=[], environment=environment)
+        self.index_url = index_url
+        self.directory = None
+        if index_url.startswith("file://"):
+            self.directory = unquote(urlsplit(index_url).path)
+        elif not index_url.startswith(("http://", "https://")):
+            self.directory = index_url
+        self.pool = ConnectionPool(size=workers, timeout=timeout)
+        self.http_cache = HTTPCache(cache_dir or os.path.join(os.path.expanduser("~"), ".cache", "hw2-dependencies"), self.pool)
+        self.distributions = {}
+        self.wheels = None
+        self.lock = threading.Lock()
+
+    def get(self, package_name):
+        key = normalize_name(package_name)
+        with self.lock:
+            if key in self.distributions:
+                return self.distributions[key]
+        # Разные пакеты загружаются параллельно из потоков crawl_dependencies
+        distribution = self.load_local(key) if self.directory else self.load_remote(key)
+        with self.lock:
+            return self.distributions.setdefault(key, distribution)
+
+    def load_local(self, key):
+        with self.lock:
+            if self.wheels is None:
+                # Список колёс публикуется целиком: его читают вне блокировки
+                wheels = {}
+                with os.scandir(self.directory) as entries:
+                    for entry in entries:
+                        match = WHEEL_PATTERN.match(entry.name)
+                        if match and entry.is_file():
+                            wheels.setdefault(normalize_name(match.group("name")), []).append(
+                                {"filename": entry.name, "url": entry.path, "metadata": False, "yanked": False})
+                self.wheels = wheels
+        wheel = select_wheel(self.wheels.get(key, []))
+        if wheel is None:
+            return None
+        return self.make_distribution(read_wheel_metadata(wheel["url"]), wheel["url"])
+
+    def load_remote(self, key):
+        url = urljoin(self.index_url.rstrip("/") + "/", key + "/")
+        status, headers, body = self.http_cache.fetch(url, {"Accept": SIMPLE_ACCEPT})
+        if status == 404:
+            return None
+        if status != 200:
+            raise IndexFetchError(f"HTTP {status}: {url}")
+        wheel = select_wheel(parse_project_page(body, headers.get("content-type"), url))
+        if wheel is None:
+            return None
+        file_url, _, digest = wheel["url"].partition("#")
+        # Хэш во фрагменте ссылки фиксирует содержимое файла — такой ответ можно не перепроверять
+        immutable = bool(digest)
+        if wheel["metadata"]:
+            status, _, metadata = self.http_cache.fetch(file_url + ".metadata", immutable=immutable)
+            if status == 200:
+                return self.make_distribution(metadata, file_url)
+        return self.make_distribution(read_wheel_metadata(RemoteFile(self.http_cache, file_url, immutable)), file_url)
+
+    def make_distribution(self, metadata, path):
+        name, version, requires = parse_metadata(metadata.decode("utf-8", errors="replace").splitlines())
+        return Distribution(name, version, path, requires)
+
+    def close(self):
+        self.pool.close()
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
 
 def get_dependencies(package_name):
-    """Получаем список зависимостей пакета с помощью pip."""
-    # Запускаем команду pip show для получения информации о пакете
-    result = subprocess.run([sys.executable, '-m', 'pip', 'show', package_name], capture_output=True, text=True)
-
-    # Считываем зависимости
-    dependencies = []
-    for line in result.stdout.splitlines():
-        if line.startswith('Requires:'):
-            deps = line.split(':')[1].strip()
-            dependencies = deps.split(', ') if deps else []
-    return dependencies
-
-def visualize_dependencies(package_name, output_image_path, graphviz_path):
-    """Визуализируем зависимости пакета и сохраняем граф."""
-    # Получаем зависимости
-    dependencies = get_dependencies(package_name)
-
-    # Создаем объект Graphviz
-    dot = Digraph(comment=package_name)
-
-    # Устанавливаем параметры графа (по желанию можно настроить)
-    dot.attr(size='20,20', dpi='300', nodesep='1.0', rankdir='LR')
-
-    # Добавляем основной узел для пакета
-    dot.node(package_name)
-
-    # Добавляем зависимости как узлы и соединяем их с основным пакком
-    for dep in dependencies:
-        dot.node(dep)  # Добавляем зависимость как узел
-        dot.edge(package_name, dep)  # Создаем ребро (связь) между пакетом и зависимостью
-
-    # Проверка наличия директории и создание всех промежуточных папок
-    output_dir = os.path.dirname(output_image_path)
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir, exist_ok=True)  # Создаем директорию, если её нет
-
-    # Сохраняем граф в файл
-    dot.render(output_image_path, format='png', cleanup=True)
-    print(f"Граф зависимостей для {package_name} сохранён в {output_image_path}")
-
-# Пример использования для пакета requests
-visualize_dependencies('requests', './output/requests_dependency_graph.png', 'C:/Program Files/Graphviz/bin/dot.exe')
+    """Получаем список зависимостей пакета из метаданных установленных дистрибутивов."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            _resolver = MetadataResolver()
+        resolver = _resolver
+    return resolver.get_dependencies(package_name)
+
+class DependencyGraph:
+    """Граф транзитивных зависимостей одного или нескольких корней: узлы по нормализованному имени, рёбра и циклы."""
+
+    def __init__(self, roots):
+        self.names = {}       # ключ -> имя пакета, как его записали в метаданных
+        self.depth = {}       # ключ -> расстояние от ближайшего корня
+        self.edges = {}       # ключ -> ключи прямых зависимостей
+        self.truncated = set()  # узлы на границе max_depth, зависимости которых не запрашивались
+        self.cycles = []      # найденные циклы: списки ключей, первый узел повторяется в конце
+        self.cycle_edges = set()
+        self.roots = []
+        for root in [roots] if isinstance(roots, str) else roots:
+            key = self.add_node(root, 0)
+            if key not in self.roots:
+                self.roots.append(key)
+        self.root = self.roots[0]
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, package_name):
+        return normalize_name(package_name) in self.names
+
+    def add_node(self, package_name, depth):
+        key = normalize_name(package_name)
+        if key not in self.names:
+            self.names[key] = package_name
+            self.depth[key] = depth
+            self.edges[key] = []
+        return key
+
+    def add_edge(self, package_name, dependency):
+        self.edges[normalize_name(package_name)].append(normalize_name(dependency))
+
+    def to_dict(self):
+        return {
+            "roots": self.roots, "names": self.names, "depth": self.depth, "edges": self.edges,
+            "truncated": sorted(self.truncated), "cycles": self.cycles,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        graph = cls.__new__(cls)
+        graph.roots = data["roots"]
+        graph.root = graph.roots[0]
+        graph.names = data["names"]
+        graph.depth = data["depth"]
+        graph.edges = data["edges"]
+        graph.truncated = set(data["truncated"])
+        graph.cycles = data["cycles"]
+        graph.cycle_edges = {(cycle[-2], cycle[-1]) for cycle in graph.cycles}
+        return graph
+
+    def dependencies(self, package_name):
+        """Прямые зависимости пакета в графе (имена как в метаданных)."""
+        return [self.names[key] for key in self.edges.get(normalize_name(package_name), [])]
+
+    def reverse_edges(self):
+        """ключ -> ключи пакетов, которые от него напрямую зависят."""
+        reverse = {key: [] for key in self.names}
+        for key, dependencies in self.edges.items():
+            for dependency in dependencies:
+                reverse[dependency].append(key)
+        return reverse
+
+    def dependents(self, package_name, transitive=False):
+        """Кто зависит от пакета: напрямую или (transitive) через любую цепочку."""
+        reverse = self.reverse_edges()
+        target = normalize_name(package_name)
+        if not transitive:
+            return [self.names[key] for key in reverse.get(target, [])]
+        seen = {target}
+        stack = [target]
+        while stack:
+            for parent in reverse.get(stack.pop(), ()):
+                if parent not in seen:
+                    seen.add(parent)
+                    stack.append(parent)
+        seen.discard(target)
+        return [self.names[key] for key in self.names if key in seen]
+
+    def paths_to(self, package_name):
+        """Кратчайшая цепочка от каждого корня, который тянет пакет: {корень: [корень, ..., пакет]}."""
+        target = normalize_name(package_name)
+        paths = {}
+        for root in self.roots:
+            parents = {root: None}
+            queue = deque([root])
+            while queue and target not in parents:
+                key = queue.popleft()
+                for dependency in self.edges[key]:
+                    if dependency not in parents:
+                        parents[dependency] = key
+                        queue.append(dependency)
+            if target in parents:
+                path = []
+                key = target
+                while key is not None:
+                    path.append(self.names[key])
+                    key = parents[key]
+                paths[self.names[root]] = path[::-1]
+        return paths
+
+    def compact(self):
+        """Тот же граф в виде CompactGraph с целыми id."""
+        return CompactGraph.from_dependency_graph(self)
+
+    def subgraph(self, package_name):
+        """Подграф, достижимый из пакета, с глубинами от него; общий граф не копируется целиком."""
+        start = normalize_name(package_name)
+        graph = DependencyGraph(self.names[start])
+        queue = deque([start])
+        while queue:
+            key = queue.popleft()
+            for dependency in self.edges[key]:
+                if dependency not in graph.names:
+                    graph.add_node(self.names[dependency], graph.depth[key] + 1)
+                    queue.append(dependency)
+            graph.edges[key] = list(self.edges[key])
+            if key in self.truncated:
+                graph.truncated.add(key)
+        graph.find_cycles()
+        return graph
+
+    def find_cycles(self):
+        """Ищет циклы обходом в глубину и помечает рёбра, которые их замыкают."""
+        self.cycles = []
+        self.cycle_edges = set()
+        state = {}  # 1 - узел на текущем пути, 2 - обработан
+        path = []
+        for start in self.names:
+            if start in state:
+                continue
+            # Итеративный DFS: глубина цепочек зависимостей не ограничена рекурсией Python
+            stack = [(start, iter(self.edges[start]))]
+            state[start] = 1
+            path.append(start)
+            while stack:
+                key, children = stack[-1]
+                for child in children:
+                    if state.get(child) == 1:
+                        self.cycle_edges.add((key, child))
+                        self.cycles.append(path[path.index(child):] + [child])
+                    elif child not in state:
+                        state[child] = 1
+                        path.append(child)
+                        stack.append((child, iter(self.edges[child])))
+                        break
+                else:
+                    state[key] = 2
+                    path.pop()
+                    stack.pop()
+        return self.cycles
+
+
+class CompactGraph:
+    """Граф в компактном виде: имена заменены целыми id, рёбра хранятся в CSR.
+
+    Зависимости узла i — targets[offsets[i]:offsets[i + 1]]. Массивы типа array('q')
+    занимают 8 байт на ребро вместо списка строк на каждый пакет.
+    """
+
+    def __init__(self, names, sources, targets):
+        self.names = list(names)
+        self.ids = {normalize_name(name): i for i, name in enumerate(self.names)}
+        self.offsets, self.targets = self.build_csr(len(self.names), sources, targets)
+        self._reverse = None
+
+    @staticmethod
+    def build_csr(count, sources, targets):
+        """Смещения и цели CSR из списка рёбер (sources[k] -> targets[k])."""
+        if numpy is not None:
+            sources = numpy.asarray(sources, dtype=numpy.int64)
+            order = numpy.argsort(sources, kind="stable")
+            offsets = numpy.zeros(count + 1, dtype=numpy.int64)
+            numpy.cumsum(numpy.bincount(sources, minlength=count), out=offsets[1:])
+            sorted_targets = numpy.asarray(targets, dtype=numpy.int64)[order]
+            # Алгоритмы обходят массивы поэлементно, а на array('q') это быстрее, чем на numpy
+            return array("q", offsets.tobytes()), array("q", sorted_targets.tobytes())
+        # Сортировка подсчётом: O(V + E) без сравнения строк
+        offsets = array("q", bytes(8 * (count + 1)))
+        for source in sources:
+            offsets[source + 1] += 1
+        for i in range(count):
+            offsets[i + 1] += offsets[i]
+        position = array("q", offsets)
+        result = array("q", bytes(8 * len(targets)))
+        for source, target in zip(sources, targets):
+            result[position[source]] = target
+            position[source] += 1
+        return offsets, result
+
+    @classmethod
+    def from_dependency_graph(cls, graph):
+        keys = list(graph.names)
+        ids = {key: i for i, key in enumerate(keys)}
+        sources = array("q")
+        targets = array("q")
+        for key, dependencies in graph.edges.items():
+            for dependency in dependencies:
+                sources.append(ids[key])
+                targets.append(ids[dependency])
+        return cls([graph.names[key] for key in keys], sources, targets)
+
+    def __len__(self):
+        return len(self.names)
+
+    def id(self, package_name):
+        return self.ids[normalize_name(package_name)]
+
+    def successors(self, node):
+        return self.targets[self.offsets[node]:self.offsets[node + 1]]
+
+    @property
+    def reverse(self):
+        """Обратный CSR (кто зависит от узла); строится при первом обращении."""
+        if self._reverse is None:
+            sources = array("q")
+            for node in range(len(self.names)):
+                sources.extend([node] * (self.offsets[node + 1] - self.offsets[node]))
+            self._reverse = self.build_csr(len(self.names), self.targets, sources)
+        return self._reverse
+
+    def predecessors(self, node):
+        offsets, targets = self.reverse
+        return targets[offsets[node]:offsets[node + 1]]
+
+    def reach(self, nodes, offsets, targets):
+        # Отметки посещения — bytearray на все узлы: один байт вместо элемента множества
+        seen = bytearray(len(self.names))
+        stack = list(nodes)
+        for node in stack:
+            seen[node] = 1
+        result = []
+        while stack:
+            node = stack.pop()
+            result.append(node)
+            for target in targets[offsets[node]:offsets[node + 1]]:
+                if not seen[target]:
+                    seen[target] = 1
+                    stack.append(target)
+        return result
+
+    def closure(self, *nodes):
+        """Транзитивное замыкание: id всех пакетов, достижимых из узлов (включая сами узлы)."""
+        return self.reach(nodes, self.offsets, self.targets)
+
+    def dependents(self, *nodes, transitive=True):
+        """id пакетов, которые зависят от узлов напрямую или через цепочку (без самих узлов)."""
+        if not transitive:
+            return sorted({parent for node in nodes for parent in self.predecessors(node)})
+        offsets, targets = self.reverse
+        start = set(nodes)
+        return [node for node in self.reach(nodes, offsets, targets) if node not in start]
+
+    def strongly_connected_components(self):
+        """Компоненты сильной связности (итеративный Тарьян).
+
+        Компоненты выдаются в порядке, когда зависимости идут раньше зависимых.
+        """
+        count = len(self.names)
+        index = array("q", [-1]) * count
+        low = array("q", bytes(8 * count))
+        on_stack = bytearray(count)
+        stack = []
+        components = []
+        counter = 0
+        offsets, targets = self.offsets, self.targets
+        for start in range(count):
+            if index[start] != -1:
+                continue
+            index[start] = low[start] = counter
+            counter += 1
+            stack.append(start)
+            on_stack[start] = 1
+            work = [(start, offsets[start])]
+            while work:
+                node, edge = work[-1]
+                if edge < offsets[node + 1]:
+                    work[-1] = (node, edge + 1)
+                    target = targets[edge]
+                    if index[target] == -1:
+                        index[target] = low[target] = counter
+                        counter += 1
+                        stack.append(target)
+                        on_stack[target] = 1
+                        work.append((target, offsets[target]))
+                    elif on_stack[target] and index[target] < low[node]:
+                        low[node] = index[target]
+                    continue
+                work.pop()
+                if work and low[node] < low[work[-1][0]]:
+                    low[work[-1][0]] = low[node]
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack[member] = 0
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+        return components
+
+    def topological_order(self):
+        """Порядок установки: каждый пакет после своих зависимостей; пакеты одного цикла идут подряд."""
+        return [node for component in self.strongly_connected_components() for node in component]
+
+    def closure_bitsets(self):
+        """Замыкание для всех узлов сразу: битовая маска (int) достижимых узлов на каждый узел.
+
+        Маски считаются по компонентам в порядке зависимостей, поэтому каждая
+        собирается из уже готовых масок потомков. Память — O(V^2 / 8) в худшем
+        случае, поэтому это выгодно для частых запросов к графам до десятков тысяч узлов.
+        """
+        masks = [0] * len(self.names)
+        for component in self.strongly_connected_components():
+            mask = 0
+            for node in component:
+                mask |= 1 << node
+                for target in self.successors(node):
+                    mask |= masks[target]
+            for node in component:
+                masks[node] = mask
+        return masks
+
+
+def crawl_dependencies(package_name, max_depth=None, workers=8, lookup=None):
+    """Обходит зависимости в ширину и возвращает DependencyGraph.
+
+    package_name — имя или список корней: граф для них строится за один проход.
+    Каждый уровень обхода запрашивается параллельно в пуле из workers потоков,
+    каждый пакет запрашивается один раз. max_depth ограничивает глубину от корня.
+    """
+    lookup = lookup or get_dependencies
+    graph = DependencyGraph(package_name)
+    frontier = deque(graph.names[key] for key in graph.roots)
+    depth = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while frontier:
+            if max_depth is not None and depth >= max_depth:
+                graph.truncated.update(normalize_name(name) for name in frontier)
+                break
+            level = list(frontier)
+            frontier.clear()
+            for name, dependencies in zip(level, executor.map(lookup, level)):
+                for dependency in dependencies:
+                    if dependency not in graph:
+                        frontier.append(dependency)
+                    graph.add_node(dependency, depth + 1)
+                    graph.add_edge(name, dependency)
+            depth += 1
+    graph.find_cycles()
+    return graph
+
+
+def resolve_graph(package_name, max_depth=None, resolver=None, workers=8):
+    """Граф зависимостей пакета (или списка корней); при наличии GraphCache у resolver берётся из кэша,
+    если окружение не менялось."""
+    if resolver is None:
+        return crawl_dependencies(package_name, max_depth=max_depth, workers=workers)
+    if resolver.cache is None:
+        return crawl_dependencies(package_name, max_depth=max_depth, workers=workers, lookup=resolver.get_dependencies)
+    if resolver.fingerprint is None:
+        resolver.scan()
+    graph = resolver.cache.load_graph(package_name, max_depth, resolver.fingerprint)
+    if graph is None:
+        graph = crawl_dependencies(package_name, max_depth=max_depth, workers=workers, lookup=resolver.get_dependencies)
+        resolver.cache.store_graph(graph, max_depth, resolver.fingerprint)
+    return graph
+
+
+def prune_graph(graph, max_depth=None, hide_leaves=False, focus=None):
+    """Уменьшенная копия графа, чтобы стоимость отрисовки не росла с размером окружения.
+
+    max_depth оставляет пакеты не дальше заданной глубины, hide_leaves убирает
+    пакеты без зависимостей, focus оставляет только пути от корня к пакету.
+    """
+    keep = set(graph.names)
+    if max_depth is not None:
+        keep = {key for key in keep if graph.depth[key] <= max_depth}
+    target = normalize_name(focus) if focus is not None else None
+    if target is not None:
+        # Обратный обход от пакета: все, кто к нему приводит
+        reverse = {}
+        for key, dependencies in graph.edges.items():
+            for dependency in dependencies:
+                reverse.setdefault(dependency, []).append(key)
+        reach = {target} if target in graph.names else set()
+        stack = list(reach)
+        while stack:
+            for parent in reverse.get(stack.pop(), ()):
+                if parent not in reach:
+                    reach.add(parent)
+                    stack.append(parent)
+        keep &= reach
+    if hide_leaves:
+        keep = {key for key in keep if graph.edges[key] or key in graph.truncated or key in graph.roots or key == target}
+
+    roots = [key for key in graph.roots if key in keep] or graph.roots[:1]
+    pruned = DependencyGraph([graph.names[key] for key in roots])
+    for key, name in graph.names.items():
+        if key in keep:
+            pruned.add_node(name, graph.depth[key])
+    for key in pruned.names:
+        dependencies = [dependency for dependency in graph.edges[key] if dependency in keep]
+        pruned.edges[key] = dependencies
+        # Узел, у которого что-то отрезали по глубине, отмечается как обрезанный
+        if key in graph.truncated or (max_depth is not None and graph.depth[key] == max_depth and graph.edges[key]):
+            pruned.truncated.add(key)
+    pruned.find_cycles()
+    return pruned
+
+
+def quote_dot(name):
+    return '"' + name.replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def write_dot(graph, f):
+    """DOT построчно, без объекта graphviz.Digraph в памяти."""
+    f.write(f"digraph {quote_dot(graph.names[graph.root])} {{\n")
+    f.write("\tgraph [nodesep=1.0 rankdir=LR]\n")
+    for key, name in graph.names.items():
+        # Пакеты на границе max_depth отмечаем пунктиром
+        f.write(f"\t{quote_dot(name)} [style=dashed]\n" if key in graph.truncated else f"\t{quote_dot(name)}\n")
+    for key, dependencies in graph.edges.items():
+        for dependency in dependencies:
+            # Рёбра циклов выделяем красным
+            attrs = " [color=red]" if (key, dependency) in graph.cycle_edges else ""
+            f.write(f"\t{quote_dot(graph.names[key])} -> {quote_dot(graph.names[dependency])}{attrs}\n")
+    f.write("}\n")
+
+
+def write_json(graph, f):
+    """Списки смежности в JSON: одна строка на пакет."""
+    roots = [graph.names[key] for key in graph.roots]
+    cycles = [[graph.names[key] for key in cycle] for cycle in graph.cycles]
+    f.write('{\n"roots": %s,\n"cycles": %s,\n"nodes": {' % (json.dumps(roots), json.dumps(cycles)))
+    separator = "\n"
+    for key, name in graph.names.items():
+        node = {"depth": graph.depth[key], "truncated": key in graph.truncated,
+                "dependencies": [graph.names[dependency] for dependency in graph.edges[key]]}
+        f.write(f"{separator}{json.dumps(name)}: {json.dumps(node)}")
+        separator = ",\n"
+    f.write("\n}\n}\n")
+
+
+def write_graphml(graph, f):
+    """GraphML для Gephi, yEd и подобных программ."""
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<graphml xmlns="http://graphml.graphdrawing.org/xmlns">\n'
+            '  <key id="name" for="node" attr.name="name" attr.type="string"/>\n'
+            '  <key id="depth" for="node" attr.name="depth" attr.type="int"/>\n'
+            '  <key id="truncated" for="node" attr.name="truncated" attr.type="boolean"/>\n'
+            '  <key id="cycle" for="edge" attr.name="cycle" attr.type="boolean"/>\n'
+            f'  <graph id={quoteattr(graph.root)} edgedefault="directed">\n')
+    for key, name in graph.names.items():
+        f.write(f'    <node id={quoteattr(key)}><data key="name">{escape(name)}</data>'
+                f'<data key="depth">{graph.depth[key]}</data>'
+                f'<data key="truncated">{str(key in graph.truncated).lower()}</data></node>\n')
+    for key, dependencies in graph.edges.items():
+        for dependency in dependencies:
+            cycle = str((key, dependency) in graph.cycle_edges).lower()
+            f.write(f'    <edge source={quoteattr(key)} target={quoteattr(dependency)}>'
+                    f'<data key="cycle">{cycle}</data></edge>\n')
+    f.write("  </graph>\n</graphml>\n")
+
+
+# Формат вывода -> функция записи; формат выбирается по расширению файла
+WRITERS = {".dot": write_dot, ".gv": write_dot, ".json": write_json, ".graphml": write_graphml}
+
+
+def write_graph(graph, path, writer=None):
+    """Записывает граф в файл форматом writer или по расширению файла."""
+    writer = writer or WRITERS.get(os.path.splitext(path)[1].lower())
+    if writer is None:
+        raise ValueError(f"Неизвестный формат вывода: {path}")
+    with open(path, "w", encoding="utf-8") as f:
+        writer(graph, f)
+    return path
+
+
+class RenderError(Exception):
+    """Graphviz не найден, завершился с ошибкой или не уложился в отведённое время."""
+
+
+def find_graphviz(graphviz_path=None):
+    """Путь к dot: из config.yaml, если он существует, иначе dot из PATH."""
+    if graphviz_path and os.path.isfile(graphviz_path):
+        return graphviz_path
+    found = (graphviz_path and shutil.which(graphviz_path)) or shutil.which("dot")
+    if found is None:
+        raise RenderError(f"Graphviz не найден: {graphviz_path or 'dot'}")
+    return found
+
+
+def render_dot(dot_path, output_path, graphviz_path=None, timeout=60):
+    """Отрисовывает DOT-файл отдельным процессом dot; формат берётся из расширения output_path."""
+    image_format = os.path.splitext(output_path)[1][1:].lower() or "png"
+    command = [find_graphviz(graphviz_path), f"-T{image_format}", dot_path, "-o", output_path]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired as e:
+        raise RenderError(f"dot не уложился в {timeout} с: {dot_path}") from e
+    if result.returncode != 0:
+        raise RenderError(result.stderr.strip() or f"dot завершился с кодом {result.returncode}")
+    return output_path
+
+
+def save_graph(graph, output_path, graphviz_path=None, render=True, timeout=60):
+    """Сохраняет граф: .dot/.json/.graphml пишутся напрямую, изображение — через DOT и dot.
+
+    Возвращает путь к записанному файлу. Если dot не смог построить изображение,
+    DOT-файл остаётся, а RenderError получает путь к нему в атрибуте dot_path.
+    """
+    # Создание всех промежуточных папок
+    output_dir = os.path.dirname(output_path)
+    os.makedirs(Path(output_dir or ".").resolve(), exist_ok=True)
+    if os.path.splitext(output_path)[1].lower() in WRITERS:
+        return write_graph(graph, output_path)
+
+    # Граф сначала записывается в DOT рядом с изображением, потом отрисовывается dot
+    dot_path = write_graph(graph, os.path.splitext(output_path)[0] + ".dot", write_dot)
+    if not render:
+        return dot_path
+    try:
+        return render_dot(dot_path, output_path, graphviz_path, timeout)
+    except RenderError as e:
+        e.dot_path = dot_path
+        raise
+
+
+def visualize_dependencies(package_name, output_image_path, graphviz_path, max_depth=None, resolver=None,
+                           hide_leaves=False, focus=None, render=True, timeout=60):
+    """Визуализируем транзитивные зависимости пакета и сохраняем граф."""
+    # Получаем граф зависимостей и урезаем его для отрисовки
+    graph = resolve_graph(package_name, max_depth=max_depth, resolver=resolver)
+    if hide_leaves or focus is not None:
+        graph = prune_graph(graph, hide_leaves=hide_leaves, focus=focus)
+    try:
+        path = save_graph(graph, output_image_path, graphviz_path, render, timeout)
+    except RenderError as e:
+        print(f"Граф зависимостей для {package_name} сохранён в {e.dot_path}, изображение не построено: {e}")
+        return e.dot_path
+    print(f"Граф зависимостей для {package_name} сохранён в {path}")
+    return path
+
+
+def default_output_path(graph, configured=None):
+    """Путь общего графа без -o: output_image_path из config.yaml, если он пригоден на этой системе,
+    иначе ./output/<корень>_dependency_graph.png, как писала первая версия программы."""
+    if configured:
+        # Путь вида C:\Users\... вне Windows превратился бы в файл с обратными слешами в имени
+        windows_only = bool(re.match(r"[A-Za-z]:[\\/]", configured)) or "\\" in configured
+        if os.path.splitext(configured)[1] and (os.name == "nt" or not windows_only):
+            return configured
+    name = f"{graph.roots[0]}_dependency_graph.png" if len(graph.roots) == 1 else "dependency_graph.png"
+    return os.path.join("output", name)
+
+
+def read_requirements(path, environment=None, seen=None):
+    """Имена пакетов из requirements.txt: маркеры вычисляются, -r подключает другие файлы."""
+    environment = environment or default_environment()
+    seen = seen if seen is not None else set()
+    seen.add(os.path.abspath(path))
+    names = []
+    with open(path, encoding="utf-8") as f:
+        # Строки, оканчивающиеся на \, продолжаются на следующей
+        lines = f.read().replace("\\\n", " ").splitlines()
+    for line in lines:
+        line = re.sub(r"(^|\s)#.*", "", line).strip()
+        if not line:
+            continue
+        option = re.match(r"^(?:-r|--requirement)(?:\s+|=)(\S+)", line)
+        if option:
+            included = os.path.join(os.path.dirname(path), option.group(1))
+            if os.path.abspath(included) not in seen:
+                names.extend(read_requirements(included, environment, seen))
+            continue
+        if line.startswith("-") or "://" in line.split("@")[0] or line.startswith((".", "/")):
+            continue  # Опции pip, -e и пути к локальным проектам не дают имени пакета
+        requirement = Requirement(line)
+        if requirement.applies(environment):
+            names.append(requirement.name)
+    return names
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="main.py", description="Граф зависимостей Python-пакетов")
+    parser.add_argument("packages", nargs="*", help="корневые пакеты (по умолчанию package_name из конфига)")
+    parser.add_argument("-r", "--requirements", action="append", default=[], metavar="FILE",
+                        help="взять корни из requirements.txt (можно указать несколько раз)")
+    parser.add_argument("--all", action="store_true", help="все установленные дистрибутивы как корни")
+    parser.add_argument("--config", default=CONFIG_PATH, help="путь к config.yaml")
+    parser.add_argument("-o", "--output", help="файл общего графа: .png/.svg/.dot/.json/.graphml")
+    parser.add_argument("--per-root", metavar="DIR", help="записать подграф каждого корня в отдельный файл")
+    parser.add_argument("--per-root-format", choices=["dot", "json", "graphml"], default="dot")
+    parser.add_argument("--reverse", action="append", default=[], metavar="PACKAGE",
+                        help="показать, какие корни и пакеты тянут PACKAGE")
+    parser.add_argument("--order", action="store_true", help="вывести порядок установки (зависимости раньше зависимых)")
+    parser.add_argument("--max-depth", type=int)
+    parser.add_argument("--hide-leaves", action="store_true", help="не рисовать пакеты без зависимостей")
+    parser.add_argument("--focus", metavar="PACKAGE", help="рисовать только пути к PACKAGE")
+    parser.add_argument("--index", action="store_true", help="разрешать зависимости по repository_url, а не по установленным")
+    parser.add_argument("--cache", default=os.path.join(os.path.expanduser("~"), ".cache", "hw2-dependencies"),
+                        help="каталог кэша")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш графа")
+    parser.add_argument("--no-render", action="store_true", help="не запускать dot, оставить DOT-файл")
+    parser.add_argument("--timeout", type=float, default=60, help="ограничение времени работы dot, с")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args(argv)
+    if args.all and args.index:
+        parser.error("--all работает только с установленными пакетами")
+    return args
+
+
+def collect_roots(args, config, resolver):
+    roots = list(args.packages)
+    for path in args.requirements:
+        roots.extend(read_requirements(path, resolver.environment))
+    if args.all:
+        for distribution in resolver.scan().values():
+            distribution.requires  # Имя из METADATA, а не из имени каталога
+            roots.append(distribution.name)
+    if not roots and config.get("package_name"):
+        roots.append(config["package_name"])
+    # Повторы убираются с сохранением порядка
+    unique = {}
+    for root in roots:
+        unique.setdefault(normalize_name(root), root)
+    return list(unique.values())
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    config = load_config(args.config) if os.path.exists(args.config) else {}
+    if args.index:
+        if not config.get("repository_url"):
+            print("В конфигурации нет repository_url")
+            return 1
+        resolver = IndexResolver(simple_index_url(config["repository_url"]),
+                                 cache_dir=None if args.no_cache else args.cache, workers=args.workers)
+    else:
+        cache = None if args.no_cache else GraphCache(os.path.join(args.cache, "graph.sqlite"))
+        resolver = MetadataResolver(cache=cache)
+    try:
+        roots = collect_roots(args, config, resolver)
+    except (OSError, ValueError) as e:
+        print(f"Ошибка чтения корней: {e}")
+        return 1
+    if not roots:
+        print("Не заданы пакеты для анализа")
+        return 1
+
+    # Все корни разрешаются одним проходом по общему графу: каждый пакет запрашивается один раз
+    try:
+        graph = resolve_graph(roots, max_depth=args.max_depth, resolver=resolver, workers=args.workers)
+    except IndexFetchError as e:
+        print(f"Ошибка индекса пакетов: {e}")
+        return 1
+    print(f"Корней: {len(graph.roots)}, пакетов: {len(graph)}, "
+          f"рёбер: {sum(map(len, graph.edges.values()))}, циклов: {len(graph.cycles)}")
+
+    if args.order:
+        compact = graph.compact()
+        for component in compact.strongly_connected_components():
+            names = [compact.names[node] for node in component]
+            print(" ".join(names) if len(names) == 1 else f"({' '.join(names)})")
+
+    for package in args.reverse:
+        if package not in graph:
+            print(f"{package}: не встречается в графе")
+            continue
+        dependents = sorted(graph.dependents(package), key=str.lower)
+        print(f"{package}: напрямую нужен {', '.join(dependents) or 'никому (это корень)'}")
+        for path in graph.paths_to(package).values():
+            if len(path) > 1:
+                print("  " + " -> ".join(path))
+
+    if args.per_root:
+        for key in graph.roots:
+            path = os.path.join(args.per_root, f"{key}.{args.per_root_format}")
+            save_graph(graph.subgraph(key), path)
+        print(f"Подграфы корней сохранены в {args.per_root}")
+
+    if args.output:
+        output = args.output
+    elif args.reverse or args.per_root:
+        # Общий граф без -o пишется, только если ничего другого не запрошено
+        output = None
+    else:
+        output = default_output_path(graph, config.get("output_image_path"))
+        if config.get("output_image_path") and output != config["output_image_path"]:
+            print(f"output_image_path из config.yaml не подходит для этой системы или без расширения "
+                  f"({config['output_image_path']}), граф пишется в {output}")
+    if output:
+        if args.hide_leaves or args.focus is not None:
+            graph = prune_graph(graph, hide_leaves=args.hide_leaves, focus=args.focus)
+        try:
+            path = save_graph(graph, output, config.get("graphviz_path"), not args.no_render, args.timeout)
+        except RenderError as e:
+            print(f"Граф сохранён в {e.dot_path}, изображение не построено: {e}")
+            return 1
+        print(f"Граф зависимостей сохранён в {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
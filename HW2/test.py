@@ -1,71 +1,654 @@
+import io
+import os
+import re
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+import zipfile
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from unittest.mock import patch, MagicMock
-from main import get_dependencies, visualize_dependencies
+import main
+from main import (get_dependencies, visualize_dependencies, MetadataResolver, Marker, compare_versions,
+                  crawl_dependencies, IndexResolver, parse_project_page, simple_index_url, load_config,
+                  GraphCache, resolve_graph, normalize_name as normalize)
 from pathlib import Path
-import subprocess
+
+
+# Многострочный License, как его пишут setuptools и hatchling: пустые строки текста — из одних пробелов
+FOLDED_LICENSE = "License: BSD 3-Clause License\n        \n        Copyright (c) 2019, Authors.\n        \n"
+
+
+def make_dist_info(site_packages, name, version, requires=(), directory=None, license=""):
+    """Создаёт в каталоге фиктивный *.dist-info с METADATA."""
+    path = os.path.join(site_packages, directory or f"{name.replace('-', '_')}-{version}.dist-info")
+    os.makedirs(path)
+    with open(os.path.join(path, "METADATA"), "w") as f:
+        f.write(f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n{license}")
+        for requirement in requires:
+            f.write(f"Requires-Dist: {requirement}\n")
+        f.write("\nRequires-Dist: not-a-header\n")
+
+
+def make_wheel(directory, name, version, requires=(), padding=0, license=""):
+    """Создаёт колесо с METADATA; padding добавляет в начало архива несжимаемый файл."""
+    dist_info = f"{name}-{version}.dist-info"
+    path = os.path.join(directory, f"{name}-{version}-py3-none-any.whl")
+    metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n{license}"
+    metadata += "".join(f"Requires-Dist: {requirement}\n" for requirement in requires)
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as wheel:
+        if padding:
+            wheel.writestr(f"{name}/data.bin", os.urandom(padding), zipfile.ZIP_STORED)
+        wheel.writestr(f"{dist_info}/METADATA", metadata)
+        wheel.writestr(f"{dist_info}/WHEEL", "Wheel-Version: 1.0\n")
+    return path, metadata
+
+
+class IndexHandler(SimpleHTTPRequestHandler):
+    """Статический сервер, как python -m http.server, с keep-alive и (по флагу) Range."""
+    protocol_version = "HTTP/1.1"
+    ranges = False
+    log = []
+
+    def do_GET(self):
+        match = re.match(r"bytes=(-?\d*)-?(\d*)$", self.headers.get("Range", ""))
+        if not (self.ranges and match):
+            return super().do_GET()
+        with open(self.translate_path(self.path), "rb") as f:
+            data = f.read()
+        if match.group(1).startswith("-"):
+            start, end = max(0, len(data) + int(match.group(1))), len(data) - 1
+        else:
+            start, end = int(match.group(1)), min(len(data) - 1, int(match.group(2) or len(data) - 1))
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        self.wfile.write(data[start:end + 1])
+
+    def log_request(self, code="-", size="-"):
+        self.log.append((self.path, self.headers.get("Range"), int(code)))
+
 
 class TestPackageDependencies(unittest.TestCase):
-    
-    @patch('subprocess.run')
-    def test_get_dependencies_success(self, mock_run):
+
+    def setUp(self):
+        self.site_packages = tempfile.mkdtemp()
+        environment = dict(main.default_environment(), python_version="3.11", sys_platform="linux")
+        self.resolver = MetadataResolver([self.site_packages], environment)
+        patcher = patch.object(main, "_resolver", self.resolver)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.site_packages)
+
+    def test_get_dependencies_success(self):
         """Тестируем успешное получение зависимостей"""
-        mock_run.return_value = MagicMock(stdout="Requires: numpy, requests")
+        make_dist_info(self.site_packages, "some-package", "1.0", ["requests>=2.0", "numpy"])
         dependencies = get_dependencies('some_package')
         self.assertEqual(dependencies, ['numpy', 'requests'])
-    
-    @patch('subprocess.run')
-    def test_get_dependencies_error_handling(self, mock_run):
-        """Тестируем обработку ошибок при вызове pip show"""
-        mock_run.side_effect = subprocess.CalledProcessError(1, 'pip show some_package')
+
+    def test_get_dependencies_error_handling(self):
+        """Тестируем отсутствующий пакет"""
         dependencies = get_dependencies('some_package')
         self.assertEqual(dependencies, [])
 
-    @patch('subprocess.run')
-    def test_get_dependencies_with_whitespace(self, mock_run):
+    def test_get_dependencies_with_whitespace(self):
         """Тестируем обработку зависимостей с пробелами"""
-        mock_run.return_value = MagicMock(stdout="Requires: numpy,  requests")
+        make_dist_info(self.site_packages, "some-package", "1.0", ["numpy ", "  requests [socks] ( >=2.0 )"])
         dependencies = get_dependencies('some_package')
-        # Удаляем пробелы из зависимостей
-        dependencies = [dep.strip() for dep in dependencies]
         self.assertEqual(dependencies, ['numpy', 'requests'])
 
-    @patch('subprocess.run')
-    @patch('graphviz.Digraph.render')
+    def test_get_dependencies_after_folded_header(self):
+        """Строки из пробелов внутри свёрнутого License не обрывают заголовки"""
+        make_dist_info(self.site_packages, "some-package", "1.0", ["traitlets", "pyyaml; extra == \"yaml\""],
+                       license=FOLDED_LICENSE)
+        self.assertEqual(get_dependencies('some_package'), ['traitlets'])
+        name, version, requires = main.parse_metadata(
+            ["Name: pkg\r\n", "License: MIT\r\n", "        \r\n", "Requires-Dist: a;\r\n", "\tpython_version > '3'\r\n",
+             "\r\n", "Requires-Dist: body\r\n"])
+        self.assertEqual((name, version, requires), ("pkg", None, ["a; python_version > '3'"]))
+
+    def test_get_dependencies_markers_and_extras(self):
+        """Маркеры вычисляются для окружения, зависимости extras не попадают в Requires"""
+        make_dist_info(self.site_packages, "Some.Package", "1.0", [
+            'idna; python_version >= "3.8"',
+            'colorama; sys_platform == "win32"',
+            'PySocks!=1.5.7,>=1.5.6; extra == "socks"',
+            'typing-extensions; python_version < "3.10" or (extra == "typing" and os_name == "nt")',
+        ])
+        self.assertEqual(get_dependencies('SOME_package'), ['idna'])
+        self.assertEqual([r.name for r in self.resolver.requirements('some-package', extras=['Socks'])],
+                         ['idna', 'PySocks'])
+
+    def test_marker_evaluation(self):
+        """Тестируем разбор и вычисление маркеров PEP 508"""
+        environment = {"python_version": "3.9", "sys_platform": "linux", "extra": ""}
+        self.assertTrue(Marker('python_version ~= "3.7" and "linux" in sys_platform').evaluate(environment))
+        self.assertFalse(Marker('(python_version > "3.10") or sys_platform != "linux"').evaluate(environment))
+        self.assertTrue(compare_versions("1.0rc1", "<", "1.0"))
+        self.assertTrue(compare_versions("2.31.0", "==", "2.31.*"))
+        with self.assertRaises(ValueError):
+            Marker('python_version >=')
+
+    def in_output_dir(self):
+        """Переходит во временный каталог с готовой ./output: os.makedirs в тестах подменён."""
+        os.mkdir(os.path.join(self.site_packages, "output"))
+        cwd = os.getcwd()
+        os.chdir(self.site_packages)
+        self.addCleanup(os.chdir, cwd)
+
+    def test_crawl_dependencies_transitive(self):
+        """Транзитивные зависимости обходятся в ширину, общие пакеты запрашиваются один раз"""
+        graph_data = {"app": ["web", "Cli"], "web": ["core", "cli"], "cli": ["core"], "core": []}
+        calls = []
+
+        def lookup(name):
+            calls.append(name)
+            return graph_data[name.lower()]
+        graph = crawl_dependencies("app", lookup=lookup, workers=4)
+        self.assertEqual(sorted(calls), ["Cli", "app", "core", "web"])
+        self.assertEqual(graph.dependencies("web"), ["core", "Cli"])
+        self.assertEqual(graph.depth, {"app": 0, "web": 1, "cli": 1, "core": 2})
+        self.assertEqual(graph.cycles, [])
+
+    def test_crawl_dependencies_cycles_and_depth(self):
+        """Циклы находятся и помечаются, max_depth обрезает обход"""
+        graph_data = {"a": ["b"], "b": ["c"], "c": ["a", "d"], "d": ["d"]}
+        graph = crawl_dependencies("a", lookup=graph_data.get)
+        self.assertEqual(graph.cycles, [["a", "b", "c", "a"], ["d", "d"]])
+        self.assertEqual(graph.cycle_edges, {("c", "a"), ("d", "d")})
+
+        graph = crawl_dependencies("a", max_depth=2, lookup=graph_data.get)
+        self.assertEqual(set(graph.names), {"a", "b", "c"})
+        self.assertEqual(graph.truncated, {"c"})
+        self.assertEqual(graph.dependencies("c"), [])
+
+    @patch('main.get_dependencies')
+    @patch('main.render_dot')
     @patch('os.makedirs')
     def test_visualize_dependencies_success(self, mock_makedirs, mock_render, mock_run):
         """Тестируем успешную визуализацию зависимостей"""
-        mock_run.return_value = MagicMock(stdout="Requires: numpy, requests")
+        mock_run.return_value = ["numpy", "requests"]
         mock_render.return_value = None
         mock_makedirs.return_value = None
+        self.in_output_dir()
 
         visualize_dependencies('some_package', './output/some_package_graph.png', 'C:/Program Files/Graphviz/bin/dot.exe')
 
         mock_makedirs.assert_called_once_with(Path('./output').resolve(), exist_ok=True)
 
-    @patch('subprocess.run')
-    @patch('graphviz.Digraph.render')
+    @patch('main.get_dependencies')
+    @patch('main.render_dot')
     @patch('os.makedirs')
     def test_visualize_dependencies_create_directories(self, mock_makedirs, mock_render, mock_run):
         """Тестируем, что директория создается для графа зависимостей"""
-        mock_run.return_value = MagicMock(stdout="Requires: numpy, requests")
+        mock_run.return_value = ["numpy", "requests"]
         mock_render.return_value = None
         mock_makedirs.return_value = None
+        self.in_output_dir()
 
         visualize_dependencies('some_package', './output/some_package_graph.png', 'C:/Program Files/Graphviz/bin/dot.exe')
 
         mock_makedirs.assert_called_once_with(Path('./output').resolve(), exist_ok=True)
 
-    @patch('subprocess.run')
-    @patch('graphviz.Digraph.render')
+    @patch('main.get_dependencies')
+    @patch('main.render_dot')
     @patch('os.makedirs')
     def test_visualize_dependencies_error_handling(self, mock_makedirs, mock_render, mock_run):
-        """Тестируем ошибку при визуализации зависимостей"""
-        mock_run.side_effect = subprocess.CalledProcessError(1, 'pip show some_package')
-        
-        visualize_dependencies('some_package', './output/some_package_graph.png', 'C:/Program Files/Graphviz/bin/dot.exe')
+        """Тестируем визуализацию пакета без зависимостей"""
+        mock_run.return_value = []
+        mock_render.side_effect = main.RenderError("Graphviz не найден")
+        self.in_output_dir()
+
+        self.assertTrue(visualize_dependencies('some_package', './output/some_package_graph.png', 'C:/Program Files/Graphviz/bin/dot.exe')
+                        .endswith('some_package_graph.dot'))
         
         # Проверяем, что `makedirs` вызывается даже при ошибке
         mock_makedirs.assert_called_once_with(Path('./output').resolve(), exist_ok=True)
 
+
+class TestGraphOutput(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        data = {"app": ["Web", "cli"], "web": ["core", "idna"], "cli": ["core", "click"],
+                "core": ["app"], "idna": [], "click": ["colorama"], "colorama": []}
+        self.graph = crawl_dependencies("app", lookup=lambda name: data[name.lower()])
+
+    def test_write_dot(self):
+        """DOT: все узлы и рёбра, рёбра циклов красные"""
+        path = main.write_graph(self.graph, os.path.join(self.root, "graph.dot"))
+        with open(path) as f:
+            text = f.read()
+        self.assertTrue(text.startswith('digraph "app" {'))
+        self.assertIn('"core" -> "app" [color=red]', text)
+        self.assertIn('"app" -> "Web"\n', text)
+        self.assertEqual(text.count("->"), 8)
+
+    def test_write_json_and_graphml(self):
+        """JSON со списками смежности и корректный GraphML"""
+        path = main.write_graph(self.graph, os.path.join(self.root, "graph.json"))
+        with open(path) as f:
+            data = json.load(f)
+        self.assertEqual(data["nodes"]["Web"], {"depth": 1, "truncated": False, "dependencies": ["core", "idna"]})
+        self.assertEqual(data["cycles"], [["app", "Web", "core", "app"]])
+
+        import xml.etree.ElementTree as ElementTree
+        path = main.write_graph(self.graph, os.path.join(self.root, "graph.graphml"))
+        namespace = {"g": "http://graphml.graphdrawing.org/xmlns"}
+        tree = ElementTree.parse(path)
+        self.assertEqual(len(tree.findall(".//g:node", namespace)), 7)
+        self.assertEqual(len(tree.findall(".//g:edge", namespace)), 8)
+        with self.assertRaises(ValueError):
+            main.write_graph(self.graph, os.path.join(self.root, "graph.png"))
+
+    def test_prune_graph(self):
+        """Обрезка по глубине, скрытие листьев и пути к пакету"""
+        pruned = main.prune_graph(self.graph, max_depth=1)
+        self.assertEqual(set(pruned.names), {"app", "web", "cli"})
+        self.assertEqual(pruned.truncated, {"web", "cli"})
+
+        pruned = main.prune_graph(self.graph, hide_leaves=True)
+        self.assertEqual(set(pruned.names), {"app", "web", "cli", "core", "click"})
+
+        # Через цикл core -> app к colorama ведут все пакеты, кроме листьев idna и colorama
+        pruned = main.prune_graph(self.graph, focus="colorama")
+        self.assertEqual(set(pruned.names), {"app", "web", "cli", "core", "click", "colorama"})
+        data = {"app": ["web", "cli"], "web": ["idna"], "cli": ["click"]}
+        graph = crawl_dependencies("app", lookup=lambda name: data.get(name, []))
+        pruned = main.prune_graph(graph, focus="click")
+        self.assertEqual(pruned.edges, {"app": ["cli"], "cli": ["click"], "click": []})
+        self.assertEqual(pruned.cycles, [])
+
+    @patch('subprocess.run')
+    def test_render_dot(self, mock_run):
+        """dot запускается по пути из config.yaml с таймаутом"""
+        graphviz_path = os.path.join(self.root, "dot.exe")
+        open(graphviz_path, "w").close()
+        mock_run.return_value = MagicMock(returncode=0)
+        main.render_dot("graph.dot", "graph.svg", graphviz_path, timeout=5)
+        mock_run.assert_called_once_with([graphviz_path, "-Tsvg", "graph.dot", "-o", "graph.svg"],
+                                         capture_output=True, text=True, timeout=5)
+
+        mock_run.side_effect = main.subprocess.TimeoutExpired("dot", 5)
+        with self.assertRaises(main.RenderError):
+            main.render_dot("graph.dot", "graph.png", graphviz_path, timeout=5)
+        with patch("shutil.which", return_value=None), self.assertRaises(main.RenderError):
+            main.render_dot("graph.dot", "graph.png", os.path.join(self.root, "missing.exe"))
+
+
+class TestBatchCli(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.site_packages = os.path.join(self.root, "site-packages")
+        os.makedirs(self.site_packages)
+        for name, requires in {
+            "service-a": ["requests", "click"], "service-b": ["requests", "boto"],
+            "requests": ["urllib3", "certifi", 'win-only; sys_platform == "win32"'],
+            "boto": ["urllib3"], "urllib3": [], "certifi": [], "click": [],
+        }.items():
+            make_dist_info(self.site_packages, name, "1.0", requires)
+        patcher = patch.object(sys, "path", [self.site_packages])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # Общий резолвер модуля не должен пережить тест и ссылаться на удалённый каталог
+        patcher = patch.object(main, "_resolver", None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.config = os.path.join(self.root, "config.yaml")
+        with open(self.config, "w") as f:
+            f.write("graphviz_path: dot\npackage_name: service-a\noutput_image_path: graph.png\n")
+
+    def run_main(self, *argv):
+        output = io.StringIO()
+        with patch("sys.stdout", output):
+            code = main.main(["--config", self.config, "--no-cache", *argv])
+        return code, output.getvalue()
+
+    def test_read_requirements(self):
+        """requirements.txt: комментарии, опции pip, маркеры и вложенные файлы"""
+        with open(os.path.join(self.root, "base.txt"), "w") as f:
+            f.write("click>=8  # CLI\n-r requirements.txt\n")
+        path = os.path.join(self.root, "requirements.txt")
+        with open(path, "w") as f:
+            f.write("# сервисы\n--index-url https://example.org/simple\nservice-a==1.0 \\\n    --hash=sha256:00\n"
+                    "-e ./local\nrequests[socks]; python_version >= '3'\npywin32; sys_platform == 'win32'\n"
+                    "boto @ https://example.org/boto.whl\n-r base.txt\n")
+        environment = dict(main.default_environment(), sys_platform="linux")
+        self.assertEqual(main.read_requirements(path, environment), ["service-a", "requests", "boto", "click"])
+
+    def test_batch_roots_resolved_once(self):
+        """Несколько корней разрешаются одним проходом, каждый пакет запрашивается один раз"""
+        requirements = os.path.join(self.root, "requirements.txt")
+        with open(requirements, "w") as f:
+            f.write("service-b\n")
+        with patch.object(MetadataResolver, "get_dependencies", autospec=True,
+                          side_effect=MetadataResolver.get_dependencies) as lookup:
+            code, output = self.run_main("service-a", "-r", requirements, "-o", os.path.join(self.root, "all.json"),
+                                         "--per-root", os.path.join(self.root, "roots"), "--per-root-format", "json")
+        self.assertEqual(code, 0)
+        looked_up = [normalize(call.args[1]) for call in lookup.call_args_list]
+        self.assertEqual(sorted(looked_up), sorted(set(looked_up)))
+        self.assertIn("Корней: 2, пакетов: 7", output)
+        with open(os.path.join(self.root, "all.json")) as f:
+            self.assertEqual(json.load(f)["roots"], ["service-a", "service-b"])
+        with open(os.path.join(self.root, "roots", "service-b.json")) as f:
+            self.assertEqual(set(json.load(f)["nodes"]), {"service-b", "requests", "boto", "urllib3", "certifi"})
+
+    def test_reverse_query(self):
+        """Кто тянет пакет: прямые зависимые и цепочки от корней"""
+        code, output = self.run_main("service-a", "service-b", "--reverse", "urllib3", "--reverse", "missing")
+        self.assertEqual(code, 0)
+        self.assertEqual(output.splitlines()[1:], [
+            "urllib3: напрямую нужен boto, requests",
+            "  service-a -> requests -> urllib3",
+            "  service-b -> boto -> urllib3",
+            "missing: не встречается в графе",
+        ])
+        code, output = self.run_main("--all", "--reverse", "certifi")
+        self.assertIn("Корней: 7, пакетов: 7", output)
+        self.assertIn("  service-b -> requests -> certifi", output)
+
+        resolver = MetadataResolver([self.site_packages])
+        graph = crawl_dependencies(["service-a", "service-b"], lookup=resolver.get_dependencies)
+        self.assertEqual(graph.dependents("urllib3", transitive=True), ["service-a", "service-b", "requests", "boto"])
+
+    def test_default_root_from_config(self):
+        """Без аргументов берутся package_name и output_image_path из config.yaml"""
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, cwd)
+        code, output = self.run_main("--no-render")
+        self.assertEqual(code, 0)
+        with open(os.path.join(self.root, "graph.dot")) as f:
+            self.assertIn('"service-a" -> "click"', f.read())
+
+    def test_unusable_configured_output(self):
+        """Windows-путь без расширения из config.yaml заменяется на ./output/<корень>_dependency_graph.png"""
+        cwd = os.getcwd()
+        os.chdir(self.root)
+        self.addCleanup(os.chdir, cwd)
+        with open(self.config, "w") as f:
+            f.write("package_name: service-a\noutput_image_path: C:\\Users\\user\\Desktop\\111\n")
+        code, output = self.run_main("--no-render")
+        self.assertEqual(code, 0)
+        self.assertIn("output_image_path из config.yaml не подходит", output)
+        self.assertTrue(os.path.exists(os.path.join(self.root, "output", "service-a_dependency_graph.dot")))
+        self.assertFalse([name for name in os.listdir(self.root) if "\\" in name])
+        self.assertEqual(main.default_output_path(main.DependencyGraph(["a", "b"]), "graph"),
+                         os.path.join("output", "dependency_graph.png"))
+
+        # С --per-root без -o общий граф не пишется
+        shutil.rmtree(os.path.join(self.root, "output"))
+        code, output = self.run_main("service-a", "service-b", "--per-root", "roots", "--no-render")
+        self.assertEqual(code, 0)
+        self.assertEqual(sorted(os.listdir(os.path.join(self.root, "roots"))), ["service-a.dot", "service-b.dot"])
+        self.assertFalse(os.path.exists(os.path.join(self.root, "output")))
+        self.assertNotIn("Граф зависимостей сохранён", output)
+
+
+class TestCompactGraph(unittest.TestCase):
+
+    def setUp(self):
+        #  a -> b -> c -> a (цикл), c -> d -> e -> d (цикл), f -> e
+        names = ["a", "b", "c", "d", "e", "F"]
+        edges = [(0, 1), (1, 2), (2, 0), (2, 3), (3, 4), (4, 3), (5, 4)]
+        self.graph = main.CompactGraph(names, [s for s, _ in edges], [t for _, t in edges])
+
+    def test_csr_and_reverse(self):
+        """CSR: смещения и цели, обратные рёбра строятся по запросу"""
+        self.assertEqual(list(self.graph.offsets), [0, 1, 2, 4, 5, 6, 7])
+        self.assertEqual(list(self.graph.successors(2)), [0, 3])
+        self.assertEqual(sorted(self.graph.predecessors(4)), [3, 5])
+        self.assertEqual(self.graph.id("f"), 5)
+
+    def test_components_and_order(self):
+        """Компоненты сильной связности и порядок установки"""
+        components = self.graph.strongly_connected_components()
+        self.assertEqual(sorted(map(sorted, components)), [[0, 1, 2], [3, 4], [5]])
+        order = self.graph.topological_order()
+        position = {node: i for i, node in enumerate(order)}
+        self.assertLess(position[3], position[2])
+        self.assertLess(position[4], position[5])
+
+    def test_closure_and_dependents(self):
+        """Замыкание, обратные зависимости и битовые маски"""
+        self.assertEqual(sorted(self.graph.closure(5)), [3, 4, 5])
+        self.assertEqual(sorted(self.graph.closure(1)), [0, 1, 2, 3, 4])
+        self.assertEqual(sorted(self.graph.dependents(3)), [0, 1, 2, 4, 5])
+        self.assertEqual(self.graph.dependents(3, transitive=False), [2, 4])
+        masks = self.graph.closure_bitsets()
+        self.assertEqual(masks[0], 0b11111)
+        self.assertEqual(masks[5], 0b111000)
+
+    def test_from_dependency_graph(self):
+        """Преобразование DependencyGraph в CompactGraph"""
+        data = {"app": ["Web", "cli"], "web": ["core"], "cli": ["core"]}
+        graph = crawl_dependencies("app", lookup=lambda name: data.get(name.lower(), []))
+        compact = graph.compact()
+        order = [compact.names[node] for node in compact.topological_order()]
+        self.assertEqual(order[0], "core")
+        self.assertEqual(order[-1], "app")
+        self.assertEqual(sorted(compact.names[node] for node in compact.dependents(compact.id("core"))),
+                         ["Web", "app", "cli"])
+
+    def test_large_graph(self):
+        """Синтетический граф на 50 000 узлов: построение и запросы быстрее секунды каждый"""
+        import random
+        rng = random.Random(1)
+        count = 50000
+        sources, targets = main.array("q"), main.array("q")
+        for node in range(count):
+            for _ in range(rng.randint(0, 8)):
+                sources.append(node)
+                targets.append(rng.randrange(count))
+
+        def timed(operation, *args):
+            start = time.perf_counter()
+            result = operation(*args)
+            self.assertLess(time.perf_counter() - start, 1.0)
+            return result
+        graph = timed(main.CompactGraph, [f"pkg{i}" for i in range(count)], sources, targets)
+        order = timed(graph.topological_order)
+        timed(graph.closure, 0)
+        timed(graph.dependents, 5)
+        self.assertEqual(len(graph.targets), len(targets))
+        self.assertEqual(sorted(order), list(range(count)))
+
+
+class TestGraphCache(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.site_packages = os.path.join(self.root, "site-packages")
+        os.makedirs(self.site_packages)
+        self.cache_path = os.path.join(self.root, "graph.sqlite")
+        self.environment = dict(main.default_environment(), python_version="3.11", sys_platform="linux")
+        # Окружение из 500 пакетов: pkgN зависит от двух следующих
+        for i in range(500):
+            make_dist_info(self.site_packages, f"pkg{i}", "1.0", [f"pkg{j}" for j in (i + 1, i + 2) if j < 500])
+
+    def resolver(self):
+        cache = GraphCache(self.cache_path)
+        self.addCleanup(cache.close)
+        return MetadataResolver([self.site_packages], self.environment, cache=cache)
+
+    def test_warm_rerun_uses_cache(self):
+        """Повторный запуск без изменений не читает METADATA и берёт подграф из кэша"""
+        graph = resolve_graph("pkg0", resolver=self.resolver())
+        self.assertEqual(len(graph), 500)
+        with patch("main.parse_metadata") as parse, patch("main.crawl_dependencies") as crawl:
+            start = time.perf_counter()
+            cached = resolve_graph("pkg0", resolver=self.resolver())
+            elapsed = time.perf_counter() - start
+        parse.assert_not_called()
+        crawl.assert_not_called()
+        self.assertEqual(cached.edges, graph.edges)
+        self.assertEqual(cached.dependencies("pkg498"), ["pkg499"])
+        self.assertLess(elapsed, 0.5)
+
+    def test_incremental_invalidation(self):
+        """Перечитываются только добавленные и изменённые дистрибутивы"""
+        resolve_graph("pkg0", resolver=self.resolver())
+        metadata = os.path.join(self.site_packages, "pkg10-1.0.dist-info", "METADATA")
+        with open(metadata, "w") as f:
+            f.write("Metadata-Version: 2.1\nName: pkg10\nVersion: 1.0\nRequires-Dist: extra-pkg\n")
+        make_dist_info(self.site_packages, "extra-pkg", "2.0")
+        shutil.rmtree(os.path.join(self.site_packages, "pkg499-1.0.dist-info"))
+
+        resolver = self.resolver()
+        with patch("main.parse_metadata", wraps=main.parse_metadata) as parse:
+            graph = resolve_graph("pkg0", resolver=resolver)
+        self.assertEqual(parse.call_count, 2)
+        self.assertEqual(graph.dependencies("pkg10"), ["extra-pkg"])
+        self.assertEqual(graph.depth["extra-pkg"], 6)
+        self.assertIsNone(resolver.get("pkg499"))
+        self.assertEqual(len(self.resolver().cache.load_distributions()), 500)
+
+    def test_cache_from_older_parser_is_dropped(self):
+        """Кэш, записанный прежней версией разбора, не переживает обновление"""
+        resolve_graph("pkg0", resolver=self.resolver())
+        # Так выглядел кэш до исправления parse_metadata: отпечатки верные, зависимости потеряны
+        connection = sqlite3.connect(self.cache_path)
+        with connection:
+            connection.execute("UPDATE distributions SET requires = '[]'")
+            connection.execute("DELETE FROM subgraphs")
+            connection.execute("PRAGMA user_version = 1")
+        connection.close()
+        graph = resolve_graph("pkg0", resolver=self.resolver())
+        self.assertEqual(len(graph), 500)
+        self.assertEqual(graph.dependencies("pkg0"), ["pkg1", "pkg2"])
+
+    def test_graph_roundtrip_keeps_cycles(self):
+        """Сохранённый подграф восстанавливает циклы и границу max_depth"""
+        graph = crawl_dependencies("a", max_depth=3, lookup={"a": ["b"], "b": ["a", "c"], "c": ["d"]}.get)
+        restored = main.DependencyGraph.from_dict(json.loads(json.dumps(graph.to_dict())))
+        self.assertEqual(restored.cycles, [["a", "b", "a"]])
+        self.assertEqual(restored.cycle_edges, graph.cycle_edges)
+        self.assertEqual(restored.truncated, {"d"})
+
+
+class TestIndexResolver(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.wheels = os.path.join(self.root, "wheels")
+        self.cache_dir = os.path.join(self.root, "cache")
+        os.makedirs(self.wheels)
+        self.environment = dict(main.default_environment(), python_version="3.11", sys_platform="linux")
+
+    def resolver(self, index_url, **kwargs):
+        resolver = IndexResolver(index_url, cache_dir=self.cache_dir, environment=self.environment, **kwargs)
+        self.addCleanup(resolver.close)
+        return resolver
+
+    def serve(self, pages, ranges=False):
+        """Поднимает сервер simple-индекса: pages — {проект: [(файл колеса, есть ли .metadata)]}."""
+        simple = os.path.join(self.root, "simple")
+        for project, files in pages.items():
+            os.makedirs(os.path.join(simple, project))
+            links = []
+            for path, metadata in files:
+                filename = os.path.basename(path)
+                shutil.copy(path, os.path.join(simple, project, filename))
+                attrs = ""
+                if metadata:
+                    with zipfile.ZipFile(path) as wheel:
+                        data = wheel.read(next(n for n in wheel.namelist() if n.endswith("/METADATA")))
+                    with open(os.path.join(simple, project, filename + ".metadata"), "wb") as f:
+                        f.write(data)
+                    attrs = ' data-core-metadata="true"'
+                links.append(f'<a href="{filename}"{attrs}>{filename}</a>')
+            with open(os.path.join(simple, project, "index.html"), "w") as f:
+                f.write("<html><body>" + "".join(links) + "</body></html>")
+        handler = type("Handler", (IndexHandler,), {"ranges": ranges, "log": []})
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(handler, directory=simple))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}/", handler.log
+
+    def test_local_wheel_directory(self):
+        """Каталог колёс: берётся последняя финальная версия, маркеры вычисляются"""
+        make_wheel(self.wheels, "web_app", "1.0", ["old-dep"])
+        make_wheel(self.wheels, "web_app", "1.2", ["Core>=2", 'colorama; sys_platform == "win32"'])
+        make_wheel(self.wheels, "web_app", "2.0rc1", ["next-dep"])
+        make_wheel(self.wheels, "core", "2.1", ["web-app"])
+        resolver = self.resolver(self.wheels)
+        self.assertEqual(resolver.get_dependencies("Web.App"), ["Core"])
+        self.assertEqual(resolver.get("web-app").version, "1.2")
+        self.assertEqual(resolver.get_dependencies("missing"), [])
+        graph = crawl_dependencies("web-app", lookup=resolver.get_dependencies)
+        self.assertEqual(graph.cycles, [["web-app", "core", "web-app"]])
+
+    def test_http_index_metadata_and_cache(self):
+        """simple-индекс по HTTP: .metadata (PEP 658), колесо целиком без Range, перепроверка кэша"""
+        app, _ = make_wheel(self.wheels, "app", "1.0", ["lib", "tool; extra == \"cli\""])
+        lib, _ = make_wheel(self.wheels, "lib", "3.0")
+        url, log = self.serve({"app": [(app, True)], "lib": [(lib, False)]})
+        resolver = self.resolver(url, workers=4)
+        graph = crawl_dependencies("app", lookup=resolver.get_dependencies)
+        self.assertEqual(graph.edges, {"app": ["lib"], "lib": []})
+        fetched = {path for path, _, _ in log}
+        self.assertIn("/app/app-1.0-py3-none-any.whl.metadata", fetched)
+        self.assertNotIn("/app/app-1.0-py3-none-any.whl", fetched)
+        self.assertIn("/lib/lib-3.0-py3-none-any.whl", fetched)
+        # keep-alive: соединений открыто меньше, чем сделано запросов
+        self.assertLess(resolver.pool.opened, resolver.pool.requests)
+
+        # Новый процесс с тем же кэшем: страницы проектов перепроверяются и приходят 304
+        log.clear()
+        resolver = self.resolver(url)
+        self.assertEqual(resolver.get_dependencies("app"), ["lib"])
+        self.assertEqual([code for path, _, code in log if path == "/app/"], [304])
+
+    def test_folded_license_in_index_metadata(self):
+        """Свёрнутый License не теряет зависимости ни в .metadata (PEP 658), ни в колесе"""
+        app, _ = make_wheel(self.wheels, "app", "1.0", ["lib"], license=FOLDED_LICENSE)
+        lib, _ = make_wheel(self.wheels, "lib", "3.0", ["tool"], license=FOLDED_LICENSE)
+        self.assertEqual(self.resolver(self.wheels).get_dependencies("app"), ["lib"])
+        url, log = self.serve({"app": [(app, True)], "lib": [(lib, False)]})
+        graph = crawl_dependencies("app", lookup=self.resolver(url).get_dependencies)
+        self.assertEqual(graph.edges, {"app": ["lib"], "lib": ["tool"], "tool": []})
+        self.assertIn("/app/app-1.0-py3-none-any.whl.metadata", {path for path, _, _ in log})
+
+    def test_http_index_range_requests(self):
+        """Без .metadata из колеса читаются только хвост и METADATA"""
+        big, metadata = make_wheel(self.wheels, "big", "1.0", ["dep"], padding=1 << 20)
+        url, log = self.serve({"big": [(big, False)]}, ranges=True)
+        resolver = self.resolver(url)
+        self.assertEqual(resolver.get_dependencies("big"), ["dep"])
+        ranges = [rng for path, rng, _ in log if path.endswith(".whl")]
+        self.assertTrue(ranges and all(ranges))
+        self.assertLess(len(ranges), 4)
+
+    def test_parse_project_page_json(self):
+        """Ответ PEP 691 в JSON"""
+        body = b'''{"meta": {"api-version": "1.1"}, "name": "pkg", "files": [
+            {"filename": "pkg-1.0-py3-none-any.whl", "url": "../../files/pkg-1.0-py3-none-any.whl#sha256=00",
+             "hashes": {}, "core-metadata": {"sha256": "11"}},
+            {"filename": "pkg-1.1.tar.gz", "url": "pkg-1.1.tar.gz", "hashes": {}, "yanked": "broken"}]}'''
+        files = parse_project_page(body, "application/vnd.pypi.simple.v1+json", "https://example.org/simple/pkg/")
+        self.assertEqual(files[0]["url"], "https://example.org/files/pkg-1.0-py3-none-any.whl#sha256=00")
+        self.assertTrue(files[0]["metadata"])
+        self.assertTrue(files[1]["yanked"])
+
+    def test_config_repository_url(self):
+        """repository_url из config.yaml превращается в адрес simple-индекса"""
+        config = load_config(os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.yaml"))
+        self.assertEqual(simple_index_url(config["repository_url"]), "https://pypi.org/simple/")
+        self.assertEqual(simple_index_url("http://127.0.0.1:8000/simple/"), "http://127.0.0.1:8000/simple/")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,357 @@
+"""Бенчмарк транслятора на сгенерированных конфигурациях.
+
+Генератор с зерном строит корректные и намеренно ошибочные конфиги заданного
+размера по профилям: смешанный, широкие блоки, много ссылок ?{} на константы,
+длинные строки @"...". По каждому этапу (лексер, parse_config, parse_value,
+convert_to_toml_format, потоковая трансляция, поиск ошибки, артефакт)
+измеряются строки/с, МБ/с, пиковая память и время до первого результата.
+Время и память замеряются в отдельных процессах. Результат пишется в JSON.
+
+    python3 bench.py --output bench.json
+    python3 bench.py --quick --output bench.json
+    python3 bench.py --generate corpus.txt --profile refs --lines 2000000 --errors 3
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from main import (CompiledConfig, ConfigTranslator, compile_blocks, constants, convert_to_toml_format, parse_config,
+                  parse_value, tokenize, write_artifact)
+
+# Профиль: полей в блоке, доли ссылок и строк, длина строк, доля строк set, число констант
+# и scale — доля от заданного числа строк (длинные строки иначе дают гигабайты)
+PROFILES = {
+    "mixed": {"fields": 8, "ref_ratio": 0.3, "string_ratio": 0.3, "string_length": (1, 40),
+              "set_ratio": 0.05, "constants": 100, "scale": 1},
+    "wide": {"fields": 2000, "ref_ratio": 0.2, "string_ratio": 0.3, "string_length": (1, 20),
+             "set_ratio": 0.0, "constants": 100, "scale": 1},
+    "refs": {"fields": 8, "ref_ratio": 0.9, "string_ratio": 0.05, "string_length": (1, 20),
+             "set_ratio": 0.3, "constants": 5000, "scale": 1},
+    "strings": {"fields": 4, "ref_ratio": 0.05, "string_ratio": 0.9, "string_length": (1000, 10000),
+                "set_ratio": 0.02, "constants": 100, "scale": 0.05},
+}
+
+# Целевая скорость разбора parse_config, МБ/с: проверяется здесь, а не в модульных тестах,
+# чтобы результат тестов не зависел от загрузки машины
+TARGET_PARSE_MB_S = 4
+
+# Ошибочная конструкция -> (строки, номер строки с ошибкой внутри конструкции, начиная с 0)
+ERRORS = {
+    "bad_line": (["this is not a config line"], 0),
+    "unknown_constant": (["begin", "  value := ?{undefined_constant};", "end"], 1),
+    "nested_begin": (["begin", "begin"], 1),
+    "stray_end": (["end"], 0),
+    "assign_outside": (["orphan := 1;"], 0),
+}
+
+
+def generate(path, lines, profile="mixed", seed=1, errors=0):
+    """Пишет конфиг не короче lines * scale строк; errors ошибочных конструкций в случайных местах между блоками.
+
+    Возвращает описание корпуса; errors — список (номер строки, вид ошибки) по возрастанию,
+    транслятор должен остановиться на первом из них.
+    """
+    settings = PROFILES[profile]
+    lines = max(1, int(lines * settings["scale"]))
+    rng = random.Random(seed)
+    error_slots = sorted(rng.sample(range(lines), errors)) if errors else []
+    error_kinds = [rng.choice(sorted(ERRORS)) for _ in error_slots]
+    expected_errors = []
+    low, high = settings["string_length"]
+    constants = settings["constants"]
+    line = 0
+    blocks = 0
+    with open(path, "w", encoding="utf-8") as f:
+        write = f.write
+        # Все константы объявлены до первого блока, чтобы ссылки в корректном корпусе разрешались
+        for i in range(constants):
+            write(f"set c{i} = {rng.randrange(1 << 31)}\n")
+        line += constants
+        while line < lines:
+            if error_slots and line >= error_slots[0]:
+                error_slots.pop(0)
+                kind = error_kinds.pop(0)
+                construct, offset = ERRORS[kind]
+                expected_errors.append((line + offset + 1, kind))
+                write("\n".join(construct) + "\n")
+                line += len(construct)
+                continue
+            if rng.random() < settings["set_ratio"]:
+                write(f"set c{rng.randrange(constants)} = ?{{c{rng.randrange(constants)}}}\n")
+                line += 1
+            out = ["begin"]
+            for j in range(settings["fields"]):
+                roll = rng.random()
+                if roll < settings["ref_ratio"]:
+                    out.append(f"  r{j} := ?{{c{rng.randrange(constants)}}};")
+                elif roll < settings["ref_ratio"] + settings["string_ratio"]:
+                    out.append(f'  s{j} := @"{"x" * rng.randint(low, high)}";')
+                else:
+                    out.append(f"  n{j} := {rng.randrange(1 << 32)};")
+            out.append("end")
+            write("\n".join(out) + "\n")
+            line += len(out)
+            blocks += 1
+    return {"path": path, "profile": profile, "seed": seed, "lines": line, "bytes": os.path.getsize(path),
+            "blocks": blocks, "errors": expected_errors}
+
+
+def corpus(workdir, lines, profile, seed, errors):
+    """Сгенерированный корпус, переиспользуемый между запусками."""
+    base = os.path.join(workdir, f"{profile}-{lines}-{seed}-{errors}")
+    if not os.path.exists(base + ".json"):
+        meta = generate(base + ".txt", lines, profile, seed, errors)
+        with open(base + ".json", "w") as f:
+            json.dump(meta, f)
+    with open(base + ".json") as f:
+        return json.load(f)
+
+
+class NullWriter:
+    """Приёмник вывода, который только считает символы и время первой записи."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.size = 0
+
+    def write(self, text):
+        self.clock.first()
+        self.size += len(text)
+
+    def flush(self):
+        pass
+
+
+class Clock:
+    """Начало замера и время до первого результата этапа."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_output = None
+
+    def first(self):
+        if self.first_output is None:
+            self.first_output = time.perf_counter() - self.start
+
+
+def run_stages(meta, invalid):
+    """Этапы: (имя, подготовка, функция(clock)); функция возвращает (строк, байт) обработанного входа или None.
+
+    Подготовка каждого этапа (чтение значений, разбор для convert) вынесена из замера.
+    """
+    path = meta["path"]
+    state = {}
+
+    def read_lines():
+        with open(path, encoding="utf-8") as f:
+            return f.readlines()
+
+    def stage_tokenize(clock):
+        with open(path, encoding="utf-8") as f:
+            for _ in tokenize(f):
+                clock.first()
+        return meta["lines"], meta["bytes"]
+
+    def stage_parse_config(clock):
+        with open(path, encoding="utf-8") as f:
+            blocks = []
+            for block in ConfigTranslator().iter_blocks(f):
+                clock.first()
+                blocks.append(block)
+        state["blocks"] = blocks
+        return meta["lines"], meta["bytes"]
+
+    def prepare_values():
+        # Тексты значений присваиваний; parse_value работает с общей таблицей constants
+        constants.clear()
+        parse_config(line for line in read_lines() if line.startswith("set "))
+        state["values"] = [line.split(":=", 1)[1].strip()[:-1] for line in read_lines() if ":=" in line]
+        state["values_bytes"] = sum(len(value.encode()) for value in state["values"])
+
+    def stage_parse_value(clock):
+        values = state["values"]
+        for value in values:
+            parse_value(value)
+            clock.first()
+        return len(values), state["values_bytes"]
+
+    def stage_convert(clock):
+        text = convert_to_toml_format(state["blocks"])
+        clock.first()
+        state["toml"] = text
+        return meta["lines"], len(text.encode())
+
+    def stage_translate_stream(clock):
+        with open(path, encoding="utf-8") as f:
+            ConfigTranslator().translate_stream(f, NullWriter(clock))
+        return meta["lines"], meta["bytes"]
+
+    def stage_error(clock):
+        # Время до сообщения о первой ошибке в ошибочном корпусе
+        try:
+            with open(invalid["path"], encoding="utf-8") as f:
+                for _ in ConfigTranslator().iter_blocks(f):
+                    pass
+        except (SyntaxError, ValueError) as e:
+            clock.first()
+            assert e.line_number == invalid["errors"][0][0], (e.line_number, invalid["errors"][0])
+            return e.line_number, None
+        raise AssertionError("ошибка не найдена")
+
+    def stage_parse_toml(clock):
+        # Выходной формат — тот же язык, его разбирает тот же транслятор
+        blocks = ConfigTranslator().parse(state["toml"].splitlines())
+        clock.first()
+        return state["toml"].count("\n") + 1, len(state["toml"].encode())
+
+    def stage_artifact_compile(clock):
+        data = compile_blocks(state["blocks"])
+        clock.first()
+        state["artifact"] = path[:-4] + f"-{os.getpid()}.cfgb"
+        write_artifact(state["blocks"], state["artifact"])
+        return meta["lines"], len(data)
+
+    def stage_artifact_lookup(clock):
+        with CompiledConfig(state["artifact"]) as config:
+            config.get(len(config) // 2, "n0")
+            clock.first()
+        return None, None
+
+    def stage_artifact_decode(clock):
+        with CompiledConfig(state["artifact"]) as config:
+            for _ in config:
+                clock.first()
+        size = os.path.getsize(state["artifact"])
+        os.remove(state["artifact"])
+        return meta["lines"], size
+
+    return [
+        ("tokenize", None, stage_tokenize),
+        ("parse_config", None, stage_parse_config),
+        ("parse_value", prepare_values, stage_parse_value),
+        ("convert_to_toml_format", None, stage_convert),
+        ("translate_stream", None, stage_translate_stream),
+        ("first_error", None, stage_error),
+        ("parse_toml", None, stage_parse_toml),
+        ("artifact_compile", None, stage_artifact_compile),
+        ("artifact_lookup", None, stage_artifact_lookup),
+        ("artifact_decode", None, stage_artifact_decode),
+    ]
+
+
+def measure(meta, invalid, memory):
+    """Все этапы в текущем процессе: время (memory=False) или пиковая память через tracemalloc."""
+    results = {}
+    if memory:
+        tracemalloc.start()
+    for name, prepare, stage in run_stages(meta, invalid):
+        if prepare:
+            prepare()
+        if memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        clock = Clock()
+        lines, size = stage(clock)
+        elapsed = time.perf_counter() - clock.start
+        if memory:
+            results[name] = {"peak_mb": (tracemalloc.get_traced_memory()[1] - start_memory) / (1 << 20)}
+            continue
+        results[name] = {
+            "seconds": elapsed,
+            "lines": lines,
+            "lines_per_s": lines / elapsed if lines and elapsed else None,
+            "mb_per_s": size / (1 << 20) / elapsed if size and elapsed else None,
+            "first_output_ms": clock.first_output * 1000 if clock.first_output is not None else None,
+        }
+    return results
+
+
+def run_worker(args):
+    json.dump(measure(json.loads(args.worker), json.loads(args.invalid), args.memory), sys.stdout)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench.json", help="куда записать результаты в JSON")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "config-bench"),
+                        help="каталог для сгенерированных конфигов (переиспользуются между запусками)")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="какие профили замерять")
+    parser.add_argument("--lines", type=int, default=1000000, help="строк в каждом конфиге")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--quick", action="store_true", help="маленькие конфиги для быстрой проверки")
+    parser.add_argument("--generate", metavar="PATH", help="только сгенерировать конфиг и вывести его описание")
+    parser.add_argument("--profile", default="mixed", choices=sorted(PROFILES), help="профиль для --generate")
+    parser.add_argument("--errors", type=int, default=0, help="ошибочных конструкций для --generate")
+    # Служебные параметры дочернего процесса
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--invalid", help=argparse.SUPPRESS)
+    parser.add_argument("--memory", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return
+    if args.generate:
+        json.dump(generate(args.generate, args.lines, args.profile, args.seed, args.errors), sys.stdout, indent=4)
+        print()
+        return
+
+    if args.quick:
+        args.lines = 50000
+    os.makedirs(args.workdir, exist_ok=True)
+    results = {}
+    for profile in args.profiles.split(","):
+        started = time.perf_counter()
+        meta = corpus(args.workdir, args.lines, profile, args.seed, 0)
+        # Тот же корпус с одной ошибкой в случайном месте: замеряется время до её обнаружения
+        invalid = corpus(args.workdir, args.lines, profile, args.seed, 1)
+        print(f"{profile}: {meta['lines']} lines, {meta['bytes'] / (1 << 20):.1f} MB, "
+              f"ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+        stages = {}
+        for memory in (False, True):
+            command = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(meta),
+                       "--invalid", json.dumps(invalid)]
+            output = subprocess.run(command + (["--memory"] if memory else []), capture_output=True, text=True,
+                                    check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            for name, values in json.loads(output.stdout).items():
+                stages.setdefault(name, {}).update(values)
+        for name, values in stages.items():
+            speed = f"{values['mb_per_s']:8.1f} MB/s" if values["mb_per_s"] else " " * 13
+            rate = f"{values['lines_per_s'] / 1000:9.0f}k lines/s" if values["lines_per_s"] else " " * 17
+            first = values["first_output_ms"]
+            print(f"  {name:24} {values['seconds'] * 1000:9.1f} ms {rate} {speed}  peak {values['peak_mb']:7.1f} MB"
+                  f"  first {first if first is not None else float('nan'):9.3f} ms", file=sys.stderr)
+        speed = stages["parse_config"]["mb_per_s"]
+        print(f"  parse_config {speed:.1f} MB/s, target {TARGET_PARSE_MB_S} MB/s: "
+              f"{'ok' if speed >= TARGET_PARSE_MB_S else 'BELOW TARGET'}", file=sys.stderr)
+        results[profile] = {"corpus": {key: meta[key] for key in ("lines", "bytes", "blocks")},
+                            "first_error_line": invalid["errors"][0][0], "stages": stages,
+                            "target": {"parse_config_mb_per_s": TARGET_PARSE_MB_S, "met": speed >= TARGET_PARSE_MB_S}}
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"lines": args.lines, "seed": args.seed},
+        "profiles": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,84 +1,663 @@
+import argparse
+import hashlib
+import mmap
+import os
 import re
+import struct
 import sys
-from typing import Union, Dict
+import time
+from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional, Union
 
 # Словарь для хранения констант
 constants = {}
 
-# Регулярные выражения для элементов конфигурационного языка
-patterns = {
-    "begin": r"^begin\s*$",
-    "end": r"^end\s*$",
-    "set": r"^set\s+([a-zA-Z][_a-zA-Z0-9]*)\s*=\s*(.+)\s*$",
-    "assign": r"^([a-zA-Z][_a-zA-Z0-9]*)\s*:=\s*(.+)\s*;$",
-    "string": r'^@"(.*)"$',
-    "constant_ref": r"^\?\{([a-zA-Z][_a-zA-Z0-9]*)\}$",
+NAME = r"[a-zA-Z][_a-zA-Z0-9]*"
+
+# Одно регулярное выражение на строку: альтернативы проверяются в порядке begin,
+# end, set, присваивание, а значение (число, строка @"...", ссылка ?{имя} или
+# нераспознанный текст) разбирается тем же сопоставлением. Имя последней
+# совпавшей группы сразу говорит, что это за строка и какого типа значение.
+
+
+def value_pattern(prefix, terminator):
+    """Альтернативы значения; prefix различает группы set и присваивания, terminator — «;» в конце присваивания."""
+    return (rf"(?:(?P<{prefix}number>\d+){terminator}$"
+            rf'|@"(?P<{prefix}string>.*)"{terminator}$'
+            rf"|\?\{{(?P<{prefix}ref>{NAME})\}}{terminator}$"
+            rf"|(?P<{prefix}raw>.+){terminator}$)")
+
+
+LINE_PATTERN = re.compile(
+    r"(?P<begin>begin)$"
+    r"|(?P<end>end)$"
+    rf"|set\s+(?P<set_name>{NAME})\s*=\s*" + value_pattern("set_", "") +
+    rf"|(?P<name>{NAME})\s*:=\s*" + value_pattern("", ";")
+)
+VALUE_PATTERN = re.compile(value_pattern("", ""))
+
+# Имя последней совпавшей группы -> (вид токена, тип значения, группа с именем)
+LINE_KINDS = {
+    "begin": ("begin", None, None), "end": ("end", None, None),
+    "set_number": ("set", "number", "set_name"), "set_string": ("set", "string", "set_name"),
+    "set_ref": ("set", "ref", "set_name"), "set_raw": ("set", None, "set_name"),
+    "number": ("assign", "number", "name"), "string": ("assign", "string", "name"),
+    "ref": ("assign", "ref", "name"), "raw": ("assign", None, "name"),
 }
 
+
+class Token(NamedTuple):
+    """Строка входного текста: kind — begin, end, set или assign."""
+    kind: str
+    name: Optional[str]
+    value_kind: Optional[str]  # number, string, ref или None для нераспознанного значения
+    value: Union[int, str, None]
+    line: int
+    column: int
+
+
+def tokenize(input_lines, first_line: int = 1) -> Iterator[Token]:
+    """Разбирает строки в токены за один проход; каждая строка сопоставляется один раз.
+
+    first_line — номер первой строки, если разбирается фрагмент файла.
+    """
+    match_line = LINE_PATTERN.match
+    for line_number, raw_line in enumerate(input_lines, first_line):
+        line = raw_line.strip()
+        if not line:
+            continue
+        match = match_line(line)
+        if match is None:
+            raise at_line(SyntaxError(f"Неверная строка: {line}"), line_number)
+        kind, value_kind, name_group = LINE_KINDS[match.lastgroup]
+        # Группа значения всегда последняя совпавшая
+        if value_kind is None:
+            value = None
+        elif value_kind == "number":
+            value = int(match[match.lastindex])
+        else:
+            value = match[match.lastindex]
+        yield Token(kind, name_group and match[name_group], value_kind, value,
+                    line_number, len(raw_line) - len(raw_line.lstrip()) + 1)
+
+
 def parse_value(value: str) -> Union[int, str, None]:
     """Парсит значение: число, строка или ссылка на константу."""
-    if re.match(r"^\d+$", value):  # Число
-        return int(value)
-    if re.match(patterns["string"], value):  # Строка
-        return re.match(patterns["string"], value).group(1)
-    if re.match(patterns["constant_ref"], value):  # Ссылка на константу
-        name = re.match(patterns["constant_ref"], value).group(1)
-        if name in constants:
-            return constants[name]
-        else:
-            raise ValueError(f"Неизвестная константа: {name}")
-    return None
+    match = VALUE_PATTERN.match(value)
+    if match is None or match.lastgroup == "raw":
+        return None
+    return resolve_value(match.lastgroup, int(value) if match.lastgroup == "number" else match.group(match.lastgroup))
+
+
+def at_line(error: Exception, line_number: int) -> Exception:
+    """Запоминает в исключении номер строки; текст сообщения не меняется."""
+    error.line_number = line_number
+    return error
+
+
+class ConfigTranslator:
+    """Транслятор со своей таблицей констант.
+
+    Константы, объявленные через set, видны только этому объекту, поэтому
+    несколько файлов можно транслировать независимо, в том числе из разных потоков.
+    """
+
+    def __init__(self, constants: Optional[dict] = None):
+        self.constants = {} if constants is None else constants
+
+    def resolve_value(self, value_kind: Optional[str], value: Union[int, str, None],
+                      line_number: Optional[int] = None) -> Union[int, str, None]:
+        """Значение токена; ссылка на константу заменяется её значением."""
+        if value_kind == "ref":
+            if value in self.constants:
+                return self.constants[value]
+            raise at_line(ValueError(f"Неизвестная константа: {value}"), line_number)
+        return value
+
+    def iter_blocks(self, input_lines, first_line: int = 1) -> Iterator[dict]:
+        """Выдаёт блоки по мере чтения: каждый — сразу после его строки end.
+
+        В памяти держится только текущий блок (и таблица констант), поэтому вход
+        может быть сколь угодно большим потоком строк.
+        """
+        constants = self.constants
+        resolve = self.resolve_value
+        current_dict = None
+
+        for kind, name, value_kind, value, line_number, _ in tokenize(input_lines, first_line):
+            if kind == "assign":
+                if current_dict is None:
+                    raise at_line(SyntaxError("Присваивание значения возможно только внутри 'begin ... end'."),
+                                  line_number)
+                current_dict[name] = resolve(value_kind, value, line_number) if value_kind == "ref" else value
+            elif kind == "set":
+                constants[name] = resolve(value_kind, value, line_number) if value_kind == "ref" else value
+            elif kind == "begin":
+                if current_dict is not None:
+                    raise at_line(SyntaxError("Невозможно вложить 'begin' в 'begin'."), line_number)
+                current_dict = {}
+            else:
+                if current_dict is None:
+                    raise at_line(SyntaxError("Найден 'end' без соответствующего 'begin'."), line_number)
+                yield current_dict
+                current_dict = None
+
+    def parse(self, input_lines) -> list:
+        """Парсит конфигурацию и возвращает список блоков."""
+        return list(self.iter_blocks(input_lines))
+
+    def translate(self, text: str) -> str:
+        """Текст конфигурации целиком -> текст в выходном формате."""
+        return convert_to_toml_format(self.parse(text.splitlines()))
+
+    def translate_stream(self, input_lines, out, buffer_size=64 * 1024, flush_interval=0.05, collect=None):
+        """Транслирует поток строк в out по блокам, не собирая весь вывод в памяти.
+
+        Первый блок сбрасывается сразу, дальше вывод копится до buffer_size символов
+        или flush_interval секунд. Результат совпадает с print(convert_to_toml_format(...)).
+        Если передан список collect, в него добавляются вычисленные блоки.
+        """
+        pending = []
+        pending_size = 0
+        last_flush = None
+        for block in self.iter_blocks(input_lines):
+            if collect is not None:
+                collect.append(block)
+            text = format_block(block) + "\n"
+            pending.append(text)
+            pending_size += len(text)
+            now = time.monotonic()
+            if last_flush is None or pending_size >= buffer_size or now - last_flush >= flush_interval:
+                out.write("".join(pending))
+                out.flush()
+                pending.clear()
+                pending_size = 0
+                last_flush = now
+        # Пустой результат печатается как пустая строка, как и раньше
+        out.write("".join(pending) if last_flush is not None else "\n")
+        out.flush()
+
+
+# Транслятор по умолчанию для функций уровня модуля: его таблица — это constants
+_translator = ConfigTranslator(constants)
+
+
+def resolve_value(value_kind: Optional[str], value: Union[int, str, None],
+                  line_number: Optional[int] = None) -> Union[int, str, None]:
+    """Значение токена по общей таблице constants."""
+    return _translator.resolve_value(value_kind, value, line_number)
+
+
+def iter_blocks(input_lines) -> Iterator[dict]:
+    """Блоки по мере чтения; константы копятся в общей таблице constants."""
+    return _translator.iter_blocks(input_lines)
+
 
 def parse_config(input_lines):
     """Парсит конфигурацию и возвращает структуру данных в виде словаря."""
-    result = []
-    current_dict = None
-
-    for line in input_lines:
-        line = line.strip()
-        if re.match(patterns["begin"], line):
-            if current_dict is not None:
-                raise SyntaxError("Невозможно вложить 'begin' в 'begin'.")
-            current_dict = {}
-        elif re.match(patterns["end"], line):
-            if current_dict is None:
-                raise SyntaxError("Найден 'end' без соответствующего 'begin'.")
-            result.append(current_dict)
-            current_dict = None
-        elif re.match(patterns["set"], line):
-            name, value = re.match(patterns["set"], line).groups()
-            constants[name] = parse_value(value)
-        elif re.match(patterns["assign"], line):
-            if current_dict is None:
-                raise SyntaxError("Присваивание значения возможно только внутри 'begin ... end'.")
-            name, value = re.match(patterns["assign"], line).groups()
-            current_dict[name] = parse_value(value)
-        elif line:
-            raise SyntaxError(f"Неверная строка: {line}")
-    return result
+    return _translator.parse(input_lines)
+
+
+def format_block(block: dict) -> str:
+    """Один блок в выходном формате, без завершающего перевода строки."""
+    toml_lines = ["begin"]
+    for key, value in block.items():
+        if isinstance(value, str):  # Строки
+            toml_lines.append(f'  {key} := @"{value}";')
+        else:  # Числа
+            toml_lines.append(f"  {key} := {value};")
+    toml_lines.append("end")
+    return "\n".join(toml_lines)
+
 
 def convert_to_toml_format(data: list) -> str:
     """Преобразует список блоков данных в формат TOML с соблюдением правил."""
-    toml_lines = []
-    for block in data:
-        toml_lines.append("begin")
+    return "\n".join(format_block(block) for block in data)
+
+
+def translate_stream(input_lines, out, buffer_size=64 * 1024, flush_interval=0.05):
+    """Потоковая трансляция с общей таблицей constants; см. ConfigTranslator.translate_stream."""
+    _translator.translate_stream(input_lines, out, buffer_size, flush_interval)
+
+
+class _TrackingTranslator(ConfigTranslator):
+    """Транслятор фрагмента: свои set пишет в effects, внешние константы читает из base.
+
+    В deps запоминаются внешние константы, которые фрагмент прочитал, с их значениями.
+    """
+
+    def __init__(self, base: dict):
+        self.effects = {}
+        self.deps = {}
+        self.base = base
+        super().__init__(ChainMap(self.effects, base))
+
+    def resolve_value(self, value_kind, value, line_number=None):
+        if value_kind == "ref" and value not in self.effects and value in self.base:
+            self.deps[value] = self.base[value]
+        return super().resolve_value(value_kind, value, line_number)
+
+
+class _Chunk(NamedTuple):
+    blocks: tuple  # готовые блоки в выходном формате
+    deps: dict  # имя внешней константы -> прочитанное значение
+    effects: dict  # константы, объявленные фрагментом
+
+
+def split_chunks(lines) -> Iterator[tuple]:
+    """Делит строки на фрагменты (номер первой строки, строки), каждый до строки end включительно.
+
+    Между фрагментами блок всегда закрыт, поэтому результат фрагмента зависит
+    только от его текста и таблицы констант перед ним.
+    """
+    start = 0
+    for i, line in enumerate(lines):
+        if line.strip() == "end":
+            yield start + 1, lines[start:i + 1]
+            start = i + 1
+    if start < len(lines):
+        yield start + 1, lines[start:]
+
+
+class IncrementalTranslator:
+    """Повторная трансляция изменяющегося текста с кэшем по фрагментам.
+
+    Фрагмент берётся из кэша (ключ — хэш его текста), если все прочитанные им
+    внешние константы имеют те же значения; иначе он транслируется заново.
+    Результат совпадает с полной трансляцией того же текста.
+    """
+
+    def __init__(self):
+        self.cache = {}
+        self.translated = 0  # фрагментов оттранслировано при последнем update
+        self.reused = 0
+
+    def update(self, text: str) -> str:
+        """Текст конфигурации целиком -> текст в выходном формате, как у ConfigTranslator.translate."""
+        cache = {}
+        constants = {}
+        blocks = []
+        translated = reused = 0
+        for first_line, lines in split_chunks(text.splitlines()):
+            key = hashlib.blake2b("\n".join(lines).encode(), digest_size=16).digest()
+            chunk = self.cache.get(key) or cache.get(key)
+            if chunk is not None and all(name in constants and constants[name] == value
+                                         for name, value in chunk.deps.items()):
+                reused += 1
+            else:
+                translator = _TrackingTranslator(constants)
+                chunk_blocks = tuple(format_block(block) for block in translator.iter_blocks(lines, first_line))
+                chunk = _Chunk(chunk_blocks, translator.deps, translator.effects)
+                translated += 1
+            constants.update(chunk.effects)
+            blocks.extend(chunk.blocks)
+            cache[key] = chunk
+        # Кэш содержит только фрагменты текущей версии текста
+        self.cache = cache
+        self.translated, self.reused = translated, reused
+        return "\n".join(blocks)
+
+
+def watch(source, target, interval=0.5, polls=None):
+    """Следит за файлом source и при каждом изменении перезаписывает target.
+
+    Изменение определяется по времени модификации и размеру. Ошибки печатаются
+    в stderr, target при этом остаётся прежним. polls ограничивает число проверок.
+    """
+    translator = IncrementalTranslator()
+    seen = None
+    poll = 0
+    while polls is None or poll < polls:
+        if poll:
+            time.sleep(interval)
+        poll += 1
+        try:
+            stat = os.stat(source)
+        except OSError as e:
+            print(f"Ошибка: {e}", file=sys.stderr)
+            continue
+        if (stat.st_mtime_ns, stat.st_size) == seen:
+            continue
+        seen = stat.st_mtime_ns, stat.st_size
+        started = time.perf_counter()
+        try:
+            with open(source, encoding="utf-8") as f:
+                output = translator.update(f.read())
+        except Exception as e:
+            print(format_error(e), file=sys.stderr)
+            continue
+        tmp_path = str(target) + ".part"
+        with open(tmp_path, "w", encoding="utf-8") as out:
+            out.write(output + "\n")
+        os.replace(tmp_path, target)
+        print(f"{target}: фрагментов оттранслировано {translator.translated}, из кэша {translator.reused} "
+              f"за {(time.perf_counter() - started) * 1000:.1f} мс", file=sys.stderr)
+
+
+# Скомпилированный артефакт (.cfgb): вычисленные блоки в двоичном виде, little-endian.
+#   заголовок   ARTIFACT_HEADER
+#   строки      смещения (число строк + 1) x u64, затем UTF-8 подряд; строки
+#               уникальны и отсортированы по байтам, так что id ищется бинарным поиском
+#   блоки       у каждого u32 число полей, затем поля ARTIFACT_FIELD
+#   индекс      смещение каждого блока, u64
+#   ключи       пары (id ключа, номер блока) по u32, отсортированные
+ARTIFACT_MAGIC = b"CFGB"
+ARTIFACT_VERSION = 1
+ARTIFACT_HEADER = struct.Struct("<4sHHIII4xQQQ")  # magic, версия, флаги, блоков, строк, пар ключей, смещения
+ARTIFACT_FIELD = struct.Struct("<IBq")  # id ключа, тип значения, число или id строки
+ARTIFACT_COUNT = struct.Struct("<I")
+ARTIFACT_OFFSET = struct.Struct("<Q")
+ARTIFACT_PAIR = struct.Struct("<II")
+TAG_NONE, TAG_INT, TAG_STRING, TAG_BIG_INT = range(4)
+INT64_MAX = 2 ** 63 - 1
+
+
+def compile_blocks(blocks) -> bytes:
+    """Список вычисленных блоков -> байты артефакта."""
+    strings = set()
+    for block in blocks:
         for key, value in block.items():
-            if isinstance(value, str):  # Строки
-                toml_lines.append(f'  {key} := @"{value}";')
-            else:  # Числа
-                toml_lines.append(f"  {key} := {value};")
-        toml_lines.append("end")
-    return "\n".join(toml_lines)
+            strings.add(key)
+            if isinstance(value, str):
+                strings.add(value)
+            elif isinstance(value, int) and value > INT64_MAX:
+                strings.add(str(value))
+    encoded = sorted(string.encode("utf-8") for string in strings)
+    ids = {data.decode("utf-8"): i for i, data in enumerate(encoded)}
+
+    out = bytearray(ARTIFACT_HEADER.size)
+    strings_offset = len(out)
+    position = 0
+    for data in encoded:
+        out += ARTIFACT_OFFSET.pack(position)
+        position += len(data)
+    out += ARTIFACT_OFFSET.pack(position)
+    out += b"".join(encoded)
+
+    offsets = []
+    pairs = set()
+    for number, block in enumerate(blocks):
+        offsets.append(len(out))
+        out += ARTIFACT_COUNT.pack(len(block))
+        for key, value in block.items():
+            if value is None:
+                tag, payload = TAG_NONE, 0
+            elif isinstance(value, str):
+                tag, payload = TAG_STRING, ids[value]
+            elif value > INT64_MAX:
+                # Числа в языке неотрицательные, но могут не помещаться в 64 бита
+                tag, payload = TAG_BIG_INT, ids[str(value)]
+            else:
+                tag, payload = TAG_INT, value
+            out += ARTIFACT_FIELD.pack(ids[key], tag, payload)
+            pairs.add((ids[key], number))
+    index_offset = len(out)
+    out += b"".join(ARTIFACT_OFFSET.pack(offset) for offset in offsets)
+    keys_offset = len(out)
+    out += b"".join(ARTIFACT_PAIR.pack(*pair) for pair in sorted(pairs))
+    ARTIFACT_HEADER.pack_into(out, 0, ARTIFACT_MAGIC, ARTIFACT_VERSION, 0, len(blocks), len(encoded), len(pairs),
+                              strings_offset, index_offset, keys_offset)
+    return bytes(out)
+
+
+def write_artifact(blocks, path):
+    """Записывает артефакт атомарно: через временный файл."""
+    tmp_path = str(path) + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(compile_blocks(blocks))
+    os.replace(tmp_path, path)
+
+
+class ArtifactError(ValueError):
+    """Файл не является артефактом поддерживаемой версии."""
+
+
+class CompiledConfig:
+    """Артефакт, отображённый в память; значения декодируются только при обращении.
+
+        with CompiledConfig("config.cfgb") as config:
+            config[0]                 # блок целиком
+            config.get(0, "port")     # одно значение без разбора остальных полей
+            config.find("port")       # номера блоков, где есть ключ
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.buffer) < ARTIFACT_HEADER.size:
+            self.buffer.close()
+            raise ArtifactError(f"Слишком короткий файл: {path}")
+        (magic, version, _, self.block_count, self.string_count, self.pair_count,
+         self.strings_offset, self.index_offset, self.keys_offset) = ARTIFACT_HEADER.unpack_from(self.buffer)
+        if magic != ARTIFACT_MAGIC:
+            self.buffer.close()
+            raise ArtifactError(f"Файл не является артефактом: {path}")
+        if version != ARTIFACT_VERSION:
+            self.buffer.close()
+            raise ArtifactError(f"Неподдерживаемая версия артефакта {version}: {path}")
+        self.data_offset = self.strings_offset + (self.string_count + 1) * ARTIFACT_OFFSET.size
+        self.strings = {}  # id -> уже декодированная строка
+
+    def close(self):
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
 
-def main():
-    # Считываем входные данные из stdin
-    input_lines = sys.stdin.readlines()
+    def __len__(self):
+        return self.block_count
+
+    def string(self, string_id: int) -> str:
+        string = self.strings.get(string_id)
+        if string is None:
+            start, end = struct.unpack_from("<QQ", self.buffer, self.strings_offset + string_id * ARTIFACT_OFFSET.size)
+            string = self.strings[string_id] = self.buffer[self.data_offset + start:self.data_offset + end].decode()
+        return string
+
+    def string_id(self, string: str) -> Optional[int]:
+        """id строки бинарным поиском по отсортированной таблице или None."""
+        data = string.encode("utf-8")
+        low, high = 0, self.string_count
+        while low < high:
+            middle = (low + high) // 2
+            start, end = struct.unpack_from("<QQ", self.buffer, self.strings_offset + middle * ARTIFACT_OFFSET.size)
+            current = self.buffer[self.data_offset + start:self.data_offset + end]
+            if current == data:
+                return middle
+            if current < data:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def block_offset(self, position: int) -> int:
+        if position < 0:
+            position += self.block_count
+        if not 0 <= position < self.block_count:
+            raise IndexError("Номер блока вне диапазона")
+        return ARTIFACT_OFFSET.unpack_from(self.buffer, self.index_offset + position * ARTIFACT_OFFSET.size)[0]
+
+    def value(self, tag: int, payload: int) -> Union[int, str, None]:
+        if tag == TAG_INT:
+            return payload
+        if tag == TAG_STRING:
+            return self.string(payload)
+        if tag == TAG_BIG_INT:
+            return int(self.string(payload))
+        return None
+
+    def fields(self, position: int) -> Iterator[tuple]:
+        """(id ключа, тип, значение) полей блока без декодирования строк."""
+        offset = self.block_offset(position)
+        count = ARTIFACT_COUNT.unpack_from(self.buffer, offset)[0]
+        return ARTIFACT_FIELD.iter_unpack(self.buffer[offset + ARTIFACT_COUNT.size:
+                                                      offset + ARTIFACT_COUNT.size + count * ARTIFACT_FIELD.size])
+
+    def __getitem__(self, position: int) -> dict:
+        return {self.string(key): self.value(tag, payload) for key, tag, payload in self.fields(position)}
+
+    def __iter__(self):
+        # Полный обход: строки декодируются разом, блоки читаются подряд без индекса
+        count = self.string_count
+        offsets = struct.unpack_from(f"<{count + 1}Q", self.buffer, self.strings_offset)
+        data = self.buffer[self.data_offset:self.data_offset + offsets[-1]]
+        strings = [data[offsets[i]:offsets[i + 1]].decode() for i in range(count)]
+        unpack_count = ARTIFACT_COUNT.unpack_from
+        iter_fields = ARTIFACT_FIELD.iter_unpack
+        buffer = self.buffer
+        offset = self.data_offset + offsets[-1]
+        for _ in range(self.block_count):
+            end = offset + ARTIFACT_COUNT.size + unpack_count(buffer, offset)[0] * ARTIFACT_FIELD.size
+            block = {}
+            for key, tag, payload in iter_fields(buffer[offset + ARTIFACT_COUNT.size:end]):
+                if tag == TAG_INT:
+                    block[strings[key]] = payload
+                elif tag == TAG_STRING:
+                    block[strings[key]] = strings[payload]
+                else:
+                    block[strings[key]] = int(strings[payload]) if tag == TAG_BIG_INT else None
+            yield block
+            offset = end
+
+    def get(self, position: int, key: str, default=None):
+        """Значение ключа в блоке; декодируется только оно."""
+        key_id = self.string_id(key)
+        if key_id is not None:
+            for field_key, tag, payload in self.fields(position):
+                if field_key == key_id:
+                    return self.value(tag, payload)
+        else:
+            self.block_offset(position)  # номер блока проверяется, даже если ключа нет ни в одном блоке
+        return default
+
+    def find(self, key: str) -> list:
+        """Номера блоков, в которых есть ключ, по возрастанию."""
+        key_id = self.string_id(key)
+        if key_id is None:
+            return []
+        low, high = 0, self.pair_count
+        while low < high:
+            middle = (low + high) // 2
+            if ARTIFACT_PAIR.unpack_from(self.buffer, self.keys_offset + middle * ARTIFACT_PAIR.size)[0] < key_id:
+                low = middle + 1
+            else:
+                high = middle
+        positions = []
+        for pair_key, block in ARTIFACT_PAIR.iter_unpack(self.buffer[self.keys_offset + low * ARTIFACT_PAIR.size:
+                                                                     self.keys_offset + self.pair_count *
+                                                                     ARTIFACT_PAIR.size]):
+            if pair_key != key_id:
+                break
+            positions.append(block)
+        return positions
+
+
+def format_error(e: Exception) -> str:
+    line_number = getattr(e, "line_number", None)
+    if line_number is not None:
+        return f"Ошибка в строке {line_number}: {e}"
+    return f"Ошибка: {e}"
+
+
+def translate_file(job):
+    """Транслирует один файл (source, target, artifact) свежим транслятором; возвращает текст ошибки или None.
+
+    Результат сначала пишется во временный файл, так что при ошибке target не появляется.
+    Если artifact истинно, рядом с target пишется артефакт с расширением .cfgb.
+    """
+    source, target, artifact = job
+    tmp_path = target + ".part"
+    blocks = [] if artifact else None
     try:
-        config_data = parse_config(input_lines)
-        toml_output = convert_to_toml_format(config_data)
-        print(toml_output)
+        with open(source, encoding="utf-8") as f, open(tmp_path, "w", encoding="utf-8") as out:
+            ConfigTranslator().translate_stream(f, out, flush_interval=float("inf"), collect=blocks)
+        if artifact:
+            write_artifact(blocks, Path(target).with_suffix(".cfgb"))
+        os.replace(tmp_path, target)
+        return None
     except Exception as e:
-        print(f"Ошибка: {e}", file=sys.stderr)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return format_error(e)
+
+
+def translate_directory(source_dir, output_dir, pattern="*.txt", jobs=None, artifacts=False):
+    """Транслирует все файлы source_dir, подходящие под pattern, в output_dir пулом процессов.
+
+    Каталоги повторяются, расширение заменяется на .toml (и .cfgb для артефактов). Возвращает список
+    (относительный путь, текст ошибки) в порядке имён файлов; пустой — если ошибок нет.
+    """
+    source_dir = Path(source_dir)
+    sources = sorted(path for path in source_dir.rglob(pattern) if path.is_file())
+    relative = [path.relative_to(source_dir) for path in sources]
+    jobs_list = []
+    for path, rel in zip(sources, relative):
+        target = Path(output_dir) / rel.with_suffix(".toml")
+        target.parent.mkdir(parents=True, exist_ok=True)
+        jobs_list.append((str(path), str(target), artifacts))
+
+    workers = jobs or os.cpu_count() or 1
+    if workers == 1 or len(jobs_list) <= 1:
+        results = map(translate_file, jobs_list)
+        return [(str(rel), error) for rel, error in zip(relative, results) if error]
+    # Файлы маленькие, поэтому отдаём их процессам пачками, а не по одному
+    chunksize = max(1, len(jobs_list) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(translate_file, jobs_list, chunksize=chunksize)
+        return [(str(rel), error) for rel, error in zip(relative, results) if error]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Трансляция учебного конфигурационного языка.")
+    parser.add_argument("--batch", metavar="DIR", help="транслировать все файлы каталога вместо stdin")
+    parser.add_argument("--watch", metavar="FILE", help="следить за файлом и перетранслировать его при изменениях")
+    parser.add_argument("-o", "--output", help="каталог результатов для --batch (output) или файл для --watch "
+                                               "(по умолчанию FILE с расширением .toml)")
+    parser.add_argument("--pattern", default="*.txt", help="какие файлы каталога транслировать")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="число процессов (по умолчанию — число ядер)")
+    parser.add_argument("--artifact", nargs="?", const="", metavar="PATH",
+                        help="записать и скомпилированный артефакт: в PATH при чтении stdin, "
+                             "рядом с каждым .toml в режиме --batch")
+    parser.add_argument("--interval", type=float, default=0.5, help="период проверки файла в режиме --watch, с")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.batch:
+        errors = translate_directory(args.batch, args.output or "output", args.pattern, args.jobs,
+                                     artifacts=args.artifact is not None)
+        for path, error in errors:
+            print(f"{path}: {error}", file=sys.stderr)
+        if errors:
+            print(f"Файлов с ошибками: {len(errors)}", file=sys.stderr)
+            return 1
+        return 0
+    if args.watch:
+        try:
+            watch(args.watch, args.output or Path(args.watch).with_suffix(".toml"), args.interval)
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.artifact == "":
+        print("Ошибка: для чтения из stdin укажите путь артефакта: --artifact PATH", file=sys.stderr)
+        return 2
+    # Читаем stdin построчно и печатаем блоки по мере готовности
+    blocks = [] if args.artifact else None
+    try:
+        ConfigTranslator().translate_stream(sys.stdin, sys.stdout, collect=blocks)
+        if args.artifact:
+            write_artifact(blocks, args.artifact)
+    except Exception as e:
+        print(format_error(e), file=sys.stderr)
+        return 1
+    return 0
+
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
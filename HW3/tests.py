@@ -1,9 +1,18 @@
+import os
+import random
+import tempfile
+import threading
+import tracemalloc
 import unittest
+from unittest.mock import patch
 from io import StringIO
 from contextlib import redirect_stdout
 
 # Импортируем функции и переменные из основного файла
-from ta3 import parse_config, convert_to_toml_format, constants
+from main import (parse_config, convert_to_toml_format, constants, tokenize, Token, translate_stream,
+                  ConfigTranslator, IncrementalTranslator, translate_directory, watch,
+                  CompiledConfig, ArtifactError, compile_blocks, write_artifact)
+import main
 
 class TestConfigParser(unittest.TestCase):
 
@@ -148,6 +157,450 @@ end"""
         self.assertEqual(self.run_parser(input_lines), expected_output)
 
 
+class TestAcceptedLanguage(unittest.TestCase):
+    """Фиксирует принимаемый язык, включая пограничные случаи, чтобы смена парсера его не меняла."""
+
+    CASES = [
+        (["begin", "  x := 5 ;", "end"], "begin\n  x := None;\nend"),
+        (["begin", "  x :=   ;", "end"], "begin\n  x := None;\nend"),
+        (["begin", "  x:=;", "end"], SyntaxError("Неверная строка: x:=;")),
+        (["begin", "  x := 1;2;", "end"], "begin\n  x := None;\nend"),
+        (["begin", '  s := @"a"b";', "end"], 'begin\n  s := @"a"b";\nend'),
+        (["begin", '  s := @"";', "end"], 'begin\n  s := @"";\nend'),
+        (["begin", "  n := 007;", "end"], "begin\n  n := 7;\nend"),
+        (["begin", "  n := -1;", "end"], "begin\n  n := None;\nend"),
+        (["set pi = 3.14", "begin", "  p := ?{pi};", "end"], "begin\n  p := None;\nend"),
+        (["set x = 1;", "begin", "  p := ?{x};", "end"], "begin\n  p := None;\nend"),
+        (["set x=1", "set y =?{x}", "begin", "  a:=?{y};", "end"], "begin\n  a := 1;\nend"),
+        (["setx = 1"], SyntaxError("Неверная строка: setx = 1")),
+        (["set := 5;"], SyntaxError("Присваивание значения возможно только внутри 'begin ... end'.")),
+        (["begin", "  set := 5;", "end"], "begin\n  set := 5;\nend"),
+        (["begin", "  set y = 2", "  y := ?{y};", "end"], "begin\n  y := 2;\nend"),
+        (["  begin  \n", "\tk := 1;\t\n", "end\r\n"], "begin\n  k := 1;\nend"),
+        (["BEGIN"], SyntaxError("Неверная строка: BEGIN")),
+        (["begin", "  a := 1;"], ""),
+        (["begin", "  _a := 1;", "end"], SyntaxError("Неверная строка: _a := 1;")),
+        (["begin", "  a := ?{ x };", "end"], "begin\n  a := None;\nend"),
+        (["begin", "  a := 1;", "  a := 2;", "end"], "begin\n  a := 2;\nend"),
+        (["begin", "end"], "begin\nend"),
+        (["begin", "  x := ?{missing};", "begin"], ValueError("Неизвестная константа: missing")),
+        (["  x := ?{missing};"], SyntaxError("Присваивание значения возможно только внутри 'begin ... end'.")),
+        (["begin", '  k := @"семь";', "  ключ := 1;", "end"], SyntaxError("Неверная строка: ключ := 1;")),
+    ]
+
+    def test_cases(self):
+        for lines, expected in self.CASES:
+            with self.subTest(lines=lines):
+                constants.clear()
+                if isinstance(expected, Exception):
+                    with self.assertRaises(type(expected)) as context:
+                        convert_to_toml_format(parse_config(lines))
+                    self.assertEqual(str(context.exception), str(expected))
+                else:
+                    self.assertEqual(convert_to_toml_format(parse_config(lines)), expected)
+
+    def test_token_positions(self):
+        tokens = list(tokenize(["set n = 5\n", "\n", "begin\n", '    s := @"x";\n', "  r := ?{n};\n", "end\n"]))
+        self.assertEqual(tokens, [
+            Token("set", "n", "number", 5, 1, 1),
+            Token("begin", None, None, None, 3, 1),
+            Token("assign", "s", "string", "x", 4, 5),
+            Token("assign", "r", "ref", "n", 5, 3),
+            Token("end", None, None, None, 6, 1),
+        ])
+
+    def test_large_config(self):
+        # Скорость разбора замеряется в bench.py, здесь — только правильность на большом входе
+        lines = []
+        for block in range(20000):
+            lines.append(f"set c{block} = {block}\n")
+            lines.append("begin\n")
+            for key in range(5):
+                lines.append(f'  key{key} := @"value {key} of block {block}";\n' if key % 2 else f"  key{key} := ?{{c{block}}};\n")
+            lines.append("end\n")
+        constants.clear()
+        blocks = parse_config(lines)
+        self.assertEqual(len(blocks), 20000)
+        self.assertEqual(blocks[12345], {"key0": 12345, "key1": "value 1 of block 12345", "key2": 12345,
+                                         "key3": "value 3 of block 12345", "key4": 12345})
+
+
+class TestStreaming(unittest.TestCase):
+
+    class Recorder(StringIO):
+        """Вывод, который запоминает, сколько строк входа было прочитано к первой записи."""
+
+        def __init__(self, consumed):
+            super().__init__()
+            self.consumed = consumed
+            self.first_write = None
+
+        def write(self, text):
+            if self.first_write is None:
+                self.first_write = self.consumed[0]
+            return super().write(text)
+
+    def blocks(self, count, consumed=None):
+        for block in range(count):
+            for line in ("begin\n", f"  id := {block};\n", '  name := @"service";\n', "end\n"):
+                if consumed is not None:
+                    consumed[0] += 1
+                yield line
+
+    def test_same_output_as_batch(self):
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "input2.txt")) as f:
+            example = f.readlines()
+        for lines in ([], ["set a = 1\n"], example, list(self.blocks(50))):
+            constants.clear()
+            expected = convert_to_toml_format(parse_config(lines)) + "\n"
+            constants.clear()
+            out = StringIO()
+            translate_stream(iter(lines), out)
+            self.assertEqual(out.getvalue(), expected)
+
+    def test_first_block_written_immediately(self):
+        consumed = [0]
+        out = self.Recorder(consumed)
+        translate_stream(self.blocks(1000, consumed), out)
+        self.assertEqual(out.first_write, 4)
+        self.assertEqual(out.getvalue().count("begin"), 1000)
+
+    def test_memory_bounded_by_block(self):
+        class Null:
+            def write(self, text):
+                pass
+
+            def flush(self):
+                pass
+        tracemalloc.start()
+        try:
+            translate_stream(self.blocks(20000), Null())
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        # Вход около 1 МБ; в памяти должны быть только текущий блок и буфер вывода
+        self.assertLess(peak, 512 * 1024)
+
+    def test_error_line_numbers(self):
+        for lines, message in (
+            (["begin", "  a := 1;", "end", "", "oops"], "Ошибка в строке 5: Неверная строка: oops"),
+            (["begin", "  a := ?{nope};"], "Ошибка в строке 2: Неизвестная константа: nope"),
+            (["set a = 1", "end"], "Ошибка в строке 2: Найден 'end' без соответствующего 'begin'."),
+            (["begin", "begin"], "Ошибка в строке 2: Невозможно вложить 'begin' в 'begin'."),
+        ):
+            constants.clear()
+            stdout, stderr = StringIO(), StringIO()
+            with patch("sys.stdin", StringIO("\n".join(lines) + "\n")), patch("sys.stdout", stdout), \
+                    patch("sys.stderr", stderr):
+                main.main([])
+            self.assertEqual(stderr.getvalue().strip(), message)
+
+
+class TestConfigTranslator(unittest.TestCase):
+
+    def test_constants_isolated(self):
+        first, second = ConfigTranslator(), ConfigTranslator()
+        first.parse(["set x = 1"])
+        self.assertEqual(first.constants, {"x": 1})
+        self.assertEqual(second.constants, {})
+        with self.assertRaises(ValueError):
+            second.parse(["begin", "  a := ?{x};", "end"])
+
+    def test_module_functions_share_constants(self):
+        # Функции уровня модуля по-прежнему работают через общую таблицу constants
+        constants.clear()
+        parse_config(["set x = 5"])
+        self.assertEqual(constants, {"x": 5})
+        self.assertEqual(parse_config(["begin", "  a := ?{x};", "end"]), [{"a": 5}])
+        self.assertEqual(ConfigTranslator().constants, {})
+
+    def test_concurrent_threads(self):
+        results = {}
+
+        def run(i):
+            text = "".join(f"set c = {i}\nbegin\n  v := ?{{c}};\nend\n" for _ in range(2000))
+            results[i] = ConfigTranslator().translate(text)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(4):
+            self.assertEqual(results[i], "\n".join([f"begin\n  v := {i};\nend"] * 2000))
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "configs")
+        self.output = os.path.join(self.tmp.name, "out")
+        os.makedirs(os.path.join(self.source, "nested"))
+        self.files = {
+            "a.txt": "set x = 1\nbegin\n  a := ?{x};\nend\n",
+            # Константа x из a.txt в b.txt не видна
+            "b.txt": "begin\n  b := ?{x};\nend\n",
+            "nested/c.txt": 'begin\n  c := @"text";\nend\n',
+            "z.txt": "begin\noops\n",
+            "skip.md": "не конфигурация",
+        }
+        for name, text in self.files.items():
+            with open(os.path.join(self.source, name), "w") as f:
+                f.write(text)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def check(self, errors):
+        self.assertEqual(errors, [("b.txt", "Ошибка в строке 2: Неизвестная константа: x"),
+                                  ("z.txt", "Ошибка в строке 2: Неверная строка: oops")])
+        with open(os.path.join(self.output, "a.toml")) as f:
+            self.assertEqual(f.read(), "begin\n  a := 1;\nend\n")
+        with open(os.path.join(self.output, "nested", "c.toml")) as f:
+            self.assertEqual(f.read(), 'begin\n  c := @"text";\nend\n')
+        # Файлы с ошибками не оставляют ни результата, ни временных файлов
+        self.assertEqual(sorted(os.listdir(self.output)), ["a.toml", "nested"])
+
+    def test_serial(self):
+        self.check(translate_directory(self.source, self.output, jobs=1))
+
+    def test_process_pool(self):
+        self.check(translate_directory(self.source, self.output, jobs=2))
+
+    def test_cli_report(self):
+        stderr = StringIO()
+        with patch("sys.stderr", stderr):
+            code = main.main(["--batch", self.source, "-o", self.output, "-j", "2"])
+        self.assertEqual(code, 1)
+        self.assertEqual(stderr.getvalue().splitlines(), [
+            "b.txt: Ошибка в строке 2: Неизвестная константа: x",
+            "z.txt: Ошибка в строке 2: Неверная строка: oops",
+            "Файлов с ошибками: 2",
+        ])
+
+
+class TestIncremental(unittest.TestCase):
+    NAMES = ["a", "b", "c", "d"]
+
+    def random_value(self, rng):
+        return rng.choice([str(rng.randrange(100)), f'@"s{rng.randrange(5)}"',
+                           "?{%s}" % rng.choice(self.NAMES), "?{%s}" % rng.choice(self.NAMES), "oops"])
+
+    def random_line(self, rng):
+        roll = rng.random()
+        if roll < 0.05:
+            return rng.choice(["begin", "end", "", "bad line"])
+        if roll < 0.35:
+            return f"set {rng.choice(self.NAMES)} = {self.random_value(rng)}"
+        return f"  k{rng.randrange(4)} := {self.random_value(rng)};"
+
+    def random_config(self, rng, blocks):
+        lines = [f"set {name} = {i}" for i, name in enumerate(self.NAMES)]
+        for _ in range(blocks):
+            if rng.random() < 0.3:
+                lines.append(f"set {rng.choice(self.NAMES)} = {self.random_value(rng)}")
+            lines.append("begin")
+            lines.extend(f"  k{i} := {self.random_value(rng)};" for i in range(rng.randrange(1, 4)))
+            lines.append("end")
+        return lines
+
+    def edit(self, rng, lines):
+        position = rng.randrange(len(lines) + 1)
+        roll = rng.random()
+        if roll < 0.15 and lines:
+            del lines[min(position, len(lines) - 1)]
+        elif roll < 0.3:
+            lines.insert(position, self.random_line(rng))
+        elif roll < 0.4:
+            start = rng.randrange(len(lines) + 1)
+            lines[position:position] = lines[start:start + rng.randrange(1, 8)]
+        else:
+            # Правка значения в существующей строке set или присваивания
+            candidates = [i for i, line in enumerate(lines) if ":=" in line or line.startswith("set ")]
+            if candidates:
+                i = rng.choice(candidates)
+                head = lines[i].split("=")[0] + "=" if lines[i].startswith("set ") else lines[i].split(":=")[0] + ":="
+                lines[i] = head + " " + self.random_value(rng) + (";" if ":=" in head else "")
+
+    @staticmethod
+    def outcome(translate, text):
+        try:
+            return translate(text)
+        except (SyntaxError, ValueError) as e:
+            return type(e), str(e), e.line_number
+
+    def test_random_edits_match_full_run(self):
+        checked = valid = 0
+        for seed in range(20):
+            rng = random.Random(seed)
+            lines = self.random_config(rng, 30)
+            previous = list(lines)
+            incremental = IncrementalTranslator()
+            for _ in range(60):
+                text = "\n".join(lines)
+                expected = self.outcome(lambda t: ConfigTranslator().translate(t), text)
+                self.assertEqual(self.outcome(incremental.update, text), expected, f"seed {seed}")
+                checked += 1
+                valid += isinstance(expected, str)
+                if isinstance(expected, str):
+                    previous = list(lines)
+                elif rng.random() < 0.5:
+                    # Ошибку обычно сразу исправляют: возвращаемся к последней корректной версии
+                    lines = list(previous)
+                self.edit(rng, lines)
+        # Последовательности должны проходить и через корректные, и через ошибочные версии
+        self.assertGreater(valid, checked // 10)
+        self.assertLess(valid, checked)
+
+    def test_only_changed_and_dependent_chunks(self):
+        lines = ["set x = 1", "begin", "  a := ?{x};", "end",
+                 "begin", "  b := 2;", "end",
+                 "begin", "  c := ?{x};", "end",
+                 "begin", "  d := @\"s\";", "end"]
+        incremental = IncrementalTranslator()
+        incremental.update("\n".join(lines))
+        self.assertEqual((incremental.translated, incremental.reused), (4, 0))
+
+        lines[5] = "  b := 3;"
+        self.assertEqual(incremental.update("\n".join(lines)), ConfigTranslator().translate("\n".join(lines)))
+        self.assertEqual((incremental.translated, incremental.reused), (1, 3))
+
+        # Новое значение x: его фрагмент и блок c, который читает x
+        lines[0] = "set x = 5"
+        self.assertEqual(incremental.update("\n".join(lines)), ConfigTranslator().translate("\n".join(lines)))
+        self.assertEqual((incremental.translated, incremental.reused), (2, 2))
+
+        # Тот же x, заданный через другую константу, ничего не меняет в блоке c
+        lines[0:1] = ["set y = 5", "set x = ?{y}"]
+        incremental.update("\n".join(lines))
+        self.assertEqual((incremental.translated, incremental.reused), (1, 3))
+
+    def test_error_line_numbers(self):
+        incremental = IncrementalTranslator()
+        incremental.update("begin\n  a := 1;\nend\nbegin\n  b := 2;\nend")
+        with self.assertRaises(SyntaxError) as context:
+            incremental.update("begin\n  a := 1;\nend\nbegin\n  b := 2;\n  oops\nend")
+        self.assertEqual(context.exception.line_number, 6)
+
+    def test_watch_writes_output(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source, target = os.path.join(tmp, "config.txt"), os.path.join(tmp, "config.toml")
+            with open(source, "w") as f:
+                f.write("set x = 1\nbegin\n  a := ?{x};\nend\n")
+            with patch("sys.stderr", StringIO()):
+                watch(source, target, polls=1)
+            with open(target) as f:
+                self.assertEqual(f.read(), "begin\n  a := 1;\nend\n")
+
+
+class TestArtifact(unittest.TestCase):
+    BLOCKS = [
+        {"name": "server", "port": 8080, "note": None},
+        {"name": "клиент", "big": 2 ** 70, "zero": 0},
+        {},
+        {"port": 9000, "name": "server", "empty": ""},
+    ]
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "config.cfgb")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip(self):
+        write_artifact(self.BLOCKS, self.path)
+        with CompiledConfig(self.path) as config:
+            self.assertEqual(len(config), 4)
+            self.assertEqual(list(config), self.BLOCKS)
+            # Порядок ключей в блоке сохраняется
+            self.assertEqual(list(config[3]), ["port", "name", "empty"])
+            self.assertEqual(config[-1], self.BLOCKS[-1])
+        write_artifact([], self.path)
+        with CompiledConfig(self.path) as config:
+            self.assertEqual(list(config), [])
+
+    def test_lookup(self):
+        write_artifact(self.BLOCKS, self.path)
+        with CompiledConfig(self.path) as config:
+            self.assertEqual(config.get(0, "port"), 8080)
+            self.assertEqual(config.get(1, "big"), 2 ** 70)
+            self.assertIsNone(config.get(0, "note", "default"))
+            self.assertEqual(config.get(2, "port", "default"), "default")
+            self.assertEqual(config.get(0, "missing", 1), 1)
+            self.assertEqual(config.find("port"), [0, 3])
+            self.assertEqual(config.find("name"), [0, 1, 3])
+            self.assertEqual(config.find("missing"), [])
+            # Прочитаны только строки, нужные для ответов, а не вся таблица
+            self.assertNotIn("клиент", config.strings.values())
+            with self.assertRaises(IndexError):
+                config[4]
+            with self.assertRaises(IndexError):
+                config.get(10, "missing")
+
+    def test_strings_interned(self):
+        block = {"key": "длинная строка " * 100}
+        single, repeated = compile_blocks([block]), compile_blocks([block] * 50)
+        self.assertLess(len(repeated) - len(single), 50 * 40)
+
+    def test_rejects_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"begin\nend\n" * 10)
+        with self.assertRaises(ArtifactError):
+            CompiledConfig(self.path)
+        data = bytearray(compile_blocks(self.BLOCKS))
+        data[4] = 99
+        with open(self.path, "wb") as f:
+            f.write(data)
+        with self.assertRaises(ArtifactError):
+            CompiledConfig(self.path)
+
+    def test_cli(self):
+        text = 'set p = 80\nbegin\n  host := @"a";\n  port := ?{p};\nend\n'
+        stdout = StringIO()
+        with patch("sys.stdin", StringIO(text)), patch("sys.stdout", stdout):
+            self.assertEqual(main.main(["--artifact", self.path]), 0)
+        self.assertEqual(stdout.getvalue(), 'begin\n  host := @"a";\n  port := 80;\nend\n')
+        with CompiledConfig(self.path) as config:
+            self.assertEqual(list(config), [{"host": "a", "port": 80}])
+
+        source = os.path.join(self.tmp.name, "configs")
+        os.mkdir(source)
+        with open(os.path.join(source, "a.txt"), "w") as f:
+            f.write(text)
+        output = os.path.join(self.tmp.name, "out")
+        self.assertEqual(translate_directory(source, output, jobs=1, artifacts=True), [])
+        with CompiledConfig(os.path.join(output, "a.cfgb")) as config:
+            self.assertEqual(config.get(0, "port"), 80)
+
+
+class TestCorpus(unittest.TestCase):
+    """Генератор из bench.py: корректный корпус разбирается, ошибочный падает на первой записанной ошибке."""
+
+    def test_generated_configs(self):
+        from bench import PROFILES, generate
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "config.txt")
+            for profile in PROFILES:
+                meta = generate(path, 3000, profile, seed=1)
+                with open(path) as f:
+                    data = f.read()
+                self.assertEqual(len(ConfigTranslator().parse(data.splitlines())), meta["blocks"])
+                generate(path, 3000, profile, seed=1)
+                with open(path) as f:
+                    self.assertEqual(f.read(), data)
+            kinds = set()
+            for seed in range(20):
+                meta = generate(path, 3000, "mixed", seed=seed, errors=3)
+                with open(path) as f, self.assertRaises((SyntaxError, ValueError)) as context:
+                    ConfigTranslator().parse(f)
+                line, kind = meta["errors"][0]
+                self.assertEqual(context.exception.line_number, line)
+                kinds.add(kind)
+            self.assertEqual(len(kinds), 5)
+
+
 if __name__ == "__main__":
     unittest.main()
 
@@ -0,0 +1,135 @@
+"""Бенчмарк загрузки и выполнения программ УВМ.
+
+Тестовая программа задания, повторённая до заданного числа команд, пишется
+в упакованном и в старом текстовом формате, затем замеряется загрузка каждого
+и выполнение: быстрый цикл без трассы и обработчики с трассой в файл.
+Цели из TARGETS раньше проверялись в модульных тестах; теперь бенчмарк
+печатает, достигнута ли каждая, и сохраняет результат в JSON вместе с хешем коммита.
+
+    python3 bench.py --output bench.json
+    python3 bench.py --quick --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from main import Assembler, Interpreter, encode_instructions
+
+# Этап -> целевая скорость, команд/с. 10 млн команд должны загружаться меньше чем за секунду;
+# прежний интерпретатор с print на каждую команду выполнял около 70 тыс. команд/с
+TARGETS = {"load": 10000000, "execute": 1000000}
+
+
+def sample_program(count):
+    """Коды и операнды программы задания (max над вектором длины 6 и числом 178), повторённой до count команд."""
+    block = []
+    for i in range(6):
+        block += [(63, 100 + i), (97, i)]
+    for i in range(6):
+        block += [(32, i), (63, 178), (144, 6 + i)]
+    program = (block * (count // len(block) + 1))[:count]
+    return [a for a, _ in program], [b for _, b in program]
+
+
+def run_stages(workdir, count):
+    """Этапы в порядке выполнения: имя -> функция, возвращающая число обработанных команд
+    или пару (число команд, время), если замеряется только часть работы этапа."""
+    opcodes, operands = sample_program(count)
+    packed = os.path.join(workdir, f"program-{os.getpid()}.bin")
+    legacy = os.path.join(workdir, f"program-{os.getpid()}.txt")
+    with open(packed, "wb") as f:
+        f.write(encode_instructions(opcodes, operands))
+    assembler = Assembler(None, legacy, None, legacy=True)
+    assembler.instructions = list(zip(opcodes, operands))
+    assembler.write_binary()
+
+    def load():
+        interpreter = Interpreter(packed, None, 1024)
+        interpreter.load_instructions()
+        return len(interpreter.opcodes)
+
+    def load_legacy():
+        interpreter = Interpreter(legacy, None, 1024, legacy=True)
+        interpreter.load_instructions()
+        return len(interpreter.opcodes)
+
+    def execute():
+        interpreter = Interpreter(packed, None, 1024)
+        interpreter.load_instructions()
+        start = time.perf_counter()
+        count = interpreter.execute()
+        # Загрузка не входит в замер выполнения
+        return count, time.perf_counter() - start
+
+    def execute_traced():
+        interpreter = Interpreter(packed, None, 1024)
+        interpreter.load_instructions()
+        with open(trace, "w", buffering=1 << 20, encoding="utf-8") as f:
+            start = time.perf_counter()
+            count = interpreter.execute(trace=f.write)
+            return count, time.perf_counter() - start
+
+    trace = os.path.join(workdir, f"trace-{os.getpid()}.txt")
+    stages = {"load": load, "load_legacy": load_legacy, "execute": execute, "execute_traced": execute_traced}
+    return stages, [packed, legacy, trace]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default="bench.json", help="куда записать результаты в JSON")
+    parser.add_argument("--workdir", default=tempfile.gettempdir(), help="каталог для временных файлов программы")
+    parser.add_argument("--count", type=int, default=1000000, help="команд в программе")
+    parser.add_argument("--quick", action="store_true", help="маленькая программа для быстрой проверки")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.count = 100000
+
+    stages, paths = run_stages(args.workdir, args.count)
+    results = {}
+    try:
+        for name, stage in stages.items():
+            start = time.perf_counter()
+            count = stage()
+            elapsed = time.perf_counter() - start
+            if isinstance(count, tuple):
+                count, elapsed = count
+            if count != args.count:
+                raise RuntimeError(f"{name}: {count} instructions, expected {args.count}")
+            speed = count / max(elapsed, 1e-9)
+            results[name] = {"seconds": elapsed, "instructions_per_s": speed}
+            line = f"  {name:14} {elapsed * 1000:9.1f} ms {speed / 1e6:9.2f} M instr/s"
+            if name in TARGETS:
+                met = speed >= TARGETS[name]
+                results[name].update(target=TARGETS[name], met=met)
+                line += f"  target {TARGETS[name] / 1e6:g} M: {'ok' if met else 'BELOW TARGET'}"
+            print(line, file=sys.stderr)
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    report = {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {"count": args.count},
+        "stages": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
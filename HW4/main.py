@@ -1,12 +1,60 @@
+import argparse
 import json
-import sys
+import mmap
 import os
+import sys
+import time
+from array import array
+
+try:
+    import numpy
+except ImportError:  # без NumPy декодирование идёт срезами байтов
+    numpy = None
+
+INSTRUCTION_SIZE = 5  # байт на команду: A (1 байт) и B (4 байта, little-endian)
+
+
+def encode_instructions(opcodes, operands):
+    """Упаковывает команды в байты целиком, без цикла по командам."""
+    operand_bytes = array('I', operands)  # 'I' — 4 байта на поддерживаемых платформах
+    if sys.byteorder == 'big':
+        operand_bytes.byteswap()
+    operand_bytes = operand_bytes.tobytes()
+    data = bytearray(INSTRUCTION_SIZE * len(opcodes))
+    data[0::INSTRUCTION_SIZE] = bytes(opcodes)
+    for i in range(4):
+        data[i + 1::INSTRUCTION_SIZE] = operand_bytes[i::4]
+    return data
+
+
+def decode_instructions(buffer):
+    """Байты программы -> (коды команд, операнды) в виде типизированных массивов.
+
+    С NumPy это шаговые представления буфера с шагом 5 байт, которые затем
+    копируются; без NumPy байты операндов собираются срезами в array('I').
+    """
+    if len(buffer) % INSTRUCTION_SIZE:
+        raise ValueError(f"Размер программы {len(buffer)} байт не кратен {INSTRUCTION_SIZE}")
+    count = len(buffer) // INSTRUCTION_SIZE
+    if numpy is not None:
+        opcodes = numpy.ndarray((count,), numpy.uint8, buffer, 0, (INSTRUCTION_SIZE,)).copy()
+        operands = numpy.ndarray((count,), numpy.dtype('<u4'), buffer, 1, (INSTRUCTION_SIZE,)).astype(numpy.uint32)
+        return opcodes, operands
+    operand_bytes = bytearray(4 * count)
+    for i in range(4):
+        operand_bytes[i::4] = buffer[i + 1::INSTRUCTION_SIZE]
+    operands = array('I', operand_bytes)
+    if sys.byteorder == 'big':
+        operands.byteswap()
+    return array('B', buffer[0::INSTRUCTION_SIZE]), operands
+
 
 class Assembler:
-    def __init__(self, input_file, output_file, log_file):
+    def __init__(self, input_file, output_file, log_file, legacy=False):
         self.input_file = input_file
         self.output_file = output_file
         self.log_file = log_file
+        self.legacy = legacy  # писать старый текстовый формат вместо упакованного
         self.instructions = []
 
     def assemble(self):
@@ -34,40 +82,43 @@ class Assembler:
         else:
             raise ValueError(f'Неизвестная команда: {command}')
 
-    # Запись в "бинарный" файл
+    # Проверка операнда: B у LOAD_CONST — 13 бит, у остальных команд — 26 бит
+    def check_operand(self, a, b):
+        if not (0 <= b <= (8191 if a == 63 else 67108863)):
+            raise ValueError(f'Число {b} выходит за пределы')
+
+    # Запись в бинарный файл: 5 байт на команду, A в первом байте, B — в следующих четырёх (little-endian)
     def write_binary(self):
+        if self.legacy:
+            self.write_legacy_binary()
+            return
+        for a, b in self.instructions:
+            self.check_operand(a, b)
+        with open(self.output_file, 'wb') as f:
+            f.write(encode_instructions([a for a, _ in self.instructions], [b for _, b in self.instructions]))
+
+    # Старый текстовый формат: строка "0x3F, 0x6E, 0x01, 0x00, 0x00" на команду.
+    # Старый ассемблер резал шестнадцатеричную запись B по цифрам, а не по байтам:
+    #   до 4 цифр    0x1234   -> "0x34, 0x12, 0x00, 0x00"   (little-endian)
+    #   5 цифр       0x12345  -> "0x45, 0x12, 0x03, 0x00"   (первые две цифры, затем средняя)
+    #   6 цифр       0x123456 -> "0x56, 0x12, 0x34,0x00"    (без пробела перед последним байтом)
+    # Эти строки пишутся так же, как раньше. Пятизначное B со средней цифрой 0 записывается
+    # в шестизначной форме, иначе его не отличить от четырёхзначного. Семизначные B старый
+    # ассемблер терял; здесь они пишутся как little-endian, пятый байт у них не нулевой.
+    def write_legacy_binary(self):
         with open(self.output_file, 'w') as f:
             for a, b in self.instructions:
-                if (((a == 63) and (b<=8191)) or ((a!=63) and (b<=67108863))):                 
-                    hex_a = "0x" + hex(a)[2:].upper()
-                    hex_b = hex(b)
-                    if  (len(hex_b[2:]))==1:
-                        output = f"{hex_a}, 0x0{hex_b[2].upper()}, 0x00, 0x00, 0x00"   
-                        f.write(output + '\n')      
-                    elif (len(hex_b[2:]))==2:
-                        output = f"{hex_a}, 0x{hex_b[2:].upper()}, 0x00, 0x00, 0x00"
-                        f.write(output + '\n')
-                    elif (len(hex_b[2:]))==3:
-                        hex_c = hex_b[2]
-                        output = f"{hex_a}, {hex_b[0:2]}{hex_b[3:].upper()}, 0x0{hex_c.upper()}, 0x00, 0x00"
-                        f.write(output + '\n')
-                    elif (len(hex_b[2:]))==4:
-                        hex_c = hex_b[2] + hex_b[3]
-                        output = f"{hex_a}, {hex_b[0:2]}{hex_b[4:].upper()}, 0x{hex_c.upper()}, 0x00, 0x00"
-                        f.write(output + '\n')
-                    elif (len(hex_b[2:]))==5:
-                        hex_c = hex_b[2] + hex_b[3]
-                        hex_h = hex_b[4]
-                        output = f"{hex_a}, {hex_b[0:2]}{hex_b[5:].upper()}, 0x{hex_c.upper()}, 0x0{hex_h.upper()}, 0x00"
-                        f.write(output + '\n')
-                    elif (len(hex_b[2:]))==6:
-                        hex_c = hex_b[2] + hex_b[3]
-                        hex_h = hex_b[4] + hex_b[5]
-                        output = f"{hex_a}, {hex_b[0:2]}{hex_b[6:].upper()}, 0x{hex_c.upper()}, 0x{hex_h.upper()},0x00"
-                        f.write(output + '\n')
+                self.check_operand(a, b)
+                if b <= 0xFFFF:
+                    line = f"0x{a:02X}, 0x{b & 0xFF:02X}, 0x{b >> 8:02X}, 0x00, 0x00"
+                elif b <= 0xFFFFF and b >> 8 & 0xF:
+                    line = f"0x{a:02X}, 0x{b & 0xFF:02X}, 0x{b >> 12:02X}, 0x0{b >> 8 & 0xF:X}, 0x00"
+                elif b <= 0xFFFFFF:
+                    line = f"0x{a:02X}, 0x{b & 0xFF:02X}, 0x{b >> 16:02X}, 0x{b >> 8 & 0xFF:02X},0x00"
                 else:
-                    raise ValueError(f'Число {b} выходит за пределы')
-    
+                    line = ", ".join(f"0x{byte:02X}" for byte in (a | b << 8).to_bytes(INSTRUCTION_SIZE, "little"))
+                f.write(line + '\n')
+
     def write_log(self):
         log_data = {"instructions": []}
         for i, (a, b) in enumerate(self.instructions):
@@ -82,88 +133,175 @@ class Assembler:
 
 class Interpreter:
 
-    def __init__(self, binary_file, result_file, memory_range):
+    def __init__(self, binary_file, result_file, memory_range, legacy=False):
         self.binary_file = binary_file
         self.result_file = result_file
         self.memory_range = memory_range
+        self.legacy = legacy  # читать старый текстовый формат
         self.memory = ['0'] * 1024  # Инициализация памяти
         self.stack = []  # Стек для операций
-        self.instructions = []  # Загруженные инструкции
+        self.opcodes = array('B')  # Коды команд (поле A)
+        self.operands = array('I')  # Операнды (поле B)
+
+    # Загруженные инструкции в виде списка пар (A, B)
+    @property
+    def instructions(self):
+        return list(zip(self.opcodes.tolist(), self.operands.tolist()))
 
     def load_instructions(self):
+        if self.legacy:
+            self.load_legacy_instructions()
+            return
+        with open(self.binary_file, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                self.opcodes, self.operands = array('B'), array('I')
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                self.opcodes, self.operands = decode_instructions(buffer)
+
+    # Старый текстовый формат: пять байтов через запятую на строку,
+    # порядок байтов B зависит от числа его цифр (см. Assembler.write_legacy_binary)
+    def load_legacy_instructions(self):
+        opcodes, operands = array('B'), array('I')
         with open(self.binary_file, 'r') as f:
             for line in f:
-                parts = line.split(", ")
-                if (parts[2] == "0x00"):
-                    a = int(parts[0], 16)
-                    b = int(parts[1], 16)
-                    self.instructions.append((a, b))
-                elif (parts[3] == "0x00"):
-                    c = parts[2] + parts[1][2:]
-                    a = int(parts[0], 16)
-                    b = int(c, 16)
-                    self.instructions.append((a, b))
-                elif (parts[3] != "0x00"):
-                    c = parts[2] + parts[3][2:] + parts[1][2:]
-                    a = int(parts[0], 16)
-                    b = int(c, 16)
-                    self.instructions.append((a, b))
-
-    def execute(self):
-        # Выполнение каждой инструкции
-        for a, b in self.instructions:
-            print(f"Выполняем инструкцию: {a}, {b}")  # Отладочная информация
-            self.execute_instruction(a, b)
-
-    def execute_instruction(self, a, b):
-        if a == 63:  # LOAD_CONST
-            self.load_const(b)
-        elif a == 32:  # READ_MEMORY
-            self.read_memory(b)
-        elif a == 97:  # WRITE_MEMORY
-            self.write_memory(b)
-        elif a == 144:  # MAX
-            self.max_instruction(b)
-        else:
-            raise ValueError(f"Неизвестная команда: {a}")
+                if not line.strip():
+                    continue
+                parts = line.split(",")
+                a, low, middle, high, top = (int(part, 16) for part in parts)
+                if top:
+                    b = low | middle << 8 | high << 16 | top << 24
+                elif not parts[4].startswith(" "):
+                    b = middle << 16 | high << 8 | low
+                elif high:
+                    b = middle << 12 | high << 8 | low
+                else:
+                    b = middle << 8 | low
+                opcodes.append(a)
+                operands.append(b)
+        self.opcodes, self.operands = opcodes, operands
 
-    def load_const(self, value):
-        print(f"LOAD_CONST: Добавление {value} в стек.")  # Отладочная информация
-        self.stack.append(value)
+    # Обработчики команд: код команды -> функция от поля B.
+    # Память, стек и их методы связаны с замыканиями заранее, чтобы в цикле
+    # не было поиска атрибутов. Если передан trace, обработчики пишут в него
+    # отладочные сообщения, иначе работают молча.
+    def make_handlers(self, trace=None):
+        memory = self.memory
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        size = len(memory)
 
-    def read_memory(self, address):
-        if 0 <= address < len(self.memory):
-            value = self.memory[address]
-            print(f"READ_MEMORY: Чтение значения {value} из памяти по адресу {address}.")  # Отладочная информация
-            self.stack.append(value)
-            self.memory[address] = "0"
-        else:
-            raise ValueError(f"Неверный адрес памяти: {address}")
-
-    def write_memory(self, address):
-        if self.stack:
-            value = self.stack.pop()  # Извлекаем значение из стека
-            print(f"WRITE_MEMORY: Попытка записи значения {value} в память по адресу {address}.")  # Отладочная информация
-            if 0 <= address < len(self.memory):
-                self.memory[address] = value
-                print(f"WRITE_MEMORY: Запись значения {value} в память по адресу {address}.")  # Отладочная информация
+        def read_memory(address):
+            if address < size:
+                value = memory[address]
+                if trace:
+                    trace(f"READ_MEMORY: Чтение значения {value} из памяти по адресу {address}.\n")
+                push(value)
+                memory[address] = "0"
             else:
                 raise ValueError(f"Неверный адрес памяти: {address}")
+
+        def write_memory(address):
+            if stack:
+                value = pop()  # Извлекаем значение из стека
+                if trace:
+                    trace(f"WRITE_MEMORY: Попытка записи значения {value} в память по адресу {address}.\n")
+                if address < size:
+                    memory[address] = value
+                    if trace:
+                        trace(f"WRITE_MEMORY: Запись значения {value} в память по адресу {address}.\n")
+                else:
+                    raise ValueError(f"Неверный адрес памяти: {address}")
+            elif trace:
+                trace("Стек пуст, невозможно выполнить WRITE_MEMORY.\n")
+
+        def max_instruction(address):
+            if len(stack) >= 2:
+                op1 = pop()
+                op2 = pop()
+                result = max(op1, op2)
+                if address < size:
+                    memory[address] = result
+                    if trace:
+                        trace(f"MAX: Запись максимума ({result}) в память по адресу {address}.\n")
+                else:
+                    raise ValueError(f"Неверный адрес памяти: {address}")
+            elif trace:
+                trace("Недостаточно элементов в стеке для выполнения MAX.\n")
+
+        if trace:
+            def load_const(value):
+                trace(f"LOAD_CONST: Добавление {value} в стек.\n")
+                push(value)
         else:
-            print("Стек пуст, невозможно выполнить WRITE_MEMORY.")  # Отладочная информация
-
-    def max_instruction(self, address):
-        if len(self.stack) >= 2:
-            op1 = self.stack.pop()
-            op2 = self.stack.pop()
-            result = max(op1, op2)
-            if 0 <= address < len(self.memory):
-                self.memory[address] = result
-                print(f"MAX: Запись максимума ({result}) в память по адресу {address}.")  # Отладочная информация
+            load_const = push  # без трассировки LOAD_CONST — это просто append
+
+        return {63: load_const, 32: read_memory, 97: write_memory, 144: max_instruction}
+
+    def execute(self, trace=None):
+        """Выполняет программу; trace — функция записи строк трассировки или None.
+
+        Без трассировки команды разбираются цепочкой сравнений прямо в цикле:
+        в CPython это почти вдвое быстрее вызова обработчика из таблицы.
+        Возвращает число выполненных команд.
+        """
+        if trace:
+            return self.execute_traced(trace)
+        memory = self.memory
+        stack = self.stack
+        push = stack.append
+        pop = stack.pop
+        size = len(memory)
+        # Ветки упорядочены по частоте команд в типичной программе
+        for a, b in zip(self.opcodes.tolist(), self.operands.tolist()):
+            if a == 63:  # LOAD_CONST
+                push(b)
+            elif a == 97:  # WRITE_MEMORY
+                if stack:
+                    value = pop()
+                    if b < size:
+                        memory[b] = value
+                    else:
+                        raise ValueError(f"Неверный адрес памяти: {b}")
+            elif a == 32:  # READ_MEMORY
+                if b < size:
+                    push(memory[b])
+                    memory[b] = "0"
+                else:
+                    raise ValueError(f"Неверный адрес памяти: {b}")
+            elif a == 144:  # MAX
+                if len(stack) >= 2:
+                    op1 = pop()
+                    op2 = pop()
+                    result = max(op1, op2)
+                    if b < size:
+                        memory[b] = result
+                    else:
+                        raise ValueError(f"Неверный адрес памяти: {b}")
             else:
-                raise ValueError(f"Неверный адрес памяти: {address}")
-        else:
-            print("Недостаточно элементов в стеке для выполнения MAX.")  # Отладочная информация
+                raise ValueError(f"Неизвестная команда: {a}")
+        return len(self.opcodes)
+
+    # Выполнение с трассировкой через таблицу обработчиков
+    def execute_traced(self, trace):
+        handlers = self.make_handlers(trace)
+        for a, b in zip(self.opcodes.tolist(), self.operands.tolist()):
+            trace(f"Выполняем инструкцию: {a}, {b}\n")  # Отладочная информация
+            handler = handlers.get(a)
+            if handler is None:
+                raise ValueError(f"Неизвестная команда: {a}")
+            handler(b)
+        return len(self.opcodes)
+
+    def execute_instruction(self, a, b, trace=None):
+        handler = self.make_handlers(trace).get(a)
+        if handler is None:
+            raise ValueError(f"Неизвестная команда: {a}")
+        # Операнды из файла беззнаковые, а сюда можно передать любое число
+        if b < 0 and a != 63:
+            raise ValueError(f"Неверный адрес памяти: {b}")
+        handler(b)
 
     def export_result_to_json(self, output_file, start_address, length):
         """Сохранение результата из памяти в JSON."""
@@ -189,23 +327,58 @@ class Interpreter:
 
 
 
-def main():
-    # Пример исходного файла программы
-    input_file = 'input.txt'
-    output_file = 'binary.bin'
-    log_file = 'log.json'
-    
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Ассемблер и интерпретатор УВМ.")
+    parser.add_argument("input", nargs="?", default="input.txt", help="исходный текст программы")
+    parser.add_argument("binary", nargs="?", default="binary.bin", help="бинарный файл программы")
+    parser.add_argument("log", nargs="?", default="log.json", help="лог ассемблера")
+    parser.add_argument("result", nargs="?", default="result.json", help="файл-результат интерпретатора")
+    parser.add_argument("--start", type=int, default=0, help="начало сохраняемого диапазона памяти")
+    parser.add_argument("--length", type=int, default=1024, help="длина сохраняемого диапазона памяти")
+    parser.add_argument("--trace", metavar="FILE",
+                        help="писать трассировку выполнения в FILE, \"-\" — в stdout")
+    parser.add_argument("--legacy-format", action="store_true",
+                        help="писать и читать старый текстовый формат \"0x3F, 0x6E, ...\"")
+    args = parser.parse_args(argv)
+    if args.trace and args.trace != "-":
+        # Трасса не должна затирать исходник или файлы, которые пишет сама программа
+        trace_path = os.path.normcase(os.path.realpath(args.trace))
+        for name in ("input", "binary", "log", "result"):
+            if trace_path == os.path.normcase(os.path.realpath(getattr(args, name))):
+                parser.error(f"файл трассировки совпадает с файлом {name}: {args.trace}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
     # Шаг 1: Ассемблируем программу
-    assembler = Assembler(input_file, output_file, log_file)
+    assembler = Assembler(args.input, args.binary, args.log, legacy=args.legacy_format)
     assembler.assemble()
-    
+
     # Шаг 2: Загружаем и выполняем программу
-    interpreter = Interpreter(output_file, 'result.json', 1024)
+    interpreter = Interpreter(args.binary, args.result, 1024, legacy=args.legacy_format)
     interpreter.load_instructions()
-    interpreter.execute()
-    
+    if args.trace:
+        # Трассировка пишется через буфер в 1 МБ, а не построчным print
+        sys.stdout.flush()
+        if args.trace == "-":
+            trace_file = open(sys.stdout.fileno(), "w", buffering=1 << 20, encoding="utf-8", closefd=False)
+        else:
+            trace_file = open(args.trace, "w", buffering=1 << 20, encoding="utf-8")
+        with trace_file:
+            started = time.perf_counter()
+            count = interpreter.execute(trace=trace_file.write)
+            elapsed = time.perf_counter() - started
+    else:
+        started = time.perf_counter()
+        count = interpreter.execute()
+        elapsed = time.perf_counter() - started
+    print(f"Выполнено команд: {count} за {elapsed:.3f} с ({count / elapsed if elapsed else 0:.0f} команд/с)")
+
     # Шаг 3: Экспортируем результат
-    interpreter.export_result_to_json('result.json', 0, 1024)
+    interpreter.export_result_to_json(args.result, args.start, args.length)
 
-main()
 
+if __name__ == "__main__":
+    main()
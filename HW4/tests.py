@@ -1,7 +1,12 @@
+import os
+import random
+import tempfile
 import unittest
-from io import StringIO
+from io import BytesIO, StringIO
 from unittest.mock import patch
-from nomer4 import Assembler
+from array import array
+import main
+from main import Assembler, Interpreter, INSTRUCTION_SIZE, encode_instructions, parse_args
 
 
 class TestAssemblerCommands(unittest.TestCase):
@@ -11,7 +16,7 @@ class TestAssemblerCommands(unittest.TestCase):
     @patch("builtins.open")
     def test_all_commands(self, mock_open):
         # Мокируем вывод в файл
-        mock_output = StringIO()
+        mock_output = BytesIO()
         mock_open.return_value.__enter__.return_value = mock_output
 
         # Тестовые команды
@@ -38,16 +43,223 @@ class TestAssemblerCommands(unittest.TestCase):
         # Генерация бинарного файла
         self.assembler.write_binary()
 
-        # Проверка бинарного вывода
-        binary_output = mock_output.getvalue().strip()
-        expected_binary = (
-            "0x3F, 0x6E, 0x01, 0x00, 0x00\n"  # LOAD_CONST
-            "0x20, 0x0C, 0x02, 0x00, 0x00\n"  # READ_MEMORY
-            "0x61, 0x4F, 0x00, 0x00, 0x00\n"  # WRITE_MEMORY
-            "0x90, 0x7F, 0x03, 0x00, 0x00"  # MAX
-        )
+        # Проверка бинарного вывода: по 5 байт на команду, как в тестах из задания
+        binary_output = mock_output.getvalue()
+        expected_binary = bytes([
+            0x3F, 0x6E, 0x01, 0x00, 0x00,  # LOAD_CONST
+            0x20, 0x0C, 0x02, 0x00, 0x00,  # READ_MEMORY
+            0x61, 0x4F, 0x00, 0x00, 0x00,  # WRITE_MEMORY
+            0x90, 0x7F, 0x03, 0x00, 0x00,  # MAX
+        ])
         self.assertEqual(binary_output, expected_binary)
 
+    @patch("builtins.open")
+    def test_legacy_format(self, mock_open):
+        mock_output = StringIO()
+        mock_open.return_value.__enter__.return_value = mock_output
+        self.assembler.legacy = True
+        for command in ["LOAD_CONST 63 366", "MAX 144 895", "READ_MEMORY 32 74565", "WRITE_MEMORY 97 1193046",
+                        "READ_MEMORY 32 1048575", "READ_MEMORY 32 65541", "READ_MEMORY 32 67108863"]:
+            self.assembler.process_line(command)
+        self.assembler.write_binary()
+        self.assertEqual(mock_output.getvalue(), (
+            # Первые пять строк — вывод прежнего ассемблера для тех же команд, байт в байт
+            "0x3F, 0x6E, 0x01, 0x00, 0x00\n"
+            "0x90, 0x7F, 0x03, 0x00, 0x00\n"
+            "0x20, 0x45, 0x12, 0x03, 0x00\n"
+            "0x61, 0x56, 0x12, 0x34,0x00\n"
+            "0x20, 0xFF, 0xFF, 0x0F, 0x00\n"
+            # 0x10005: прежний ассемблер записал бы его как 0x1005, здесь шестизначная форма
+            "0x20, 0x05, 0x01, 0x00,0x00\n"
+            # Семизначные операнды прежний ассемблер не записывал вовсе
+            "0x20, 0xFF, 0xFF, 0xFF, 0x03\n"
+        ))
+
+    def test_operand_limits(self):
+        self.assembler.process_line("LOAD_CONST 63 8192")
+        with self.assertRaises(ValueError):
+            self.assembler.write_binary()
+
+
+class TestBinaryFormat(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.binary = os.path.join(self.tmp.name, "binary.bin")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assemble(self, lines, legacy=False):
+        source = os.path.join(self.tmp.name, "input.txt")
+        with open(source, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        assembler = Assembler(source, self.binary, os.path.join(self.tmp.name, "log.json"), legacy=legacy)
+        assembler.assemble()
+        return assembler.instructions
+
+    def load(self, legacy=False):
+        interpreter = Interpreter(self.binary, os.path.join(self.tmp.name, "result.json"), 1024, legacy=legacy)
+        interpreter.load_instructions()
+        return interpreter
+
+    def test_round_trip(self):
+        lines = ["LOAD_CONST 63 0", "LOAD_CONST 63 8191", "READ_MEMORY 32 67108863", "WRITE_MEMORY 97 65536",
+                 "MAX 144 16777216", "READ_MEMORY 32 74565", "READ_MEMORY 32 65541", "READ_MEMORY 32 1048576",
+                 "WRITE_MEMORY 97 1193046", "MAX 144 16777215"]
+        for legacy in (False, True):
+            with self.subTest(legacy=legacy):
+                expected = self.assemble(lines, legacy)
+                self.assertEqual(self.load(legacy).instructions, expected)
+        self.assemble(lines)
+        self.assertEqual(os.path.getsize(self.binary), INSTRUCTION_SIZE * len(lines))
+
+    def test_legacy_file_from_repository(self):
+        # binary.bin в репозитории записан старым ассемблером по input.txt
+        directory = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(directory, "input.txt")) as f:
+            expected = self.assemble(f.read().splitlines())
+        interpreter = Interpreter(os.path.join(directory, "binary.bin"), None, 1024, legacy=True)
+        interpreter.load_instructions()
+        self.assertEqual(interpreter.instructions, expected)
+
+    def test_legacy_reader_digit_order(self):
+        # Вывод прежнего ассемблера для READ_MEMORY 32 74565 и WRITE_MEMORY 97 1193046:
+        # пятизначные операнды он резал по цифрам, шестизначные писал без пробела перед последним байтом
+        with open(self.binary, "w") as f:
+            f.write("0x20, 0x45, 0x12, 0x03, 0x00\n0x61, 0x56, 0x12, 0x34,0x00\n")
+        self.assertEqual(self.load(legacy=True).instructions, [(32, 74565), (97, 1193046)])
+
+    @unittest.skipUnless(main.numpy is not None, "NumPy не установлен")
+    def test_numpy_decoding(self):
+        rng = random.Random(2)
+        opcodes = [rng.choice((63, 32, 97, 144)) for _ in range(10000)]
+        operands = [rng.randrange(1 << 26) for _ in opcodes] + [0xFFFFFFFF]
+        opcodes.append(255)
+        with open(self.binary, "wb") as f:
+            f.write(encode_instructions(opcodes, operands))
+        interpreter = self.load()
+        self.assertIsInstance(interpreter.operands, main.numpy.ndarray)
+        self.assertEqual(interpreter.opcodes.tolist(), opcodes)
+        self.assertEqual(interpreter.operands.tolist(), operands)
+        # Шаговые представления NumPy и срезы без NumPy дают одно и то же
+        with patch.object(main, "numpy", None):
+            fallback = self.load()
+        self.assertEqual(fallback.instructions, interpreter.instructions)
+
+    def test_empty_and_truncated(self):
+        open(self.binary, "wb").close()
+        self.assertEqual(self.load().instructions, [])
+        with open(self.binary, "wb") as f:
+            f.write(bytes([0x3F, 0x6E, 0x01, 0x00, 0x00, 0x3F]))
+        with self.assertRaises(ValueError):
+            self.load()
+
+    def test_bulk_load(self):
+        # Скорость загрузки замеряет bench.py, здесь — только правильность на большой программе
+        count = 1000000
+        opcodes = [(63, 32, 97, 144)[i % 4] for i in range(count)]
+        operands = [i % 8192 for i in range(count)]
+        with open(self.binary, "wb") as f:
+            f.write(encode_instructions(opcodes, operands))
+        interpreter = self.load()
+        self.assertEqual(interpreter.opcodes.tolist(), opcodes)
+        self.assertEqual(interpreter.operands.tolist(), operands)
+
+
+class TestInterpreter(unittest.TestCase):
+    def interpreter(self, program):
+        interpreter = Interpreter(None, None, 1024)
+        interpreter.opcodes = array('B', [a for a, _ in program])
+        interpreter.operands = array('I', [b for _, b in program])
+        return interpreter
+
+    def test_fast_and_traced_agree(self):
+        rng = random.Random(1)
+        for _ in range(50):
+            program = [(rng.choice((63, 63, 32, 97, 144)), rng.randrange(16)) for _ in range(200)]
+            outcomes = []
+            for trace in (None, StringIO().write):
+                interpreter = self.interpreter(program)
+                try:
+                    result = interpreter.execute(trace=trace)
+                except (TypeError, ValueError) as e:
+                    # Память заполнена строками "0", поэтому MAX над ними и числами падает, как и раньше
+                    result = type(e), str(e)
+                outcomes.append((result, interpreter.memory, interpreter.stack))
+            self.assertEqual(outcomes[0], outcomes[1])
+
+    def test_trace_messages(self):
+        interpreter = self.interpreter([(63, 5), (97, 1), (97, 2), (32, 1), (63, 7), (144, 3), (144, 4)])
+        output = StringIO()
+        interpreter.execute(trace=output.write)
+        self.assertEqual(output.getvalue().splitlines(), [
+            "Выполняем инструкцию: 63, 5",
+            "LOAD_CONST: Добавление 5 в стек.",
+            "Выполняем инструкцию: 97, 1",
+            "WRITE_MEMORY: Попытка записи значения 5 в память по адресу 1.",
+            "WRITE_MEMORY: Запись значения 5 в память по адресу 1.",
+            "Выполняем инструкцию: 97, 2",
+            "Стек пуст, невозможно выполнить WRITE_MEMORY.",
+            "Выполняем инструкцию: 32, 1",
+            "READ_MEMORY: Чтение значения 5 из памяти по адресу 1.",
+            "Выполняем инструкцию: 63, 7",
+            "LOAD_CONST: Добавление 7 в стек.",
+            "Выполняем инструкцию: 144, 3",
+            "MAX: Запись максимума (7) в память по адресу 3.",
+            "Выполняем инструкцию: 144, 4",
+            "Недостаточно элементов в стеке для выполнения MAX.",
+        ])
+        self.assertEqual(interpreter.memory[1:4], ["0", "0", 7])
+
+    def test_silent_without_trace(self):
+        with patch("sys.stdout", new_callable=StringIO) as stdout:
+            self.interpreter([(63, 1), (97, 0), (97, 0), (144, 0)]).execute()
+        self.assertEqual(stdout.getvalue(), "")
+
+    def test_errors(self):
+        for program, message in (([(63, 1), (97, 1024)], "Неверный адрес памяти: 1024"),
+                                 ([(32, 5000)], "Неверный адрес памяти: 5000"),
+                                 ([(63, 1), (7, 0)], "Неизвестная команда: 7")):
+            for trace in (None, StringIO().write):
+                interpreter = self.interpreter(program)
+                with self.assertRaises(ValueError) as context:
+                    interpreter.execute(trace=trace)
+                self.assertEqual(str(context.exception), message)
+        # Команды до неизвестной успевают выполниться, как и раньше
+        self.assertEqual(interpreter.stack, [1])
+
+    def test_long_program(self):
+        # Тестовая программа задания, повторённая много раз; скорость замеряет bench.py
+        program = []
+        for i in range(6):
+            program += [(63, 100 + i), (97, i)]
+        for i in range(6):
+            program += [(32, i), (63, 178), (144, 6 + i)]
+        interpreter = self.interpreter(program * 20000)
+        self.assertEqual(interpreter.execute(), len(program) * 20000)
+        self.assertEqual(interpreter.memory[6:12], [178] * 6)
+
+
+class TestCommandLine(unittest.TestCase):
+    def test_trace_requires_file(self):
+        # Раньше `--trace input.txt` забирал имя исходника и затирал его трассой
+        args = parse_args(["--trace", "-", "program.txt"])
+        self.assertEqual((args.trace, args.input), ("-", "program.txt"))
+        args = parse_args(["--trace", "trace.txt"])
+        self.assertEqual((args.trace, args.input), ("trace.txt", "input.txt"))
+        with patch("sys.stderr", new_callable=StringIO):
+            with self.assertRaises(SystemExit):
+                parse_args(["--trace"])
+
+    def test_trace_must_not_overwrite_program_files(self):
+        with patch("sys.stderr", new_callable=StringIO) as stderr:
+            for argv in (["--trace", "input.txt"], ["--trace", "./binary.bin"],
+                         ["a.txt", "b.bin", "c.json", "d.json", "--trace", "c.json"],
+                         ["--trace", os.path.abspath("result.json")]):
+                with self.assertRaises(SystemExit):
+                    parse_args(argv)
+        self.assertIn("файл трассировки совпадает", stderr.getvalue())
+
 
 if __name__ == '__main__':
     unittest.main()